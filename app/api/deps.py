@@ -3,8 +3,38 @@ Reusable FastAPI dependencies.
 """
 from __future__ import annotations
 
-from app.core.database import get_session
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app.core.config import get_settings
+from app.core.database import ShardSessions, get_session, get_shards
 
 get_async_session = get_session
 
 
+async def require_admin_token(
+    x_calmmind_profile: Optional[str] = Header(default=None),
+    authorization: Optional[str] = Header(default=None),
+) -> None:
+    """
+    Admit requests carrying ``ADMIN_TOKEN`` as a bearer token or profile header.
+
+    Without a configured token the guarded routes do not exist (404).
+    """
+    token = get_settings().admin_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = x_calmmind_profile
+    if authorization and authorization.lower().startswith("bearer "):
+        supplied = authorization[len("bearer "):].strip()
+    if not supplied or not hmac.compare_digest(supplied.encode(), token.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail="Admin token required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+__all__ = ["ShardSessions", "get_async_session", "get_shards", "require_admin_token"]
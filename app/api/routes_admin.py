@@ -3,31 +3,60 @@ Clinician/admin oriented endpoints.
 """
 from __future__ import annotations
 
+import json
+from functools import partial
+from operator import itemgetter
+from datetime import date
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse
 
-from sqlmodel.ext.asyncio.session import AsyncSession
-
-from app.api.deps import get_async_session
-from app.models.schemas import JournalEntryRead, RiskEventRead
+from app.api.deps import ShardSessions, get_shards, require_admin_token
+from app.api.serialization import JSONSerializer
+from app.core.database import scatter_gather
+from app.core.profiling import folded_stacks, get_profile_store
+from app.models.schemas import AnalyticsReport, JournalEntryRead, ProfileSummary, RiskEventRead
 from app.services.alerts import list_risk_events
+from app.services.analytics import export_snapshot, latest_cohort_report
+from app.services.analytics import is_running as export_running
 from app.services.journal import list_high_risk_entries
+from app.services.rescoring import is_running as rescore_running
+from app.services.rescoring import rescore_history
+from app.services.retention import is_running as retention_running
+from app.services.retention import run_retention
+from app.services.risk import scoring_version
 
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+entry_list_json = JSONSerializer(List[JournalEntryRead])
+event_list_json = JSONSerializer(List[RiskEventRead])
+profile_list_json = JSONSerializer(List[ProfileSummary])
+analytics_json = JSONSerializer(AnalyticsReport)
+
 
 # Provide clinicians with the latest high-risk journal entries for manual follow-up.
 @router.get("/alerts", response_model=List[JournalEntryRead])
 async def high_risk_alerts(
-    threshold: float = 0.6, session: AsyncSession = Depends(get_async_session)
-) -> List[JournalEntryRead]:
+    threshold: float = 0.6,
+    tag: Optional[List[str]] = Query(default=None, description="Only entries carrying every tag."),
+    include_content: bool = Query(default=True, description="Load entry bodies."),
+    shards: ShardSessions = Depends(get_shards),
+) -> Response:
     """
-    Return journal entries that exceed the configured risk threshold.
+    Return journal entries that exceed the configured risk threshold, across all shards.
     """
-    entries = await list_high_risk_entries(session, threshold=threshold)
-    return [JournalEntryRead.model_validate(entry.model_dump()) for entry in entries]
+    entries = await scatter_gather(
+        shards.all(),
+        partial(
+            list_high_risk_entries, threshold=threshold, tags=tag, include_content=include_content
+        ),
+        key=itemgetter("created_at"),
+        reverse=True,
+    )
+    return entry_list_json(entries)
 
 
 # List recent risk assessments captured across chat and journaling.
@@ -35,13 +64,97 @@ async def high_risk_alerts(
 async def get_risk_events(
     minimum_level: Optional[str] = None,
     limit: int = 50,
-    session: AsyncSession = Depends(get_async_session),
-) -> List[RiskEventRead]:
-    events = await list_risk_events(
-        session,
-        minimum_level=minimum_level,
+    include_archived: bool = False,
+    include_content: bool = Query(default=True, description="Load message text."),
+    shards: ShardSessions = Depends(get_shards),
+) -> Response:
+    events = await scatter_gather(
+        shards.all(),
+        partial(
+            list_risk_events,
+            minimum_level=minimum_level,
+            limit=limit,
+            include_archived=include_archived,
+            include_content=include_content,
+        ),
+        key=itemgetter("created_at"),
+        reverse=True,
         limit=limit,
     )
-    return [RiskEventRead.model_validate(event.model_dump()) for event in events]
+    return event_list_json(events)
+
+
+# Re-score stored entries and events after the risk configuration changes.
+@router.post("/rescore", status_code=202)
+async def rescore(background_tasks: BackgroundTasks) -> dict[str, str]:
+    """
+    Start a background re-score of historical risk data with the current config.
+    """
+    if rescore_running():
+        return {"status": "running", "scoring_version": scoring_version()}
+    background_tasks.add_task(rescore_history)
+    return {"status": "scheduled", "scoring_version": scoring_version()}
+
+
+# Apply risk event retention now instead of waiting for the next scheduled run.
+# It permanently deletes purged events, so it needs the admin token.
+@router.post(
+    "/retention/run", status_code=202, dependencies=[Depends(require_admin_token)]
+)
+async def run_retention_now(background_tasks: BackgroundTasks) -> dict[str, str]:
+    if retention_running():
+        return {"status": "running"}
+    background_tasks.add_task(run_retention)
+    return {"status": "scheduled"}
 
 
+# Browse captured request profiles, newest first.  Profiles hold stack frames and
+# request paths, so they need the admin token.
+@router.get(
+    "/profiles",
+    response_model=List[ProfileSummary],
+    dependencies=[Depends(require_admin_token)],
+)
+async def list_profiles(limit: int = 50) -> Response:
+    store = get_profile_store()
+    summaries = await run_in_threadpool(store.list)
+    return profile_list_json(summaries[:limit])
+
+
+# Download one profile as JSON, or as collapsed stacks for flame graph tools.
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin_token)])
+async def download_profile(
+    profile_id: str,
+    format: str = Query(default="json", pattern="^(json|folded)$"),
+) -> Response:
+    path = get_profile_store().path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        data = json.loads(await run_in_threadpool(path.read_text, encoding="utf-8"))
+        return PlainTextResponse(folded_stacks(data))
+    return FileResponse(path, media_type="application/json", filename=path.name)
+
+
+# Export a fresh analytics snapshot instead of waiting for the next scheduled run.
+@router.post("/analytics/snapshot", status_code=202)
+async def snapshot_analytics(background_tasks: BackgroundTasks) -> dict[str, str]:
+    if export_running():
+        raise HTTPException(status_code=409, detail="An analytics export is already running")
+    background_tasks.add_task(export_snapshot)
+    return {"status": "scheduled"}
+
+
+# Monthly cohort report computed from the latest columnar snapshot.
+@router.get("/analytics", response_model=AnalyticsReport)
+async def analytics_report(
+    since: Optional[date] = Query(default=None, description="Only rows created on or after."),
+    until: Optional[date] = Query(default=None, description="Only rows created before."),
+) -> Response:
+    """
+    Aggregate risk levels, moods and activity per month without touching the databases.
+    """
+    report = await run_in_threadpool(latest_cohort_report, since=since, until=until)
+    if report is None:
+        raise HTTPException(status_code=404, detail="No analytics snapshot yet")
+    return analytics_json(report)
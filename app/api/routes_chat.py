@@ -3,18 +3,24 @@ Chat endpoints orchestrating Ollama responses with risk assessment.
 """
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends
-from fastapi.responses import StreamingResponse
-from sqlmodel.ext.asyncio.session import AsyncSession
+import logging
+import time
+from typing import Optional
 
-from app.api.deps import get_async_session
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.api.deps import ShardSessions, get_shards
+from app.core.config import get_settings
+from app.core.rate_limit import rate_limited
 from app.models.schemas import ChatRequest, ChatResponse
 from app.services.alerts import log_risk_event
-from app.services.ollama import OllamaClient, stream_ollama_reply
+from app.services.ollama import OllamaClient, OllamaUnavailable, stream_ollama_reply
 from app.services.risk import assess_risk
 from app.services.resources import recommend_resources
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 SYSTEM_PROMPT = (
@@ -23,56 +29,150 @@ SYSTEM_PROMPT = (
     "when needed, and never make promises you cannot keep."
 )
 
+# Served when the model is down or too slow, so nobody is left without a reply.
+FALLBACK_REPLY = (
+    "I'm having trouble putting my thoughts together right now, but I'm still here "
+    "with you. If you are in danger or thinking about harming yourself, please call "
+    "or text 988 (in the US) or your local emergency number right away. A few things "
+    "that may help in the meantime are listed below."
+)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    Streaming response that always closes its generator.
+
+    Starlette stops iterating when the client disconnects but leaves the
+    generator suspended, which would keep the upstream Ollama stream open until
+    garbage collection.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+def _fallback_text(message: str) -> str:
+    resources = "".join(f"\n- {resource}" for resource in recommend_resources(message))
+    return f"{FALLBACK_REPLY}\n{resources}"
+
+
+def _too_many_requests(message: str, retry_after: int) -> JSONResponse:
+    return JSONResponse(
+        {
+            "detail": "Rate limit exceeded. Please slow down.",
+            "resources": recommend_resources(message),
+        },
+        status_code=429,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def _assess_and_log(request: ChatRequest, shards: ShardSessions):
+    risk = assess_risk(request.message)
+    # Persist the assessment for clinician analytics.
+    await log_risk_event(
+        shards.for_user(request.user_id),
+        user_id=request.user_id,
+        source="chat",
+        content=request.message,
+        assessment=risk,
+    )
+    return risk
+
+
 # Generate a calm, supportive reply and return risk metadata for the clinician dashboard.
 @router.post("", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    session: AsyncSession = Depends(get_async_session),
+    http_request: Request,
+    shards: ShardSessions = Depends(get_shards),
 ) -> ChatResponse:
     """
     Generate a supportive response and return risk signals.
-    """
-    client = OllamaClient()
-    try:
-        context = f"{request.context}\nUser: {request.message}" if request.context else request.message
-        reply = await client.generate(context, system_prompt=SYSTEM_PROMPT)
-    finally:
-        await client.close()
 
-    risk = assess_risk(request.message)
+    Risk is assessed and logged before the model is called, so both survive an
+    LLM outage or a rate-limited request; the reply then degrades to a canned
+    message with resources.
+    """
+    risk = await _assess_and_log(request, shards)
+    retry_after = rate_limited(http_request.state)
+    if retry_after is not None:
+        return _too_many_requests(request.message, retry_after)
     alerts = []
     if risk.keyword_hits:
         alerts.append("Crisis keywords detected.")
     if risk.level == "high":
         alerts.append("Escalate to human support ASAP.")
 
-    # Persist the assessment for clinician analytics.
-    await log_risk_event(
-        session,
-        user_id=request.user_id,
-        source="chat",
-        content=request.message,
-        assessment=risk,
-    )
+    deadline = time.monotonic() + get_settings().chat_deadline_seconds
+    client = OllamaClient()
+    try:
+        context = f"{request.context}\nUser: {request.message}" if request.context else request.message
+        generation = await client.generate_with_stats(
+            context, system_prompt=SYSTEM_PROMPT, deadline=deadline
+        )
+    except OllamaUnavailable as exc:
+        logger.warning("Serving fallback chat reply: %s", exc)
+        return ChatResponse(
+            reply=FALLBACK_REPLY,
+            risk_level=risk.level,
+            risk_score=risk.score,
+            sentiment=risk.sentiment,
+            alerts=alerts,
+            degraded=True,
+            resources=recommend_resources(request.message),
+        )
+    finally:
+        await client.close()
 
     return ChatResponse(
-        reply=reply.strip(),
+        reply=generation.text.strip(),
         risk_level=risk.level,
         risk_score=risk.score,
         sentiment=risk.sentiment,
         alerts=alerts,
+        model_warm=generation.warm,
     )
 
 
 # Stream tokens as they arrive from Ollama for real-time chat UIs.
 @router.post("/stream")
-async def stream_chat(request: ChatRequest) -> StreamingResponse:
+async def stream_chat(
+    request: ChatRequest,
+    http_request: Request,
+    format: Optional[str] = None,
+    shards: ShardSessions = Depends(get_shards),
+) -> StreamingResponse:
     """
-    Stream an Ollama conversation response token-by-token.
+    Stream an Ollama conversation response in coalesced chunks.
+
+    Send ``Accept: text/event-stream`` or ``?format=sse`` for Server-Sent Events
+    with a final ``done`` frame carrying timing stats; otherwise plain text.
+    The message's risk is assessed and logged first, as for ``/chat``.
     """
+    await _assess_and_log(request, shards)
+    retry_after = rate_limited(http_request.state)
+    if retry_after is not None:
+        return _too_many_requests(request.message, retry_after)
     context = f"{request.context}\nUser: {request.message}" if request.context else request.message
-    generator = stream_ollama_reply(context, system_prompt=SYSTEM_PROMPT)
-    return StreamingResponse(generator, media_type="text/plain")
+    sse = format == "sse" or "text/event-stream" in http_request.headers.get("accept", "")
+    generator = stream_ollama_reply(
+        context,
+        system_prompt=SYSTEM_PROMPT,
+        sse=sse,
+        deadline=time.monotonic() + get_settings().chat_deadline_seconds,
+        fallback=_fallback_text(request.message),
+    )
+    if sse:
+        return ClosingStreamingResponse(
+            generator,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    return ClosingStreamingResponse(generator, media_type="text/plain")
 
 
 # Suggest coping resources based on the themes present in the user's message.
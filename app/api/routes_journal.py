@@ -3,115 +3,242 @@ Endpoints for journaling, mood logging, and goals.
 """
 from __future__ import annotations
 
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
 
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.deps import get_async_session
+from app.api.deps import ShardSessions, get_async_session, get_shards
+from app.api.serialization import JSONSerializer
 from app.models.schemas import (
+    BatchIngest,
+    BatchIngestResult,
+    GoalBatchUpsert,
     GoalRead,
     GoalUpsert,
     JournalEntryCreate,
     JournalEntryRead,
     MoodLogCreate,
     MoodLogRead,
+    SimilarEntryRead,
+    SyncDelta,
+    TagCount,
 )
 from app.services.alerts import log_risk_event
+from app.services.embeddings import index_entry, similar_entries
 from app.services.journal import (
+    count_tags,
     create_journal_entry,
     list_goals,
     list_journal_entries,
     list_moods,
     log_mood,
     upsert_goal,
+    upsert_goals,
 )
+from app.services.ollama import OllamaUnavailable
 from app.services.risk import assess_risk
+from app.services.sync import changes_since, ingest_batch
+from app.services.uow import UnitOfWork
 
 
 router = APIRouter(prefix="/journal", tags=["journal"])
 
+entry_json = JSONSerializer(JournalEntryRead)
+entry_list_json = JSONSerializer(List[JournalEntryRead])
+mood_json = JSONSerializer(MoodLogRead)
+mood_list_json = JSONSerializer(List[MoodLogRead])
+goal_json = JSONSerializer(GoalRead)
+goal_list_json = JSONSerializer(List[GoalRead])
+tag_list_json = JSONSerializer(List[TagCount])
+similar_list_json = JSONSerializer(List[SimilarEntryRead])
+batch_json = JSONSerializer(BatchIngestResult)
+sync_json = JSONSerializer(SyncDelta)
+
 
 # Store a journal entry, automatically attaching the computed risk score for later review.
 @router.post("", response_model=JournalEntryRead)
 async def create_entry(
-    payload: JournalEntryCreate, session: AsyncSession = Depends(get_async_session)
-) -> JournalEntryRead:
+    payload: JournalEntryCreate,
+    background_tasks: BackgroundTasks,
+    shards: ShardSessions = Depends(get_shards),
+) -> Response:
+    session = shards.for_user(payload.user_id)
     risk = assess_risk(payload.content)
-    entry = await create_journal_entry(
-        session,
-        user_id=payload.user_id,
-        title=payload.title,
-        content=payload.content,
-        tags=payload.tags,
-        risk_score=risk.score,
+    # The entry, its tags and the audit event commit together or not at all.
+    async with UnitOfWork(session):
+        entry = await create_journal_entry(
+            session,
+            user_id=payload.user_id,
+            title=payload.title,
+            content=payload.content,
+            tags=payload.tags,
+            risk_score=risk.score,
+            scoring_version=risk.version,
+        )
+        await log_risk_event(
+            session,
+            user_id=payload.user_id,
+            source="journal",
+            content=payload.content,
+            assessment=risk,
+        )
+    background_tasks.add_task(
+        index_entry,
+        entry_id=entry.id,
+        user_id=entry.user_id,
+        content_hash=entry.content_hash,
+        text=payload.content,
     )
-
-    await log_risk_event(
-        session,
+    return entry_json({**entry.model_dump(), "content": payload.content})
+
+
+# Replay journal entries and mood logs recorded offline, idempotently by client key.
+@router.post("/batch", response_model=BatchIngestResult)
+async def ingest_offline_records(
+    payload: BatchIngest,
+    background_tasks: BackgroundTasks,
+    shards: ShardSessions = Depends(get_shards),
+) -> Response:
+    records = [record.model_dump() for record in payload.records]
+    result = await ingest_batch(
+        shards.for_user(payload.user_id),
         user_id=payload.user_id,
-        source="journal",
-        content=payload.content,
-        assessment=risk,
+        journals=[record for record in records if record["kind"] == "journal"],
+        moods=[record for record in records if record["kind"] == "mood"],
     )
-    return JournalEntryRead.model_validate(entry.model_dump())
-
-
-# Fetch a user's journal history in reverse chronological order.
+    duplicates = set(result["duplicates"])
+    for entry in result["entries"]:
+        if entry["client_key"] not in duplicates:
+            background_tasks.add_task(
+                index_entry,
+                entry_id=entry["id"],
+                user_id=entry["user_id"],
+                content_hash=entry["content_hash"],
+                text=entry["content"],
+            )
+    return batch_json(result)
+
+
+# Fetch a user's journal history in reverse chronological order, optionally narrowed by tag.
 @router.get("/{user_id}", response_model=List[JournalEntryRead])
 async def list_entries(
-    user_id: str, session: AsyncSession = Depends(get_async_session)
-) -> List[JournalEntryRead]:
-    entries = await list_journal_entries(session, user_id)
-    return [JournalEntryRead.model_validate(entry.model_dump()) for entry in entries]
+    user_id: str,
+    tag: Optional[List[str]] = Query(default=None, description="Only entries carrying every tag."),
+    include_content: bool = Query(default=True, description="Load entry bodies."),
+    session: AsyncSession = Depends(get_async_session),
+) -> Response:
+    entries = await list_journal_entries(
+        session, user_id, tags=tag, include_content=include_content
+    )
+    return entry_list_json(entries)
 
 
 # Log the client's mood and intensity to build trend charts.
 @router.post("/mood", response_model=MoodLogRead)
 async def log_mood_endpoint(
-    payload: MoodLogCreate, session: AsyncSession = Depends(get_async_session)
-) -> MoodLogRead:
+    payload: MoodLogCreate, shards: ShardSessions = Depends(get_shards)
+) -> Response:
     record = await log_mood(
-        session,
+        shards.for_user(payload.user_id),
         user_id=payload.user_id,
         mood=payload.mood,
         intensity=payload.intensity,
         notes=payload.notes,
     )
-    return MoodLogRead.model_validate(record.model_dump())
+    return mood_json(record)
 
 
 # Retrieve all recorded moods for a user.
 @router.get("/mood/{user_id}", response_model=List[MoodLogRead])
 async def list_mood_endpoint(
     user_id: str, session: AsyncSession = Depends(get_async_session)
-) -> List[MoodLogRead]:
+) -> Response:
     records = await list_moods(session, user_id)
-    return [MoodLogRead.model_validate(record.model_dump()) for record in records]
+    return mood_list_json(records)
 
 
 # Upsert goals so counselors can track progress against an agreed plan.
 @router.post("/goals", response_model=GoalRead)
 async def upsert_goal_endpoint(
-    payload: GoalUpsert, session: AsyncSession = Depends(get_async_session)
-) -> GoalRead:
+    payload: GoalUpsert, shards: ShardSessions = Depends(get_shards)
+) -> Response:
     goal = await upsert_goal(
-        session,
+        shards.for_user(payload.user_id),
         user_id=payload.user_id,
         description=payload.description,
         status=payload.status,
         target_date=payload.target_date,
     )
-    return GoalRead.model_validate(goal.model_dump())
+    return goal_json(goal)
+
+
+# Apply a whole care plan at once; goals are matched to existing ones by description.
+@router.post("/goals/batch", response_model=List[GoalRead])
+async def upsert_goals_endpoint(
+    payload: GoalBatchUpsert, shards: ShardSessions = Depends(get_shards)
+) -> Response:
+    goals = await upsert_goals(
+        shards.for_user(payload.user_id),
+        user_id=payload.user_id,
+        goals=[goal.model_dump() for goal in payload.goals],
+    )
+    return goal_list_json(goals)
 
 
 # List all active goals for the specified user.
 @router.get("/goals/{user_id}", response_model=List[GoalRead])
 async def list_goals_endpoint(
     user_id: str, session: AsyncSession = Depends(get_async_session)
-) -> List[GoalRead]:
+) -> Response:
     goals = await list_goals(session, user_id)
-    return [GoalRead.model_validate(goal.model_dump()) for goal in goals]
+    return goal_list_json(goals)
+
 
+# Routes below are registered last so a user named "sync", "similar" or "tags"
+# cannot shadow /mood/{user_id} or /goals/{user_id}.
 
+# Summarize which topics a user journals about most.
+@router.get("/{user_id}/tags", response_model=List[TagCount])
+async def list_tag_facets(
+    user_id: str, session: AsyncSession = Depends(get_async_session)
+) -> Response:
+    facets = await count_tags(session, user_id)
+    return tag_list_json([{"tag": name, "count": count} for name, count in facets])
+
+
+# Return only the entries and mood logs changed since the client's last sync.
+@router.get("/{user_id}/sync", response_model=SyncDelta)
+async def sync_changes(
+    user_id: str,
+    token: Optional[str] = Query(default=None, description="sync_token from the previous call."),
+    limit: int = Query(default=200, ge=1, le=1000),
+    session: AsyncSession = Depends(get_async_session),
+) -> Response:
+    try:
+        delta = await changes_since(session, user_id, token, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token.")
+    return sync_json(delta)
+
+
+# Surface earlier entries that read like this one, to spot recurring crises.
+@router.get("/{user_id}/similar", response_model=List[SimilarEntryRead])
+async def list_similar_entries(
+    user_id: str,
+    entry_id: Optional[int] = None,
+    text: Optional[str] = None,
+    k: int = Query(default=5, ge=1, le=50),
+    session: AsyncSession = Depends(get_async_session),
+) -> Response:
+    if entry_id is None and not text:
+        raise HTTPException(status_code=422, detail="Provide entry_id or text.")
+    try:
+        entries = await similar_entries(session, user_id, entry_id=entry_id, text=text, k=k)
+    except OllamaUnavailable:
+        # Embedding the query needs Ollama; tell the client to retry later.
+        raise HTTPException(
+            status_code=503, detail="Similarity search is temporarily unavailable."
+        )
+    return similar_list_json(entries)
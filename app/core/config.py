@@ -4,11 +4,26 @@ Application configuration via Pydantic settings.
 from __future__ import annotations
 
 from functools import lru_cache
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class RetentionRule(BaseModel):
+    """
+    How long risk events matching ``source``/``level`` stay hot, archived, and at all.
+
+    ``None`` for ``source`` or ``level`` matches any value; ``None`` for a
+    duration means never.  The first matching rule wins.
+    """
+
+    source: Optional[str] = None
+    level: Optional[str] = None
+    archive_after_days: Optional[int] = None
+    purge_after_days: Optional[int] = None
+
+
 class Settings(BaseSettings):
     """
     Environment-driven configuration for CalmMind.
@@ -22,10 +37,60 @@ class Settings(BaseSettings):
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "llama3.1"
     ollama_timeout_seconds: float = 60.0
+    # Model residency: how long Ollama keeps the model loaded after a request,
+    # and a keep-warm ping during working hours so idle gaps do not unload it.
+    ollama_keep_alive: str = "30m"
+    ollama_preload_on_startup: bool = True
+    ollama_keep_warm_interval_seconds: float = 240.0  # 0 disables the ping
+    ollama_keep_warm_start_hour: int = 0
+    ollama_keep_warm_end_hour: int = 24
+    ollama_cold_load_ms: float = 500.0
+    # Per-model generation options, e.g. {"llama3.1": {"num_ctx": 4096, "num_thread": 8}}
+    ollama_model_options: Dict[str, Dict[str, Any]] = {}
+    # Chat requests give up on the model after this long and serve a fallback.
+    # The breaker opens after consecutive failures (or calls slower than the
+    # slow-call limit) and rejects calls outright until the reset period passes.
+    chat_deadline_seconds: float = 20.0
+    ollama_breaker_failure_threshold: int = 5
+    ollama_breaker_slow_call_ms: float = 15000.0
+    ollama_breaker_reset_seconds: float = 30.0
+    # Streaming replies are flushed to clients in chunks bounded by time and size.
+    stream_flush_interval_ms: float = 50.0
+    stream_flush_max_bytes: int = 512
+    ollama_embedding_model: str = "nomic-embed-text"
+    embedding_index_dir: str = "./data/embeddings"
 
     database_url: str = "sqlite+aiosqlite:///./calmmind.db"
+    # Optional shard URLs replacing database_url; users are hashed across them.
+    # Append new shards at the end, then run scripts/rebalance_shards.py.
+    database_shard_urls: List[str] = []
+    content_compression_min_bytes: int = 512
+    # Orphaned content is only collected once unused for this long, so a write
+    # that has just deduplicated against a blob can still commit its reference.
+    content_gc_grace_seconds: float = 3600.0
     redis_url: str = "redis://localhost:6379/0"
 
+    # Token buckets per user_id and per client IP; burst capacity equals the
+    # per-minute rate.  Use the "redis" backend when running several workers.
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "memory"
+    rate_limit_llm_per_minute: int = 20
+    # All LLM requests together, protecting the shared Ollama backend; 0 disables.
+    rate_limit_llm_global_per_minute: int = 120
+    rate_limit_write_per_minute: int = 120
+    rate_limit_admin_per_minute: int = 60
+    rate_limit_ip_multiplier: float = 5.0
+
+    # Opt-in profiling: requests sending X-CalmMind-Profile: <admin_token>, plus a
+    # random sample, get stack samples.  With either enabled, any request slower
+    # than the threshold is kept in a ring of at most profiling_max_profiles files.
+    admin_token: Optional[str] = None
+    profiling_sample_rate: float = 0.0
+    profiling_slow_request_ms: float = 2000.0
+    profiling_sample_interval_ms: float = 5.0
+    profiling_dir: str = "./data/profiles"
+    profiling_max_profiles: int = 200
+
     risk_keywords: List[str] = [
         "suicide",
         "kill myself",
@@ -35,6 +100,31 @@ class Settings(BaseSettings):
     ]
     sentiment_threshold: float = -0.4
 
+    # Delta sync cursors stay this far behind the newest writes, so rows from
+    # transactions committing out of order are never skipped.
+    sync_settle_seconds: float = 5.0
+
+    rescore_chunk_size: int = 500
+    rescore_workers: Optional[int] = None  # defaults to the number of CPUs
+
+    risk_retention_rules: List[RetentionRule] = [
+        RetentionRule(level="high", archive_after_days=180),
+        RetentionRule(level="moderate", archive_after_days=60, purge_after_days=730),
+        RetentionRule(level="low", archive_after_days=14, purge_after_days=365),
+    ]
+    # Retention deletes clinical history, so scheduled runs are opt-in; the rules
+    # above also apply to POST /admin/retention/run.
+    retention_interval_minutes: float = 0.0  # e.g. 60 to run hourly
+    retention_batch_size: int = 500
+    retention_batch_pause_seconds: float = 0.05
+
+    # Columnar snapshots for /admin/analytics; reports never query the databases.
+    # Each export scans every shard, so scheduled runs are opt-in; POST
+    # /admin/analytics/snapshot exports on demand.
+    analytics_snapshot_dir: str = "./data/analytics"
+    analytics_snapshot_interval_minutes: float = 0.0  # e.g. 1440 to export daily
+    analytics_snapshots_keep: int = 3
+
     allowed_origins: Optional[List[str]] = ["http://localhost:5173", "http://localhost:3000"]
 
 
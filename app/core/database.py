@@ -1,37 +1,143 @@
 """
 Database configuration using SQLModel with async support.
+
+Users are spread across one or more databases ("shards", configured through
+``database_shard_urls``) by a jump consistent hash of ``user_id``, so all of a
+user's rows live together and per-user requests touch exactly one shard.
+Growing the shard list moves only about ``1/n`` of users; see
+``scripts/rebalance_shards.py``.
 """
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import heapq
 from collections.abc import AsyncGenerator
+from itertools import islice
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
 
+from fastapi import Request
 from sqlmodel import SQLModel
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 
 from .config import get_settings
 
 # Import models so metadata is populated when create_all is executed
+from app.models import content as _content_models  # noqa: F401
 from app.models import journal as _journal_models  # noqa: F401
 from app.models import risk as _risk_models  # noqa: F401
 
 
+T = TypeVar("T")
+
 settings = get_settings()
-engine = create_async_engine(settings.database_url, echo=False, future=True)
+shard_urls = settings.database_shard_urls or [settings.database_url]
+engines: List[AsyncEngine] = [
+    create_async_engine(url, echo=False, future=True) for url in shard_urls
+]
+engine = engines[0]
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach): map a 64-bit key to ``[0, buckets)``.
+    """
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(user_id: str, shards: Optional[int] = None) -> int:
+    digest = hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).digest()
+    return jump_hash(int.from_bytes(digest, "big"), shards or len(engines))
+
+
+def engine_for(user_id: str) -> AsyncEngine:
+    return engines[shard_for(user_id)]
 
 
 async def init_db() -> None:
     """
-    Initialize database tables.
+    Initialize database tables on every shard.
     """
-    async with engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
+    for shard in engines:
+        async with shard.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
 
 
-async def get_session() -> AsyncGenerator[AsyncSession, None]:
+async def get_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
     """
-    Dependency that yields an async session.
+    Dependency that yields a session on the shard owning the path's ``user_id``.
+
+    Routes keyed by a ``user_id`` in the request body use ``get_shards``.
     """
-    async with AsyncSession(engine, expire_on_commit=False) as session:
+    user_id = request.path_params.get("user_id")
+    if user_id is None:
+        raise RuntimeError(f"{request.url.path} has no user_id path parameter; use get_shards")
+    async with AsyncSession(engine_for(user_id), expire_on_commit=False) as session:
         yield session
 
 
+class ShardSessions:
+    """
+    Sessions opened on demand, one per shard, for a single request.
+    """
+
+    def __init__(self) -> None:
+        self._sessions: Dict[int, AsyncSession] = {}
+
+    def _open(self, index: int) -> AsyncSession:
+        if index not in self._sessions:
+            self._sessions[index] = AsyncSession(engines[index], expire_on_commit=False)
+        return self._sessions[index]
+
+    def for_user(self, user_id: str) -> AsyncSession:
+        return self._open(shard_for(user_id))
+
+    def all(self) -> List[AsyncSession]:
+        return [self._open(index) for index in range(len(engines))]
+
+    async def close(self) -> None:
+        await asyncio.gather(*(session.close() for session in self._sessions.values()))
+
+
+async def get_shards() -> AsyncGenerator[ShardSessions, None]:
+    """
+    Dependency for routes that pick shards themselves: body-keyed or scatter-gather.
+    """
+    shards = ShardSessions()
+    try:
+        yield shards
+    finally:
+        await shards.close()
+
+
+async def scatter_gather(
+    sessions: Sequence[AsyncSession],
+    fetch: Callable[[AsyncSession], Awaitable[List[T]]],
+    *,
+    key: Callable[[T], Any],
+    reverse: bool = False,
+    limit: Optional[int] = None,
+) -> List[T]:
+    """
+    Run ``fetch`` on every shard concurrently and merge the already-sorted results.
+    """
+    results = await asyncio.gather(*(fetch(session) for session in sessions))
+    return list(islice(heapq.merge(*results, key=key, reverse=reverse), limit))
+
+
+def dialect_insert(session: AsyncSession, model: Any):
+    """
+    Dialect-specific INSERT supporting ``ON CONFLICT`` clauses on SQLite and Postgres.
+    """
+    dialect = session.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise NotImplementedError(f"ON CONFLICT inserts are not supported on {dialect}")
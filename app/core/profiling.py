@@ -0,0 +1,348 @@
+"""
+Opt-in per-request profiling and slow-request capture.
+
+A request is profiled when it carries ``X-CalmMind-Profile: <admin_token>`` or
+is picked by ``profiling_sample_rate``.  Profiled requests get a background
+thread sampling the event loop's stack whenever one of the request's tasks is
+running.  Every request passing through the middleware also accumulates cheap
+span timings (``assess_risk``, SQL, Ollama) in a context variable, so a request
+slower than ``profiling_slow_request_ms`` is saved even when it was not sampled.
+Saved profiles live in a bounded ring of JSON files on disk.
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import Settings, get_settings
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-calmmind-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+MAX_STACK_DEPTH = 64
+
+
+class RequestProfile:
+    """
+    Span totals and (when sampled) folded stack samples for one request.
+    """
+
+    def __init__(self, method: str, path: str, sampled: bool, trigger: str) -> None:
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.sampled = sampled
+        self.trigger = trigger
+        self.started_at = datetime.utcnow()
+        self.status: Optional[int] = None
+        self.duration_ms = 0.0
+        self.spans: Dict[str, List[float]] = {}
+        self.samples: Counter = Counter()
+        self.tasks: Set[asyncio.Task] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id = threading.get_ident()
+
+    def record(self, name: str, seconds: float) -> None:
+        totals = self.spans.setdefault(name, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 3),
+            "started_at": self.started_at.isoformat(),
+            "trigger": self.trigger,
+            "sampled": self.sampled,
+            "spans": {
+                name: {"count": int(count), "total_ms": round(seconds * 1000, 3)}
+                for name, (count, seconds) in self.spans.items()
+            },
+        }
+
+    def to_dict(self, interval_ms: float) -> Dict[str, Any]:
+        data = self.summary()
+        data["sample_interval_ms"] = interval_ms
+        data["samples"] = dict(self.samples.most_common())
+        return data
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("calmmind_profile", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    profile = _current.get()
+    if profile is not None:
+        profile.record(name, seconds)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time the enclosed block against the current request's profile, if any.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.record(name, time.perf_counter() - started)
+
+
+def timed(name: str) -> Callable:
+    """
+    Decorator form of ``span`` for synchronous functions.
+    """
+
+    def decorate(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Record time spent in SQL statements on ``engine`` as the ``sql`` span.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("profile_started")
+        if started:
+            record("sql", time.perf_counter() - started.pop())
+
+
+def _profiling_task_factory(loop, coro, **kwargs):
+    # Tasks spawned while serving a profiled request (e.g. stream pumps) are
+    # attributed to it as well.
+    task = asyncio.Task(coro, loop=loop, **kwargs)
+    profile = _current.get()
+    if profile is not None and profile.sampled:
+        profile.tasks.add(task)
+    return task
+
+
+def _fold(frame) -> str:
+    names: List[str] = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    One daemon thread sampling the loop thread's stack for active profiles.
+    """
+
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval = interval_seconds
+        self._active: Set[RequestProfile] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="calmmind-profiler", daemon=True
+                )
+                self._thread.start()
+        self._wake.set()
+
+    def detach(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._active.discard(profile)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for profile in active:
+                    if profile not in self._active:
+                        continue
+                    if asyncio.current_task(profile.loop) not in profile.tasks:
+                        continue
+                    frame = frames.get(profile.thread_id)
+                    if frame is not None:
+                        profile.samples[_fold(frame)] += 1
+
+
+class ProfileStore:
+    """
+    Bounded on-disk ring of saved profiles; the oldest files are dropped first.
+    """
+
+    def __init__(self, root: Path, max_profiles: int) -> None:
+        self.root = root
+        self.max_profiles = max_profiles
+
+    def _files(self) -> List[Path]:
+        return sorted(self.root.glob("*.json")) if self.root.exists() else []
+
+    def save(self, data: Dict[str, Any]) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"{time.time_ns():020d}-{data['id']}.json"
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(temporary, path)
+        files = self._files()
+        for stale in files[: max(0, len(files) - self.max_profiles)]:
+            stale.unlink(missing_ok=True)
+        return path
+
+    def list(self) -> List[Dict[str, Any]]:
+        """
+        Return profile summaries, newest first.
+        """
+        summaries = []
+        for path in reversed(self._files()):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue  # pruned or half-written meanwhile
+            data.pop("samples", None)
+            summaries.append(data)
+        return summaries
+
+    def path(self, profile_id: str) -> Optional[Path]:
+        if not profile_id.isalnum():
+            return None
+        matches = list(self.root.glob(f"*-{profile_id}.json")) if self.root.exists() else []
+        return matches[0] if matches else None
+
+
+_store: Optional[ProfileStore] = None
+
+
+def get_profile_store() -> ProfileStore:
+    global _store
+    settings = get_settings()
+    if _store is None:
+        _store = ProfileStore(Path(settings.profiling_dir), settings.profiling_max_profiles)
+    return _store
+
+
+def folded_stacks(data: Dict[str, Any]) -> str:
+    """
+    Render samples in the collapsed-stack format read by flamegraph tools.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in data.get("samples", {}).items())
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware deciding which requests to profile and which to keep.
+    """
+
+    def __init__(
+        self, app: ASGIApp, settings: Optional[Settings] = None, store: Optional[ProfileStore] = None
+    ) -> None:
+        self.app = app
+        self.settings = settings or get_settings()
+        self.store = store or get_profile_store()
+        self.interval_ms = self.settings.profiling_sample_interval_ms
+        self.sampler = StackSampler(self.interval_ms / 1000)
+
+    def _trigger(self, scope: Scope) -> Optional[str]:
+        token = self.settings.admin_token
+        if token:
+            for name, value in scope.get("headers", []):
+                if name == PROFILE_HEADER:
+                    if hmac.compare_digest(value, token.encode()):
+                        return "header"
+                    break
+        rate = self.settings.profiling_sample_rate
+        if rate > 0 and random.random() < rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self._trigger(scope)
+        profile = RequestProfile(scope["method"], scope["path"], trigger is not None, trigger or "slow")
+        reset_token = _current.set(profile)
+        if profile.sampled:
+            loop = asyncio.get_running_loop()
+            if loop.get_task_factory() is None:
+                loop.set_task_factory(_profiling_task_factory)
+            profile.loop = loop
+            profile.tasks.add(asyncio.current_task())
+            self.sampler.attach(profile)
+
+        async def send_with_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                if trigger == "header":
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (PROFILE_ID_HEADER, profile.id.encode())
+                    ]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            profile.duration_ms = (time.perf_counter() - started) * 1000
+            _current.reset(reset_token)
+            if profile.sampled:
+                self.sampler.detach(profile)
+            if trigger == "header" or profile.duration_ms >= self.settings.profiling_slow_request_ms:
+                await self._save(profile)
+
+    async def _save(self, profile: RequestProfile) -> None:
+        try:
+            data = profile.to_dict(self.interval_ms)
+            await asyncio.get_running_loop().run_in_executor(None, self.store.save, data)
+        except Exception:
+            logger.exception("Failed to save profile for %s %s", profile.method, profile.path)
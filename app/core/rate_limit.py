@@ -0,0 +1,299 @@
+"""
+Token-bucket rate limiting for LLM, write and admin routes.
+
+Each request is classified into a bucket family and charged against up to
+three buckets.  LLM requests first take from ``llm:global``, shared by every
+client, so many addresses together cannot swamp the single Ollama backend.
+Then come two buckets keyed by client IP: one for the address as a whole and,
+when the JSON body names a ``user_id``, one for that user at that address.
+The ``user_id`` is unauthenticated, so it only splits an address's allowance
+and can never spend another client's budget.  Buckets live in process memory
+by default, or in Redis (``redis_url``) so several workers share the same
+limits.
+
+Chat requests over the limit are not rejected here: the route still assesses
+and logs the message's risk, then answers 429 itself (see ``rate_limited``).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import Settings, get_settings
+
+
+logger = logging.getLogger(__name__)
+
+MAX_INSPECTED_BODY_BYTES = 64 * 1024
+_WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Routes that assess risk must see every message, even one over the limit.
+_RISK_ASSESSED_ROUTES = {"/chat", "/chat/stream"}
+_RETRY_AFTER_STATE = "rate_limit_retry_after"
+
+
+@dataclass
+class BucketPolicy:
+    capacity: float
+    refill_per_second: float
+
+
+@dataclass
+class BucketResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_seconds: int
+    retry_after: int = 0
+
+
+def _result(policy: BucketPolicy, tokens: float, allowed: bool, cost: float) -> BucketResult:
+    rate = policy.refill_per_second
+    return BucketResult(
+        allowed=allowed,
+        limit=int(policy.capacity),
+        remaining=max(0, int(tokens)),
+        reset_seconds=math.ceil((policy.capacity - tokens) / rate),
+        retry_after=0 if allowed else math.ceil((cost - tokens) / rate),
+    )
+
+
+class MemoryBucketStore:
+    """
+    Per-process buckets; least recently used keys are evicted beyond ``max_keys``.
+    """
+
+    def __init__(self, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic) -> None:
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._max_keys = max_keys
+        self._clock = clock
+
+    async def take(self, key: str, policy: BucketPolicy, cost: float = 1.0) -> BucketResult:
+        now = self._clock()
+        tokens, updated = self._buckets.pop(key, (policy.capacity, now))
+        tokens = min(policy.capacity, tokens + (now - updated) * policy.refill_per_second)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self._max_keys:
+            self._buckets.popitem(last=False)
+        return _result(policy, tokens, allowed, cost)
+
+
+_REDIS_TAKE = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """
+    Buckets shared across workers, updated atomically by a Lua script.
+    """
+
+    def __init__(self, url: str, prefix: str = "calmmind:ratelimit:") -> None:
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_TAKE)
+        self._prefix = prefix
+
+    async def take(self, key: str, policy: BucketPolicy, cost: float = 1.0) -> BucketResult:
+        allowed, tokens = await self._script(
+            keys=[self._prefix + key],
+            args=[policy.capacity, policy.refill_per_second, time.time(), cost],
+        )
+        return _result(policy, float(tokens), bool(allowed), cost)
+
+
+def policies_from_settings(settings: Settings) -> Dict[str, BucketPolicy]:
+    per_minute = {
+        "llm": settings.rate_limit_llm_per_minute,
+        "write": settings.rate_limit_write_per_minute,
+        "admin": settings.rate_limit_admin_per_minute,
+    }
+    return {name: BucketPolicy(limit, limit / 60.0) for name, limit in per_minute.items()}
+
+
+def _route(path: str, api_prefix: str) -> Optional[str]:
+    if not path.startswith(api_prefix + "/"):
+        return None
+    return path[len(api_prefix):].rstrip("/")
+
+
+def rate_limited(state: Any) -> Optional[int]:
+    """
+    Seconds to wait if the middleware deferred a 429 to this request's route.
+    """
+    return getattr(state, _RETRY_AFTER_STATE, None)
+
+
+def classify(method: str, path: str, api_prefix: str) -> Optional[str]:
+    """
+    Map a request to its bucket family, or ``None`` when it is not limited.
+    """
+    route = _route(path, api_prefix)
+    if route is None:
+        return None
+    if method == "POST" and route in _RISK_ASSESSED_ROUTES:
+        return "llm"
+    if method == "GET" and route.startswith("/journal/") and route.endswith("/similar"):
+        return "llm"  # embeds the query through Ollama
+    if route.startswith("/admin"):
+        return "admin" if method == "GET" else "write"
+    if method in _WRITE_METHODS:
+        return "write"
+    return None
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware enforcing per-user and per-IP token buckets.
+    """
+
+    def __init__(self, app: ASGIApp, settings: Optional[Settings] = None, store=None) -> None:
+        self.app = app
+        self.settings = settings or get_settings()
+        self.policies = policies_from_settings(self.settings)
+        global_limit = self.settings.rate_limit_llm_global_per_minute
+        self.global_llm_policy = (
+            BucketPolicy(global_limit, global_limit / 60.0) if global_limit > 0 else None
+        )
+        if store is None:
+            if self.settings.rate_limit_backend == "redis":
+                store = RedisBucketStore(self.settings.redis_url)
+            else:
+                store = MemoryBucketStore()
+        self.store = store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        family = classify(scope["method"], scope["path"], self.settings.api_prefix)
+        if family is None:
+            await self.app(scope, receive, send)
+            return
+
+        receive, user_id = await _peek_user_id(scope, receive)
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
+        policy = self.policies[family]
+        ip_policy = BucketPolicy(
+            policy.capacity * self.settings.rate_limit_ip_multiplier,
+            policy.refill_per_second * self.settings.rate_limit_ip_multiplier,
+        )
+
+        checks = [(f"{family}:ip:{client_ip}", ip_policy)]
+        if user_id:
+            checks.insert(0, (f"{family}:user:{client_ip}:{user_id}", policy))
+        if family == "llm" and self.global_llm_policy is not None:
+            checks.insert(0, ("llm:global", self.global_llm_policy))
+        results: List[BucketResult] = []
+        try:
+            for key, bucket_policy in checks:
+                result = await self.store.take(key, bucket_policy)
+                results.append(result)
+                if not result.allowed:
+                    break
+        except Exception:
+            # Fail open: a broken limiter backend must not take the API down.
+            logger.exception("Rate limiter backend failed; allowing request")
+            await self.app(scope, receive, send)
+            return
+
+        binding = min(results, key=lambda result: (result.allowed, result.remaining))
+        headers = [
+            (b"ratelimit-limit", str(binding.limit).encode()),
+            (b"ratelimit-remaining", str(binding.remaining).encode()),
+            (b"ratelimit-reset", str(binding.reset_seconds).encode()),
+        ]
+        if not binding.allowed:
+            if _route(scope["path"], self.settings.api_prefix) not in _RISK_ASSESSED_ROUTES:
+                await _reject(send, headers, binding.retry_after)
+                return
+            retry_after = max(1, binding.retry_after)
+            scope = {**scope, "state": {**scope.get("state", {}), _RETRY_AFTER_STATE: retry_after}}
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+async def _peek_user_id(scope: Scope, receive: Receive) -> Tuple[Receive, Optional[str]]:
+    """
+    Read the request body to find ``user_id``, returning a receive that replays it.
+    """
+    content_type = dict(scope.get("headers", [])).get(b"content-type", b"")
+    if scope["method"] not in _WRITE_METHODS or b"json" not in content_type:
+        return receive, None
+
+    chunks: List[bytes] = []
+    more = True
+    while more:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        more = message.get("more_body", False)
+    body = b"".join(chunks)
+
+    user_id = None
+    if len(body) <= MAX_INSPECTED_BODY_BYTES:
+        try:
+            payload = json.loads(body)
+            if isinstance(payload, dict) and isinstance(payload.get("user_id"), str):
+                user_id = payload["user_id"]
+        except ValueError:
+            pass
+
+    replayed = False
+
+    async def replay() -> Message:
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay, user_id
+
+
+async def _reject(send: Send, headers: List[Tuple[bytes, bytes]], retry_after: int) -> None:
+    body = json.dumps({"detail": "Rate limit exceeded. Please slow down."}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 429,
+            "headers": headers
+            + [
+                (b"retry-after", str(max(1, retry_after)).encode()),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
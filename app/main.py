@@ -3,6 +3,7 @@ FastAPI application entry point for CalmMind.
 """
 from __future__ import annotations
 
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
@@ -10,7 +11,12 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.api import api_router
 from app.core.config import get_settings
-from app.core.database import init_db
+from app.core.database import engines, init_db
+from app.core.profiling import ProfilingMiddleware, instrument_engine
+from app.core.rate_limit import RateLimitMiddleware
+from app.services.analytics import analytics_loop
+from app.services.ollama import keep_model_warm, warm_model
+from app.services.retention import retention_loop
 
 
 settings = get_settings()
@@ -22,11 +28,36 @@ async def lifespan(app: FastAPI):
     Initialize resources on startup.
     """
     await init_db()
+    background: list[asyncio.Task] = []
+    if settings.ollama_preload_on_startup:
+        background.append(asyncio.create_task(warm_model()))
+    if settings.ollama_keep_warm_interval_seconds > 0:
+        background.append(
+            asyncio.create_task(keep_model_warm(settings.ollama_keep_warm_interval_seconds))
+        )
+    if settings.retention_interval_minutes > 0:
+        background.append(
+            asyncio.create_task(retention_loop(settings.retention_interval_minutes * 60))
+        )
+    if settings.analytics_snapshot_interval_minutes > 0:
+        background.append(
+            asyncio.create_task(analytics_loop(settings.analytics_snapshot_interval_minutes * 60))
+        )
     yield
+    for task in background:
+        task.cancel()
 
 
 app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
+if settings.admin_token or settings.profiling_sample_rate > 0:
+    for shard in engines:
+        instrument_engine(shard)
+    app.add_middleware(ProfilingMiddleware, settings=settings)
+
+if settings.rate_limit_enabled:
+    app.add_middleware(RateLimitMiddleware, settings=settings)
+
 if settings.allowed_origins:
     app.add_middleware(
         CORSMiddleware,
@@ -0,0 +1,38 @@
+"""
+Content-addressed storage for message and journal text.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import Column, LargeBinary
+from sqlmodel import Field, SQLModel
+
+
+class ContentBlob(SQLModel, table=True):
+    """
+    Text body stored once and referenced by its SHA-256 hash.
+
+    Bodies above ``content_compression_min_bytes`` are zlib-compressed.
+    ``last_seen`` is refreshed whenever a write deduplicates against the blob,
+    so garbage collection can leave recently referenced bodies alone.
+    """
+
+    hash: str = Field(primary_key=True, max_length=64)
+    size: int = Field(description="Length of the uncompressed UTF-8 body in bytes.")
+    compressed: bool = Field(default=False)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    last_seen: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True)
+
+
+class ContentEmbedding(SQLModel, table=True):
+    """
+    Cached embedding vector for a stored body, per embedding model.
+    """
+
+    content_hash: str = Field(foreign_key="contentblob.hash", primary_key=True)
+    model: str = Field(primary_key=True)
+    dim: int
+    vector: bytes = Field(sa_column=Column(LargeBinary, nullable=False), description="float32 array")
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
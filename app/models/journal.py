@@ -6,21 +6,35 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index, UniqueConstraint
 from sqlmodel import Field, SQLModel
 
 
 class JournalEntry(SQLModel, table=True):
     """
     Free-form journal entry captured from guided prompts.
+
+    ``client_key`` is an optional idempotency key chosen by offline clients;
+    ``updated_at`` changes on every write and drives delta sync.
     """
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "client_key", name="uq_journalentry_user_client_key"),
+        Index("ix_journalentry_user_updated", "user_id", "updated_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str = Field(index=True)
     title: str
-    content: str
+    content_hash: str = Field(foreign_key="contentblob.hash", index=True)
     tags: Optional[str] = Field(default=None, description="Comma-separated topic tags.")
     risk_score: float = Field(default=0.0)
+    scoring_version: Optional[str] = Field(
+        default=None, index=True, description="Risk scoring config that produced risk_score."
+    )
+    client_key: Optional[str] = Field(default=None, max_length=64)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
 class MoodLog(SQLModel, table=True):
@@ -28,19 +42,33 @@ class MoodLog(SQLModel, table=True):
     Quantitative mood tracking.
     """
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "client_key", name="uq_moodlog_user_client_key"),
+        Index("ix_moodlog_user_updated", "user_id", "updated_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str = Field(index=True)
     mood: str
     intensity: int = Field(ge=1, le=10)
     notes: Optional[str] = None
+    client_key: Optional[str] = Field(default=None, max_length=64)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
 class Goal(SQLModel, table=True):
     """
     Client goals tracked over time.
+
+    A goal is identified by its description within a user's plan, which is
+    the conflict target for upserts.
     """
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "description", name="uq_goal_user_description"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str = Field(index=True)
     description: str
@@ -50,3 +78,43 @@ class Goal(SQLModel, table=True):
     updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
+class SyncTombstone(SQLModel, table=True):
+    """
+    A journal entry or mood log id that no longer exists for a user.
+
+    Delta sync sends these so offline clients drop rows that were removed or
+    renumbered on the server, e.g. by ``scripts/rebalance_shards.py``.
+    ``kind`` is the sync kind: ``"entries"`` or ``"moods"``.
+    """
+
+    __table_args__ = (Index("ix_synctombstone_user_deleted", "user_id", "deleted_at", "id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: str
+    kind: str
+    row_id: int
+    deleted_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class Tag(SQLModel, table=True):
+    """
+    Normalized topic tag shared across journal entries.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)
+
+
+class JournalEntryTag(SQLModel, table=True):
+    """
+    Join table linking journal entries to their normalized tags.
+
+    ``user_id`` is denormalized from the entry so per-user tag facets can be
+    answered from the ``(user_id, tag_id)`` index without touching entries.
+    """
+
+    __table_args__ = (Index("ix_journalentrytag_user_tag", "user_id", "tag_id"),)
+
+    entry_id: int = Field(foreign_key="journalentry.id", primary_key=True)
+    tag_id: int = Field(foreign_key="tag.id", primary_key=True)
+    user_id: str
@@ -14,14 +14,56 @@ class RiskEvent(SQLModel, table=True):
     Persisted record describing a detected risk signal during chat or journaling.
     """
 
+    # Archived rows keep their id, so SQLite must never hand a freed id out again.
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str = Field(index=True)
     source: str = Field(description="Origin of the event, e.g., 'chat' or 'journal'")
-    content: str = Field(description="User message or journal excerpt that triggered the event")
+    content_hash: str = Field(
+        foreign_key="contentblob.hash",
+        index=True,
+        description="Stored user message or journal excerpt that triggered the event",
+    )
     risk_level: str
     risk_score: float
     sentiment: float
     keywords: Optional[str] = Field(default=None, description="Comma-separated keyword hits")
-    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    scoring_version: Optional[str] = Field(
+        default=None, index=True, description="Risk scoring config that produced this score."
+    )
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True)
+
+
+class RiskEventArchive(SQLModel, table=True):
+    """
+    Cold storage for risk events moved out of the hot table by the retention job.
+
+    Rows keep their original id and content reference.
+    """
+
+    id: int = Field(primary_key=True)
+    user_id: str = Field(index=True)
+    source: str
+    content_hash: str = Field(foreign_key="contentblob.hash", index=True)
+    risk_level: str
+    risk_score: float
+    sentiment: float
+    keywords: Optional[str] = None
+    scoring_version: Optional[str] = None
+    created_at: datetime = Field(nullable=False, index=True)
+    archived_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class RescoreCheckpoint(SQLModel, table=True):
+    """
+    Progress marker for the historical re-scoring job, one row per table.
+    """
+
+    table_name: str = Field(primary_key=True)
+    scoring_version: str
+    last_id: int = Field(default=0)
+    rows_rescored: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
@@ -4,9 +4,9 @@ Pydantic models used in API responses/requests.
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Optional
+from typing import Annotated, Dict, List, Literal, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class ChatRequest(BaseModel):
@@ -21,6 +21,15 @@ class ChatResponse(BaseModel):
     risk_score: float
     sentiment: float
     alerts: List[str] = []
+    model_warm: Optional[bool] = Field(
+        default=None, description="False when the reply paid a cold model load."
+    )
+    degraded: bool = Field(
+        default=False, description="True when the model was unavailable; reply is a fallback."
+    )
+    resources: List[str] = Field(
+        default_factory=list, description="Coping resources, included with fallback replies."
+    )
 
 
 class JournalEntryCreate(BaseModel):
@@ -31,13 +40,26 @@ class JournalEntryCreate(BaseModel):
 
 
 class JournalEntryRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     user_id: str
     title: str
-    content: str
+    content: Optional[str] = None
     tags: Optional[str]
     risk_score: float
+    client_key: Optional[str] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
+
+
+class SimilarEntryRead(JournalEntryRead):
+    similarity: float
+
+
+class TagCount(BaseModel):
+    tag: str
+    count: int
 
 
 class MoodLogCreate(BaseModel):
@@ -48,12 +70,62 @@ class MoodLogCreate(BaseModel):
 
 
 class MoodLogRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     user_id: str
     mood: str
     intensity: int
     notes: Optional[str]
+    client_key: Optional[str] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
+
+
+class JournalBatchItem(BaseModel):
+    kind: Literal["journal"]
+    client_key: str = Field(min_length=1, max_length=64)
+    title: str
+    content: str
+    tags: Optional[str] = None
+    created_at: Optional[datetime] = Field(
+        default=None, description="When the client recorded it; defaults to upload time."
+    )
+
+
+class MoodBatchItem(BaseModel):
+    kind: Literal["mood"]
+    client_key: str = Field(min_length=1, max_length=64)
+    mood: str
+    intensity: int = Field(ge=1, le=10)
+    notes: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+BatchRecord = Annotated[Union[JournalBatchItem, MoodBatchItem], Field(discriminator="kind")]
+
+
+class BatchIngest(BaseModel):
+    user_id: str
+    records: List[BatchRecord] = Field(min_length=1, max_length=500)
+
+
+class BatchIngestResult(BaseModel):
+    entries: List[JournalEntryRead]
+    moods: List[MoodLogRead]
+    duplicates: List[str] = Field(
+        default_factory=list, description="Client keys that were already stored."
+    )
+
+
+class SyncDelta(BaseModel):
+    entries: List[JournalEntryRead]
+    moods: List[MoodLogRead]
+    deleted: Dict[str, List[int]] = Field(
+        default_factory=dict, description="Ids per kind to drop before applying the rows."
+    )
+    sync_token: str = Field(description="Pass back as ?token= to fetch later changes.")
+    has_more: bool
 
 
 class GoalUpsert(BaseModel):
@@ -63,7 +135,20 @@ class GoalUpsert(BaseModel):
     target_date: Optional[datetime] = None
 
 
+class GoalPlanItem(BaseModel):
+    description: str
+    status: str = "in_progress"
+    target_date: Optional[datetime] = None
+
+
+class GoalBatchUpsert(BaseModel):
+    user_id: str
+    goals: List[GoalPlanItem] = Field(min_length=1, max_length=500)
+
+
 class GoalRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     user_id: str
     description: str
@@ -74,10 +159,12 @@ class GoalRead(BaseModel):
 
 
 class RiskEventRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     user_id: str
     source: str
-    content: str
+    content: Optional[str] = None
     risk_level: str
     risk_score: float
     sentiment: float
@@ -85,3 +172,40 @@ class RiskEventRead(BaseModel):
     created_at: datetime
 
 
+class ProfileSpan(BaseModel):
+    count: int
+    total_ms: float
+
+
+class ProfileSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    status: Optional[int]
+    duration_ms: float
+    started_at: datetime
+    trigger: str
+    sampled: bool
+    spans: Dict[str, ProfileSpan]
+
+
+class SourceRiskRate(BaseModel):
+    events: int
+    high: int
+    rate: float
+
+
+class MoodTrend(BaseModel):
+    count: int
+    mean_intensity: float
+
+
+class AnalyticsReport(BaseModel):
+    snapshot_id: str
+    snapshot_created_at: datetime
+    months: List[str]
+    risk_levels: Dict[str, Dict[str, int]]
+    active_users: Dict[str, int]
+    high_risk_rate_by_source: Dict[str, SourceRiskRate]
+    mood_trends: Dict[str, MoodTrend]
+    journal_entries: Dict[str, int]
@@ -4,13 +4,46 @@ Utilities for persisting and querying risk assessment events.
 
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import List, Optional, Set
 
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.models.risk import RiskEvent
+from app.models.risk import RiskEvent, RiskEventArchive
+from app.services.content import store_content, with_content
 from app.services.risk import RiskAssessment
+from app.services.uow import persist
+
+
+# Columns returned by listing queries, mirroring ``RiskEventRead``.
+EVENT_COLUMNS = (
+    RiskEvent.id,
+    RiskEvent.user_id,
+    RiskEvent.source,
+    RiskEvent.content_hash,
+    RiskEvent.risk_level,
+    RiskEvent.risk_score,
+    RiskEvent.sentiment,
+    RiskEvent.keywords,
+    RiskEvent.created_at,
+)
+ARCHIVE_COLUMNS = tuple(getattr(RiskEventArchive, column.key) for column in EVENT_COLUMNS)
+
+
+def build_risk_event(
+    *, user_id: str, source: str, content_hash: str, assessment: RiskAssessment
+) -> RiskEvent:
+    keywords = ",".join(assessment.keyword_hits) if assessment.keyword_hits else None
+    return RiskEvent(
+        user_id=user_id,
+        source=source,
+        content_hash=content_hash,
+        risk_level=assessment.level,
+        risk_score=assessment.score,
+        sentiment=assessment.sentiment,
+        keywords=keywords,
+        scoring_version=assessment.version,
+    )
 
 
 async def log_risk_event(
@@ -23,37 +56,55 @@ async def log_risk_event(
 ) -> RiskEvent:
     """Persist the latest risk evaluation for auditing and dashboards."""
 
-    keywords = ",".join(assessment.keyword_hits) if assessment.keyword_hits else None
-    event = RiskEvent(
+    event = build_risk_event(
         user_id=user_id,
         source=source,
-        content=content,
-        risk_level=assessment.level,
-        risk_score=assessment.score,
-        sentiment=assessment.sentiment,
-        keywords=keywords,
+        content_hash=await store_content(session, content),
+        assessment=assessment,
     )
-    session.add(event)
-    await session.commit()
-    await session.refresh(event)
+    await persist(session, event)
     return event
 
 
+def _allowed_levels(minimum_level: Optional[str]) -> Optional[Set[str]]:
+    if not minimum_level:
+        return None
+    order = ["low", "moderate", "high"]
+    level = minimum_level.lower()
+    if level not in order:
+        return None
+    return set(order[order.index(level):])
+
+
 async def list_risk_events(
     session: AsyncSession,
     *,
     minimum_level: Optional[str] = None,
     limit: int = 50,
-) -> List[RiskEvent]:
-    """Return recent risk events filtered by minimum risk level if provided."""
-
-    query = select(RiskEvent).order_by(RiskEvent.created_at.desc()).limit(limit)
-    if minimum_level:
-        order = ["low", "moderate", "high"]
-        level = minimum_level.lower()
-        if level in order:
-            threshold_index = order.index(level)
-            allowed = set(order[threshold_index:])
-            query = query.where(RiskEvent.risk_level.in_(allowed))
-    result = await session.execute(query)
-    return result.scalars().all()
+    include_archived: bool = False,
+    include_content: bool = False,
+) -> List[dict]:
+    """Return recent risk events filtered by minimum risk level if provided.
+
+    Archived events are only read when ``include_archived`` is set, so the
+    default dashboard query stays on the small hot table.  Message text is only
+    loaded from the content store when ``include_content`` is set.
+    """
+
+    allowed = _allowed_levels(minimum_level)
+    query = select(*EVENT_COLUMNS).order_by(RiskEvent.created_at.desc()).limit(limit)
+    if allowed:
+        query = query.where(RiskEvent.risk_level.in_(allowed))
+    events = list((await session.execute(query)).all())
+
+    if include_archived:
+        archive_query = (
+            select(*ARCHIVE_COLUMNS).order_by(RiskEventArchive.created_at.desc()).limit(limit)
+        )
+        if allowed:
+            archive_query = archive_query.where(RiskEventArchive.risk_level.in_(allowed))
+        events.extend((await session.execute(archive_query)).all())
+        events.sort(key=lambda event: event.created_at, reverse=True)
+        events = events[:limit]
+
+    return await with_content(session, events, include_content=include_content)
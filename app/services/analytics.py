@@ -0,0 +1,471 @@
+"""
+Columnar snapshots of risk, mood and journal history for cohort reporting.
+
+``export_snapshot`` copies ``RiskEvent`` (plus the archive), ``MoodLog`` and
+``JournalEntry`` from every shard in small id-ordered batches into NumPy
+``.npy`` columns on local disk.  String columns are dictionary-encoded into
+integer codes.  A snapshot is written to a temporary directory, renamed into
+place, and only then published through the ``LATEST`` pointer, so readers
+never see a partial export.  ``cohort_report`` memory-maps the latest snapshot
+and answers monthly aggregations with vectorized NumPy, keeping reporting
+scans off the transactional databases.
+
+Batches are read without a long transaction, so rows can move while an export
+runs.  Retention moves events from the hot table to the archive under the same
+id: each shard's hot table is read first and archived ids already exported are
+skipped.  ``scripts/rebalance_shards.py`` copies a user to a newer shard before
+deleting the old rows: shards are read oldest first, so a moved row can only be
+seen twice, and copies of a misplaced user's rows are dropped by the same
+natural keys the script matches on.
+
+Only one export runs at a time per snapshot directory, across worker
+processes too (a lock file next to the snapshots), and the scheduled loop
+skips a run when another worker published a snapshot recently.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core import database
+from app.core.config import get_settings
+from app.core.database import shard_for
+from app.core.locks import file_lock
+from app.models.journal import JournalEntry, MoodLog
+from app.models.risk import RiskEvent, RiskEventArchive
+
+
+logger = logging.getLogger(__name__)
+
+LATEST_POINTER = "LATEST"
+EXPORT_LOCK = ".export.lock"
+RISK_LEVELS = ("low", "moderate", "high")
+EXPORT_BATCH_SIZE = 5000
+
+_lock = asyncio.Lock()
+
+
+class ExportInProgress(RuntimeError):
+    """
+    Another process is already exporting into the snapshot directory.
+    """
+
+
+def _root(root: Optional[Path]) -> Path:
+    return root or Path(get_settings().analytics_snapshot_dir)
+
+
+def is_running(root: Optional[Path] = None) -> bool:
+    """
+    Whether an export is running in this process or another worker.
+    """
+    if _lock.locked():
+        return True
+    root = _root(root)
+    if not root.is_dir():
+        return False
+    with file_lock(root / EXPORT_LOCK, blocking=False) as acquired:
+        return not acquired
+
+
+class Dictionary:
+    """
+    Dictionary encoding of a string column: values map to dense int32 codes.
+    """
+
+    def __init__(self, values: Sequence[str] = ()) -> None:
+        self.values: List[str] = list(values)
+        self._codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, values: Sequence[str]) -> np.ndarray:
+        codes = self._codes
+        for value in values:
+            if value not in codes:
+                codes[value] = len(self.values)
+                self.values.append(value)
+        return np.fromiter((codes[value] for value in values), dtype=np.int32, count=len(values))
+
+
+@dataclass
+class ColumnSpec:
+    name: str
+    dtype: Any
+    dictionary: Optional[str] = None  # name of the shared dictionary, for string columns
+
+
+# Columns identifying a row across shards, as matched by scripts/rebalance_shards.py.
+NATURAL_KEYS: Dict[str, Tuple[str, ...]] = {
+    "risk_events": ("user_id", "created_at", "source", "content_hash"),
+    "moods": ("user_id", "created_at", "mood", "intensity"),
+    "journal_entries": ("user_id", "created_at", "content_hash", "title"),
+}
+
+TABLES: Dict[str, Tuple[Tuple[Any, ...], Tuple[ColumnSpec, ...]]] = {
+    "risk_events": (
+        (RiskEvent, RiskEventArchive),
+        (
+            ColumnSpec("user_id", np.int32, "user"),
+            ColumnSpec("source", np.int32, "source"),
+            ColumnSpec("risk_level", np.int32, "risk_level"),
+            ColumnSpec("risk_score", np.float32),
+            ColumnSpec("sentiment", np.float32),
+            ColumnSpec("created_at", "datetime64[s]"),
+        ),
+    ),
+    "moods": (
+        (MoodLog,),
+        (
+            ColumnSpec("user_id", np.int32, "user"),
+            ColumnSpec("mood", np.int32, "mood"),
+            ColumnSpec("intensity", np.int8),
+            ColumnSpec("created_at", "datetime64[s]"),
+        ),
+    ),
+    "journal_entries": (
+        (JournalEntry,),
+        (
+            ColumnSpec("user_id", np.int32, "user"),
+            ColumnSpec("risk_score", np.float32),
+            ColumnSpec("created_at", "datetime64[s]"),
+        ),
+    ),
+}
+
+
+class _Moves:
+    """
+    Natural keys of rows read on a shard their user no longer hashes to.
+    """
+
+    def __init__(self, shards: int) -> None:
+        self.users: Set[str] = set()
+        self.keys: Dict[str, Set[tuple]] = defaultdict(set)
+        self._owner = lru_cache(maxsize=65536)(lambda user_id: shard_for(user_id, shards))
+
+    def keep(self, table: str, shard: int, key: tuple) -> bool:
+        """
+        Record a misplaced user's row, or reject the later copy of one.
+        """
+        user_id = key[0]
+        if self._owner(user_id) != shard:
+            self.users.add(user_id)
+            self.keys[table].add(key)
+            return True
+        return user_id not in self.users or key not in self.keys[table]
+
+
+async def _export_model(
+    engine: AsyncEngine,
+    shard: int,
+    table: str,
+    model: Any,
+    specs: Sequence[ColumnSpec],
+    dictionaries: Dict[str, Dictionary],
+    chunks: Dict[str, List[np.ndarray]],
+    moves: _Moves,
+    exported: np.ndarray,
+) -> Tuple[int, np.ndarray]:
+    """
+    Append ``model``'s rows to ``chunks``; returns the count and the ids written.
+
+    Rows whose id is in ``exported``, already read from another table of this
+    shard, are skipped.
+    """
+    keys = [getattr(model, name) for name in NATURAL_KEYS[table]]
+    columns = [getattr(model, spec.name) for spec in specs]
+    width = 1 + len(keys)
+    count, after_id = 0, 0
+    written: List[np.ndarray] = []
+    async with AsyncSession(engine) as session:
+        while True:
+            result = await session.execute(
+                select(model.id, *keys, *columns)
+                .where(model.id > after_id)
+                .order_by(model.id)
+                .limit(EXPORT_BATCH_SIZE)
+            )
+            rows = result.all()
+            if not rows:
+                return count, np.concatenate(written) if written else np.empty(0, np.int64)
+            after_id = rows[-1][0]
+            ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            seen = np.isin(ids, exported)
+            rows = [
+                row
+                for row, duplicate in zip(rows, seen)
+                if not duplicate and moves.keep(table, shard, tuple(row[1:width]))
+            ]
+            if rows:
+                values = list(zip(*rows))[width:]
+                for spec, column in zip(specs, values):
+                    if spec.dictionary:
+                        array = dictionaries[spec.dictionary].encode(column)
+                    else:
+                        array = np.array(column, dtype=spec.dtype)
+                    chunks[spec.name].append(array)
+                written.append(np.fromiter((row[0] for row in rows), np.int64, len(rows)))
+                count += len(rows)
+            await asyncio.sleep(0)  # let request handlers in between batches
+
+
+async def export_snapshot(
+    *, engines: Optional[Sequence[AsyncEngine]] = None, root: Optional[Path] = None
+) -> Dict[str, Any]:
+    """
+    Write a new snapshot of every shard and publish it as the latest one.
+
+    Exports run one at a time; raises ``ExportInProgress`` when another worker
+    process holds the snapshot directory.
+    """
+    root = _root(root)
+    root.mkdir(parents=True, exist_ok=True)
+    async with _lock:
+        with file_lock(root / EXPORT_LOCK, blocking=False) as acquired:
+            if not acquired:
+                raise ExportInProgress(f"An export into {root} is already running")
+            return await _export_snapshot(engines, root)
+
+
+async def _export_snapshot(engines: Optional[Sequence[AsyncEngine]], root: Path) -> Dict[str, Any]:
+    settings = get_settings()
+    engines = list(engines or database.engines)
+    created_at = datetime.utcnow()
+    snapshot_id = created_at.strftime("%Y%m%dT%H%M%S%f")
+
+    dictionaries = {"user": Dictionary(), "source": Dictionary(), "mood": Dictionary()}
+    dictionaries["risk_level"] = Dictionary(RISK_LEVELS)
+    staging = root / f".{snapshot_id}.tmp"
+    staging.mkdir(parents=True, exist_ok=True)
+    try:
+        chunks = {
+            table: {spec.name: [] for spec in specs} for table, (_, specs) in TABLES.items()
+        }
+        counts = dict.fromkeys(TABLES, 0)
+        moves = _Moves(len(engines))
+        # Oldest shard first: rebalancing only ever moves users to newer shards.
+        for shard, engine in enumerate(engines):
+            for table, (models, specs) in TABLES.items():
+                exported = np.empty(0, np.int64)
+                for model in models:
+                    rows, ids = await _export_model(
+                        engine,
+                        shard,
+                        table,
+                        model,
+                        specs,
+                        dictionaries,
+                        chunks=chunks[table],
+                        moves=moves,
+                        exported=exported,
+                    )
+                    counts[table] += rows
+                    exported = np.concatenate([exported, ids])
+
+        tables: Dict[str, Dict[str, Any]] = {}
+        for table, (_, specs) in TABLES.items():
+            for spec in specs:
+                parts = chunks[table][spec.name]
+                column = np.concatenate(parts) if parts else np.empty(0, dtype=spec.dtype)
+                np.save(staging / f"{table}.{spec.name}.npy", column)
+            tables[table] = {"rows": counts[table], "columns": [spec.name for spec in specs]}
+
+        meta = {
+            "id": snapshot_id,
+            "created_at": created_at.isoformat(),
+            "tables": tables,
+            "dictionaries": {name: dictionary.values for name, dictionary in dictionaries.items()},
+        }
+        (staging / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(staging, root / snapshot_id)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = root / f"{LATEST_POINTER}.tmp"
+    pointer.write_text(snapshot_id, encoding="utf-8")
+    os.replace(pointer, root / LATEST_POINTER)
+    _prune(root, keep=settings.analytics_snapshots_keep)
+    logger.info("Analytics snapshot %s: %s", snapshot_id, {t: m["rows"] for t, m in tables.items()})
+    return meta
+
+
+def _prune(root: Path, keep: int) -> None:
+    snapshots = sorted(path for path in root.iterdir() if path.is_dir() and path.name[0] != ".")
+    for stale in snapshots[: max(0, len(snapshots) - keep)]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+class Snapshot:
+    """
+    Read-only, memory-mapped view of one exported snapshot.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+
+    def column(self, table: str, name: str) -> np.ndarray:
+        return np.load(self.path / f"{table}.{name}.npy", mmap_mode="r")
+
+    def dictionary(self, name: str) -> List[str]:
+        return self.meta["dictionaries"][name]
+
+
+def load_latest_snapshot(root: Optional[Path] = None) -> Optional[Snapshot]:
+    root = _root(root)
+    try:
+        snapshot_id = (root / LATEST_POINTER).read_text(encoding="utf-8").strip()
+        return Snapshot(root / snapshot_id)
+    except FileNotFoundError:
+        return None
+
+
+def _window(
+    created_at: np.ndarray, since: Optional[date], until: Optional[date]
+) -> np.ndarray:
+    mask = np.ones(created_at.shape[0], dtype=bool)
+    if since is not None:
+        mask &= created_at >= np.datetime64(since, "s")
+    if until is not None:
+        mask &= created_at < np.datetime64(until, "s")
+    return mask
+
+
+def _by_month(created_at: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """
+    Return the distinct months present and each row's month index.
+    """
+    months, index = np.unique(created_at.astype("datetime64[M]"), return_inverse=True)
+    return [str(month) for month in months], index
+
+
+def cohort_report(
+    snapshot: Snapshot, *, since: Optional[date] = None, until: Optional[date] = None
+) -> Dict[str, Any]:
+    """
+    Monthly risk level mix, mood trends, active users and high-risk rate by source.
+
+    ``since``/``until`` bound ``created_at`` as a half-open interval.
+    """
+    events = "risk_events"
+    mask = _window(snapshot.column(events, "created_at"), since, until)
+    level = snapshot.column(events, "risk_level")[mask]
+    source = snapshot.column(events, "source")[mask]
+    months, month = _by_month(snapshot.column(events, "created_at")[mask])
+    levels = snapshot.dictionary("risk_level")
+    level_counts = np.bincount(
+        month * len(levels) + level, minlength=len(months) * len(levels)
+    ).reshape(len(months), len(levels))
+
+    # Distinct (month, user) pairs packed into one integer, then counted per month.
+    user_count = max(1, len(snapshot.dictionary("user")))
+    users = snapshot.column(events, "user_id")[mask]
+    active = np.unique(month.astype(np.int64) * user_count + users)
+    active_users = np.bincount(active // user_count, minlength=len(months))
+
+    sources = snapshot.dictionary("source")
+    high = level == levels.index("high")
+    per_source = np.bincount(source, minlength=len(sources))
+    high_per_source = np.bincount(source, weights=high, minlength=len(sources))
+
+    mood_mask = _window(snapshot.column("moods", "created_at"), since, until)
+    mood_months, mood_month = _by_month(snapshot.column("moods", "created_at")[mood_mask])
+    intensity = snapshot.column("moods", "intensity")[mood_mask].astype(np.float64)
+    mood_counts = np.bincount(mood_month, minlength=len(mood_months))
+    intensity_sums = np.bincount(mood_month, weights=intensity, minlength=len(mood_months))
+
+    journal_created = snapshot.column("journal_entries", "created_at")
+    journal_months, journal_month = _by_month(
+        journal_created[_window(journal_created, since, until)]
+    )
+    journal_counts = np.bincount(journal_month, minlength=len(journal_months))
+
+    return {
+        "snapshot_id": snapshot.meta["id"],
+        "snapshot_created_at": snapshot.meta["created_at"],
+        "months": sorted(set(months) | set(mood_months) | set(journal_months)),
+        "risk_levels": {
+            name: dict(zip(levels, map(int, counts))) for name, counts in zip(months, level_counts)
+        },
+        "active_users": dict(zip(months, map(int, active_users))),
+        "high_risk_rate_by_source": {
+            name: {
+                "events": int(total),
+                "high": int(flagged),
+                "rate": float(flagged / total) if total else 0.0,
+            }
+            for name, total, flagged in zip(sources, per_source, high_per_source)
+            if total
+        },
+        "mood_trends": {
+            name: {"count": int(count), "mean_intensity": float(total / count)}
+            for name, count, total in zip(mood_months, mood_counts, intensity_sums)
+        },
+        "journal_entries": dict(zip(journal_months, map(int, journal_counts))),
+    }
+
+
+def latest_cohort_report(
+    root: Optional[Path] = None,
+    *,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    attempts: int = 3,
+) -> Optional[Dict[str, Any]]:
+    """
+    ``cohort_report`` on the latest snapshot, or ``None`` before the first export.
+
+    An export finishing mid-read may prune the snapshot being read; the report
+    then starts over from the newly published one.
+    """
+    for attempt in range(attempts):
+        snapshot = load_latest_snapshot(root)
+        if snapshot is None:
+            return None
+        try:
+            return cohort_report(snapshot, since=since, until=until)
+        except FileNotFoundError:
+            if attempt == attempts - 1:
+                raise
+            logger.info("Analytics snapshot %s was pruned while reading", snapshot.meta["id"])
+    return None
+
+
+def _recently_exported(within_seconds: float, root: Optional[Path] = None) -> bool:
+    snapshot = load_latest_snapshot(root)
+    if snapshot is None:
+        return False
+    age = datetime.utcnow() - datetime.fromisoformat(snapshot.meta["created_at"])
+    return age.total_seconds() < within_seconds
+
+
+async def analytics_loop(interval_seconds: float) -> None:
+    """
+    Export a snapshot at a fixed interval; started from the app lifespan.
+
+    The first run waits one interval, so restarts do not rescan every shard,
+    and a run is skipped when another worker exported within half an interval.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            if _recently_exported(interval_seconds / 2):
+                continue
+            await export_snapshot()
+        except ExportInProgress:
+            logger.info("Analytics snapshot already running in another worker")
+        except Exception:  # pragma: no cover - keep the loop alive
+            logger.exception("Analytics snapshot failed")
@@ -0,0 +1,216 @@
+"""
+Content-addressed text storage shared by journal entries and risk events.
+
+Bodies are keyed by SHA-256, so the same text posted as a journal entry and
+logged as its risk event is written once.  Storing an existing body refreshes
+its ``last_seen`` instead, which keeps garbage collection from deleting it
+while the referencing row is still uncommitted.  Listing queries carry only the
+hash and resolve bodies in one batched lookup when the caller asks for them.
+"""
+from __future__ import annotations
+
+import hashlib
+import zlib
+from typing import Any, Dict, Iterable, List, Mapping, Sequence, Union
+
+from sqlalchemy import MetaData, Row, Table, event, func, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from sqlmodel import SQLModel
+
+from app.core.config import get_settings
+from app.core.database import dialect_insert
+from app.models.content import ContentBlob
+
+
+COMPRESSION_LEVEL = 6
+_STORED_KEY = "stored_content_hashes"
+# Tables that held their text in a ``content`` column before the blob store.
+LEGACY_CONTENT_TABLES = ("journalentry", "riskevent")
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _forget_stored_hashes(session: Session) -> None:
+    # The cache only vouches for the current transaction: rolled back blobs were
+    # never written, and committed ones may be collected before the next write.
+    session.info.pop(_STORED_KEY, None)
+
+
+def _blob_row(blob: ContentBlob) -> Dict[str, Any]:
+    return {
+        "hash": blob.hash,
+        "size": blob.size,
+        "compressed": blob.compressed,
+        "data": blob.data,
+        "created_at": blob.created_at,
+        "last_seen": blob.last_seen,
+    }
+
+
+async def _upsert_blobs(session: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    statement = dialect_insert(session, ContentBlob).values(rows)
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=["hash"], set_={"last_seen": statement.excluded.last_seen}
+        )
+    )
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def encode_content(text: str) -> ContentBlob:
+    raw = text.encode("utf-8")
+    compress = len(raw) >= get_settings().content_compression_min_bytes
+    return ContentBlob(
+        hash=hashlib.sha256(raw).hexdigest(),
+        size=len(raw),
+        compressed=compress,
+        data=zlib.compress(raw, COMPRESSION_LEVEL) if compress else raw,
+    )
+
+
+def decode_content(data: bytes, compressed: bool) -> str:
+    return (zlib.decompress(data) if compressed else data).decode("utf-8")
+
+
+async def store_content(session: AsyncSession, text: str) -> str:
+    """
+    Store ``text`` unless an identical body already exists; return its hash.
+    """
+    digest = content_hash(text)
+    stored = session.info.setdefault(_STORED_KEY, set())
+    if digest in stored:
+        return digest
+
+    await _upsert_blobs(session, [_blob_row(encode_content(text))])
+    stored.add(digest)
+    return digest
+
+
+async def store_contents(session: AsyncSession, texts: Sequence[str]) -> List[str]:
+    """
+    Batch form of ``store_content``: one INSERT covers every body not yet stored.
+    """
+    stored = session.info.setdefault(_STORED_KEY, set())
+    digests: List[str] = []
+    blobs: Dict[str, ContentBlob] = {}
+    for text in texts:
+        digest = content_hash(text)
+        digests.append(digest)
+        if digest not in stored and digest not in blobs:
+            blobs[digest] = encode_content(text)
+    if blobs:
+        await _upsert_blobs(session, [_blob_row(blob) for blob in blobs.values()])
+        stored.update(blobs)
+    return digests
+
+
+async def load_contents(session: AsyncSession, hashes: Iterable[str]) -> Dict[str, str]:
+    """
+    Resolve many hashes to their text in a single query.
+    """
+    wanted = {digest for digest in hashes if digest}
+    if not wanted:
+        return {}
+    result = await session.execute(
+        select(ContentBlob.hash, ContentBlob.data, ContentBlob.compressed).where(
+            ContentBlob.hash.in_(wanted)
+        )
+    )
+    return {digest: decode_content(data, compressed) for digest, data, compressed in result.all()}
+
+
+async def with_content(
+    session: AsyncSession,
+    rows: Sequence[Union[Row, Mapping]],
+    *,
+    include_content: bool,
+) -> List[dict]:
+    """
+    Turn listing rows carrying ``content_hash`` into dicts with a ``content`` field.
+
+    Without ``include_content`` no blobs are read and ``content`` is ``None``.
+    """
+    records = [dict(row._mapping) if isinstance(row, Row) else dict(row) for row in rows]
+    bodies: Dict[str, str] = {}
+    if include_content:
+        bodies = await load_contents(session, (record["content_hash"] for record in records))
+    for record in records:
+        record["content"] = bodies.get(record["content_hash"])
+    return records
+
+
+def _stage_legacy_tables(connection) -> List[str]:
+    # Move tables still carrying ``content`` aside so create_all can build the
+    # current schema; their indexes go too, as SQLite index names are global.
+    inspector = inspect(connection)
+    staged = []
+    for name in LEGACY_CONTENT_TABLES:
+        legacy = f"legacy_{name}"
+        if inspector.has_table(name):
+            if "content" in {column["name"] for column in inspector.get_columns(name)}:
+                for index in inspector.get_indexes(name):
+                    connection.execute(text(f'DROP INDEX "{index["name"]}"'))
+                connection.execute(text(f'ALTER TABLE "{name}" RENAME TO "{legacy}"'))
+        if inspect(connection).has_table(legacy):
+            staged.append(name)
+    return staged
+
+
+async def migrate_legacy_content(engine: AsyncEngine, *, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Move text from pre-blob ``content`` columns into ``ContentBlob`` (SQLite only).
+
+    Each legacy table is renamed, recreated with the current schema and copied
+    back in id batches with ``content_hash`` set; rows keep their ids.  Every
+    batch commits on its own and an interrupted run resumes where it stopped.
+    Returns the rows copied per table.
+    """
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("migrate_legacy_content only supports SQLite databases")
+    async with engine.begin() as conn:
+        # Keep foreign keys elsewhere pointing at the original table names.
+        await conn.execute(text("PRAGMA legacy_alter_table = ON"))
+        staged = await conn.run_sync(_stage_legacy_tables)
+        await conn.execute(text("PRAGMA legacy_alter_table = OFF"))
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    copied: Dict[str, int] = {}
+    for name in staged:
+        table = SQLModel.metadata.tables[name]
+        async with engine.connect() as conn:
+            legacy = await conn.run_sync(
+                lambda sync: Table(f"legacy_{name}", MetaData(), autoload_with=sync)
+            )
+        copied[name] = 0
+        async with AsyncSession(engine) as session:
+            after_id = (await session.execute(select(func.max(table.c.id)))).scalar() or 0
+            while True:
+                rows = (
+                    await session.execute(
+                        select(legacy)
+                        .where(legacy.c.id > after_id)
+                        .order_by(legacy.c.id)
+                        .limit(batch_size)
+                    )
+                ).mappings().all()
+                if not rows:
+                    break
+                digests = await store_contents(session, [row["content"] for row in rows])
+                records = []
+                for row, digest in zip(rows, digests):
+                    record = {key: value for key, value in row.items() if key in table.c}
+                    record["content_hash"] = digest
+                    if "updated_at" in table.c:
+                        record.setdefault("updated_at", row["created_at"])
+                    records.append(record)
+                await session.execute(table.insert(), records)
+                await session.commit()
+                after_id = rows[-1]["id"]
+                copied[name] += len(rows)
+        async with engine.begin() as conn:
+            await conn.execute(text(f'DROP TABLE "legacy_{name}"'))
+    return copied
@@ -0,0 +1,287 @@
+"""
+Embedding index for "similar earlier entries" lookups on journals.
+
+Entries are embedded after the response is sent, via Ollama's embeddings API by
+default.  Vectors are cached per content hash, so identical text is embedded
+once, and appended to a per-user float32 matrix on disk.  Searches memory-map
+that matrix and rank rows by cosine similarity with NumPy.  Appends take a
+per-user file lock, so several API worker processes can share the index
+directory.  Entries that were never indexed (written before the index existed,
+or whose embedding failed) are added by ``reindex_user`` and
+``scripts/reindex_embeddings.py``.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core import database
+from app.core.config import get_settings
+from app.core.database import dialect_insert
+from app.core.locks import file_lock
+from app.models.content import ContentBlob, ContentEmbedding
+from app.models.journal import JournalEntry
+from app.services.content import decode_content, with_content
+from app.services.journal import ENTRY_COLUMNS
+from app.services.ollama import OllamaClient
+
+logger = logging.getLogger(__name__)
+
+Embedder = Callable[[str], Awaitable[Sequence[float]]]
+
+
+async def ollama_embedder(text: str) -> Sequence[float]:
+    client = OllamaClient()
+    try:
+        return await client.embed(text)
+    finally:
+        await client.close()
+
+
+_embedder: Embedder = ollama_embedder
+
+
+def set_embedder(embedder: Optional[Embedder]) -> None:
+    """
+    Replace the embedding backend, e.g. with a local stand-in in tests.
+
+    ``None`` restores the Ollama backend.
+    """
+    global _embedder
+    _embedder = embedder or ollama_embedder
+
+
+class EmbeddingIndex:
+    """
+    Append-only per-user matrices of unit-normalized float32 vectors.
+
+    Each user has ``<key>.<dim>.f32`` (rows of vectors) and ``<key>.<dim>.ids``
+    (int64 entry ids in the same order).  The vector is written before its id,
+    so after a crash the id file is never ahead of the matrix; a torn trailing
+    row is truncated before the next append.
+    """
+
+    def __init__(self, root: Path, model: str) -> None:
+        self.root = root
+        self.model = model
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def _key(self, user_id: str) -> str:
+        return hashlib.sha1(f"{self.model}:{user_id}".encode("utf-8")).hexdigest()[:20]
+
+    def _paths(self, user_id: str, dim: int) -> Tuple[Path, Path]:
+        key = self._key(user_id)
+        return self.root / f"{key}.{dim}.f32", self.root / f"{key}.{dim}.ids"
+
+    def _lock_path(self, user_id: str) -> Path:
+        return self.root / f"{self._key(user_id)}.lock"
+
+    def entry_ids(self, user_id: str) -> Set[int]:
+        """
+        Ids of the entries already in a user's index.
+        """
+        ids: Set[int] = set()
+        for path in self.root.glob(f"{self._key(user_id)}.*.ids"):
+            ids.update(int(entry_id) for entry_id in np.fromfile(path, dtype=np.int64))
+        return ids
+
+    async def drop(self, user_id: str) -> None:
+        """
+        Delete a user's index, e.g. before rebuilding it with new entry ids.
+        """
+        async with self._locks[user_id]:
+            await asyncio.to_thread(self._drop, user_id)
+
+    def _drop(self, user_id: str) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with file_lock(self._lock_path(user_id)):
+            for path in self.root.glob(f"{self._key(user_id)}.*"):
+                if path.suffix != ".lock":
+                    path.unlink(missing_ok=True)
+
+    async def add(self, user_id: str, entry_id: int, vector: np.ndarray) -> None:
+        async with self._locks[user_id]:
+            await asyncio.to_thread(self._append, user_id, entry_id, _normalize(vector))
+
+    def _append(self, user_id: str, entry_id: int, unit: np.ndarray) -> None:
+        matrix_path, ids_path = self._paths(user_id, unit.shape[0])
+        row = unit.tobytes()
+        self.root.mkdir(parents=True, exist_ok=True)
+        # The asyncio lock orders this process's appends; the file lock orders
+        # them against other worker processes.
+        with file_lock(self._lock_path(user_id)):
+            rows = ids_path.stat().st_size // 8 if ids_path.exists() else 0
+            with matrix_path.open("ab") as handle:
+                if handle.tell() != rows * len(row):
+                    handle.truncate(rows * len(row))
+                handle.write(row)
+            with ids_path.open("ab") as handle:
+                handle.write(np.int64(entry_id).tobytes())
+
+    def search(
+        self, user_id: str, vector: np.ndarray, k: int, exclude: Sequence[int] = ()
+    ) -> List[Tuple[int, float]]:
+        """
+        Return up to ``k`` ``(entry_id, cosine similarity)`` pairs, best first.
+        """
+        query = _normalize(vector)
+        dim = query.shape[0]
+        matrix_path, ids_path = self._paths(user_id, dim)
+        if not ids_path.exists():
+            return []
+        ids = np.fromfile(ids_path, dtype=np.int64)
+        if ids.size == 0:
+            return []
+        matrix = np.memmap(matrix_path, dtype=np.float32, mode="r", shape=(ids.size, dim))
+
+        scores = matrix @ query
+        if exclude:
+            scores = np.where(np.isin(ids, exclude), -np.inf, scores)
+        k = min(k, ids.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+def _normalize(vector: Sequence[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+_index: Optional[EmbeddingIndex] = None
+
+
+def get_index() -> EmbeddingIndex:
+    global _index
+    settings = get_settings()
+    if _index is None:
+        _index = EmbeddingIndex(
+            Path(settings.embedding_index_dir), settings.ollama_embedding_model
+        )
+    return _index
+
+
+async def embed_content(session: AsyncSession, content_hash: str, text: str) -> np.ndarray:
+    """
+    Return the embedding for a stored body, computing and caching it on a miss.
+    """
+    model = get_settings().ollama_embedding_model
+    cached = await session.get(ContentEmbedding, (content_hash, model))
+    if cached is not None:
+        return np.frombuffer(cached.vector, dtype=np.float32)
+
+    vector = np.asarray(await _embedder(text), dtype=np.float32)
+    statement = dialect_insert(session, ContentEmbedding).values(
+        content_hash=content_hash,
+        model=model,
+        dim=vector.shape[0],
+        vector=vector.tobytes(),
+        created_at=datetime.utcnow(),
+    )
+    await session.execute(statement.on_conflict_do_nothing())
+    await session.commit()
+    return vector
+
+
+async def index_entry(
+    *,
+    entry_id: int,
+    user_id: str,
+    content_hash: str,
+    text: str,
+    engine: Optional[AsyncEngine] = None,
+) -> None:
+    """
+    Embed a journal entry and add it to its author's index; run as a background task.
+    """
+    try:
+        shard = engine or database.engine_for(user_id)
+        async with AsyncSession(shard, expire_on_commit=False) as session:
+            vector = await embed_content(session, content_hash, text)
+        await get_index().add(user_id, entry_id, vector)
+    except Exception:
+        logger.exception("Failed to index journal entry %s for similarity search", entry_id)
+
+
+async def reindex_user(engine: AsyncEngine, user_id: str, *, rebuild: bool = False) -> int:
+    """
+    Add a user's journal entries missing from their index; returns how many were added.
+
+    ``rebuild`` drops the index first.  Cached embeddings are reused, so only
+    bodies never embedded reach the embedding backend.
+    """
+    index = get_index()
+    if rebuild:
+        await index.drop(user_id)
+    indexed = index.entry_ids(user_id)
+    added = 0
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        result = await session.execute(
+            select(JournalEntry.id, JournalEntry.content_hash)
+            .where(JournalEntry.user_id == user_id)
+            .order_by(JournalEntry.id)
+        )
+        for entry_id, content_hash in result.all():
+            if entry_id in indexed:
+                continue
+            blob = await session.get(ContentBlob, content_hash)
+            if blob is None:
+                continue
+            text = decode_content(blob.data, blob.compressed)
+            await index.add(user_id, entry_id, await embed_content(session, content_hash, text))
+            added += 1
+    return added
+
+
+async def similar_entries(
+    session: AsyncSession,
+    user_id: str,
+    *,
+    entry_id: Optional[int] = None,
+    text: Optional[str] = None,
+    k: int = 5,
+) -> List[dict]:
+    """
+    Return the user's entries most similar to an existing entry or free text.
+    """
+    if entry_id is not None:
+        result = await session.execute(
+            select(*ENTRY_COLUMNS).where(
+                JournalEntry.id == entry_id, JournalEntry.user_id == user_id
+            )
+        )
+        source = await with_content(session, result.all(), include_content=True)
+        if not source:
+            return []
+        vector = await embed_content(session, source[0]["content_hash"], source[0]["content"])
+        exclude: Sequence[int] = (entry_id,)
+    elif text:
+        vector = np.asarray(await _embedder(text), dtype=np.float32)
+        exclude = ()
+    else:
+        return []
+
+    matches = get_index().search(user_id, vector, k, exclude=exclude)
+    if not matches:
+        return []
+    scores = dict(matches)
+    result = await session.execute(
+        select(*ENTRY_COLUMNS).where(
+            JournalEntry.user_id == user_id, JournalEntry.id.in_(list(scores))
+        )
+    )
+    entries = await with_content(session, result.all(), include_content=True)
+    for entry in entries:
+        entry["similarity"] = scores[entry["id"]]
+    entries.sort(key=lambda entry: entry["similarity"], reverse=True)
+    return entries
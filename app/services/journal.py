@@ -4,12 +4,95 @@ Data access helpers for journaling.
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
 
+from sqlalchemy import Row, func
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.models.journal import Goal, JournalEntry, MoodLog
+from app.core.database import dialect_insert
+from app.models.journal import Goal, JournalEntry, JournalEntryTag, MoodLog, Tag
+from app.services.content import store_content, with_content
+from app.services.uow import UnitOfWork, in_unit_of_work, persist
+
+
+# Listing queries select plain columns instead of full entities so rows skip
+# identity-map bookkeeping and serialize straight into the read schemas.
+ENTRY_COLUMNS = (
+    JournalEntry.id,
+    JournalEntry.user_id,
+    JournalEntry.title,
+    JournalEntry.content_hash,
+    JournalEntry.tags,
+    JournalEntry.risk_score,
+    JournalEntry.client_key,
+    JournalEntry.created_at,
+    JournalEntry.updated_at,
+)
+MOOD_COLUMNS = (
+    MoodLog.id,
+    MoodLog.user_id,
+    MoodLog.mood,
+    MoodLog.intensity,
+    MoodLog.notes,
+    MoodLog.client_key,
+    MoodLog.created_at,
+    MoodLog.updated_at,
+)
+GOAL_COLUMNS = (
+    Goal.id,
+    Goal.user_id,
+    Goal.description,
+    Goal.status,
+    Goal.target_date,
+    Goal.created_at,
+    Goal.updated_at,
+)
+
+
+def normalize_tags(tags: Optional[str]) -> List[str]:
+    """
+    Split a comma-separated tag string into lowercase, deduplicated tag names.
+    """
+    if not tags:
+        return []
+    names = (name.strip().lower() for name in tags.split(","))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+async def _get_or_create_tags(session: AsyncSession, names: Sequence[str]) -> List[int]:
+    result = await session.execute(select(Tag).where(Tag.name.in_(names)))
+    existing = {tag.name: tag.id for tag in result.scalars().all()}
+    for name in names:
+        if name in existing:
+            continue
+        try:
+            # Savepoint so a concurrent insert of the same tag does not abort the entry.
+            async with session.begin_nested():
+                tag = Tag(name=name)
+                session.add(tag)
+            existing[name] = tag.id
+        except IntegrityError:
+            result = await session.execute(select(Tag.id).where(Tag.name == name))
+            existing[name] = result.scalar_one()
+    return [existing[name] for name in names]
+
+
+def _entries_with_tags(names: Sequence[str], user_id: Optional[str] = None):
+    """
+    Subquery of entry ids carrying every tag in ``names``.
+    """
+    query = (
+        select(JournalEntryTag.entry_id)
+        .join(Tag, Tag.id == JournalEntryTag.tag_id)
+        .where(Tag.name.in_(names))
+        .group_by(JournalEntryTag.entry_id)
+        .having(func.count(JournalEntryTag.tag_id) == len(names))
+    )
+    if user_id is not None:
+        query = query.where(JournalEntryTag.user_id == user_id)
+    return query
 
 
 async def create_journal_entry(
@@ -20,42 +103,161 @@ async def create_journal_entry(
     content: str,
     tags: Optional[str],
     risk_score: float,
+    scoring_version: Optional[str] = None,
 ) -> JournalEntry:
-    entry = JournalEntry(
-        user_id=user_id,
-        title=title,
-        content=content,
-        tags=tags,
-        risk_score=risk_score,
-    )
-    session.add(entry)
-    await session.commit()
-    await session.refresh(entry)
+    names = normalize_tags(tags)
+    async with UnitOfWork(session):
+        entry = JournalEntry(
+            user_id=user_id,
+            title=title,
+            content_hash=await store_content(session, content),
+            tags=tags,
+            risk_score=risk_score,
+            scoring_version=scoring_version,
+        )
+        await persist(session, entry)  # assigns entry.id for the join rows
+        if names:
+            tag_ids = await _get_or_create_tags(session, names)
+            await persist(
+                session,
+                *(
+                    JournalEntryTag(entry_id=entry.id, tag_id=tag_id, user_id=user_id)
+                    for tag_id in tag_ids
+                ),
+            )
     return entry
 
 
-async def list_journal_entries(session: AsyncSession, user_id: str) -> List[JournalEntry]:
+async def backfill_entry_tags(session: AsyncSession, *, batch_size: int = 500) -> int:
+    """
+    Link entries whose ``tags`` text has no ``JournalEntryTag`` rows yet.
+
+    Entries written before tags were normalized are otherwise missing from
+    facets and tag filters.  Returns how many entries gained tags.
+    """
+    linked = select(JournalEntryTag.entry_id).distinct()
+    tagged, after_id = 0, 0
+    while True:
+        result = await session.execute(
+            select(JournalEntry.id, JournalEntry.user_id, JournalEntry.tags)
+            .where(
+                JournalEntry.id > after_id,
+                JournalEntry.tags.is_not(None),
+                JournalEntry.id.not_in(linked),
+            )
+            .order_by(JournalEntry.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            return tagged
+        after_id = rows[-1].id
+        async with UnitOfWork(session):
+            for row in rows:
+                names = normalize_tags(row.tags)
+                if not names:
+                    continue
+                tag_ids = await _get_or_create_tags(session, names)
+                await persist(
+                    session,
+                    *(
+                        JournalEntryTag(entry_id=row.id, tag_id=tag_id, user_id=row.user_id)
+                        for tag_id in tag_ids
+                    ),
+                )
+                tagged += 1
+
+
+async def list_journal_entries(
+    session: AsyncSession,
+    user_id: str,
+    *,
+    tags: Optional[Sequence[str]] = None,
+    include_content: bool = False,
+) -> List[dict]:
+    query = (
+        select(*ENTRY_COLUMNS)
+        .where(JournalEntry.user_id == user_id)
+        .order_by(JournalEntry.created_at.desc())
+    )
+    names = normalize_tags(",".join(tags)) if tags else []
+    if names:
+        query = query.where(JournalEntry.id.in_(_entries_with_tags(names, user_id)))
+    result = await session.execute(query)
+    return await with_content(session, result.all(), include_content=include_content)
+
+
+async def count_tags(session: AsyncSession, user_id: str) -> List[Tuple[str, int]]:
+    """
+    Return ``(tag, count)`` facets for a user's journal, most used first.
+    """
+    count = func.count(JournalEntryTag.entry_id)
     result = await session.execute(
-        select(JournalEntry).where(JournalEntry.user_id == user_id).order_by(JournalEntry.created_at.desc())
+        select(Tag.name, count)
+        .join(Tag, Tag.id == JournalEntryTag.tag_id)
+        .where(JournalEntryTag.user_id == user_id)
+        .group_by(Tag.name)
+        .order_by(count.desc(), Tag.name)
     )
-    return result.scalars().all()
+    return [(name, total) for name, total in result.all()]
 
 
 async def log_mood(
     session: AsyncSession, *, user_id: str, mood: str, intensity: int, notes: Optional[str]
 ) -> MoodLog:
     record = MoodLog(user_id=user_id, mood=mood, intensity=intensity, notes=notes)
-    session.add(record)
-    await session.commit()
-    await session.refresh(record)
+    await persist(session, record)
     return record
 
 
-async def list_moods(session: AsyncSession, user_id: str) -> List[MoodLog]:
+async def list_moods(session: AsyncSession, user_id: str) -> Sequence[Row]:
     result = await session.execute(
-        select(MoodLog).where(MoodLog.user_id == user_id).order_by(MoodLog.created_at.desc())
+        select(*MOOD_COLUMNS).where(MoodLog.user_id == user_id).order_by(MoodLog.created_at.desc())
     )
-    return result.scalars().all()
+    return result.all()
+
+
+async def upsert_goals(
+    session: AsyncSession, *, user_id: str, goals: Sequence[Mapping[str, Any]]
+) -> List[Row]:
+    """
+    Insert or update a user's goals by description in one statement.
+
+    Runs a single ``INSERT ... ON CONFLICT (user_id, description) DO UPDATE ...
+    RETURNING`` so the whole plan costs one round trip and concurrent syncs
+    cannot race between a lookup and the write.  When a description repeats
+    within ``goals`` the last occurrence wins.  Rows come back in first-seen
+    order of their descriptions.
+    """
+    now = datetime.utcnow()
+    plan = {
+        goal["description"]: {
+            "user_id": user_id,
+            "description": goal["description"],
+            "status": goal.get("status") or "in_progress",
+            "target_date": goal.get("target_date"),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for goal in goals
+    }
+    if not plan:
+        return []
+
+    statement = dialect_insert(session, Goal).values(list(plan.values()))
+    statement = statement.on_conflict_do_update(
+        index_elements=[Goal.user_id, Goal.description],
+        set_={
+            "status": statement.excluded.status,
+            "target_date": statement.excluded.target_date,
+            "updated_at": statement.excluded.updated_at,
+        },
+    ).returning(*GOAL_COLUMNS)
+    result = await session.execute(statement)
+    rows = {row.description: row for row in result.all()}
+    if not in_unit_of_work(session):
+        await session.commit()
+    return [rows[description] for description in plan]
 
 
 async def upsert_goal(
@@ -65,41 +267,35 @@ async def upsert_goal(
     description: str,
     status: str,
     target_date: Optional[datetime],
-) -> Goal:
-    result = await session.execute(
-        select(Goal).where(Goal.user_id == user_id, Goal.description == description)
+) -> Row:
+    rows = await upsert_goals(
+        session,
+        user_id=user_id,
+        goals=[{"description": description, "status": status, "target_date": target_date}],
     )
-    goal = result.scalar_one_or_none()
-    if goal is None:
-        goal = Goal(
-            user_id=user_id,
-            description=description,
-            status=status,
-            target_date=target_date,
-        )
-        session.add(goal)
-    else:
-        goal.status = status
-        goal.target_date = target_date
-        goal.updated_at = datetime.utcnow()
+    return rows[0]
 
-    await session.commit()
-    await session.refresh(goal)
-    return goal
 
-
-async def list_goals(session: AsyncSession, user_id: str) -> List[Goal]:
-    result = await session.execute(select(Goal).where(Goal.user_id == user_id))
-    return result.scalars().all()
+async def list_goals(session: AsyncSession, user_id: str) -> Sequence[Row]:
+    result = await session.execute(select(*GOAL_COLUMNS).where(Goal.user_id == user_id))
+    return result.all()
 
 
 async def list_high_risk_entries(
-    session: AsyncSession, *, threshold: float = 0.6
-) -> List[JournalEntry]:
-    result = await session.execute(
-        select(JournalEntry)
+    session: AsyncSession,
+    *,
+    threshold: float = 0.6,
+    tags: Optional[Sequence[str]] = None,
+    include_content: bool = False,
+) -> List[dict]:
+    query = (
+        select(*ENTRY_COLUMNS)
         .where(JournalEntry.risk_score >= threshold)
         .order_by(JournalEntry.created_at.desc())
     )
-    return result.scalars().all()
+    names = normalize_tags(",".join(tags)) if tags else []
+    if names:
+        query = query.where(JournalEntry.id.in_(_entries_with_tags(names)))
+    result = await session.execute(query)
+    return await with_content(session, result.all(), include_content=include_content)
 
@@ -4,17 +4,157 @@ Async client for interacting with the local Ollama server.
 from __future__ import annotations
 
 import asyncio
+import logging
+import time
 from collections.abc import AsyncIterator
-from typing import AsyncGenerator, Dict
+from contextlib import aclosing
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, TypeVar
 
 import httpx
+import orjson
 
+from app.core import profiling
 from app.core.config import get_settings
 
 
+logger = logging.getLogger(__name__)
+
+_NS_PER_MS = 1_000_000
+
+T = TypeVar("T")
+
+
+@dataclass
+class Generation:
+    """
+    A completed generation plus timing reported by Ollama.
+
+    ``warm`` is False when Ollama had to load the model for this request.
+    """
+
+    text: str
+    warm: bool
+    load_ms: float
+    total_ms: float
+
+
+def _generation_stats(data: Dict[str, Any]) -> Dict[str, Any]:
+    load_ms = data.get("load_duration", 0) / _NS_PER_MS
+    return {
+        "warm": load_ms < get_settings().ollama_cold_load_ms,
+        "load_ms": load_ms,
+        "total_ms": data.get("total_duration", 0) / _NS_PER_MS,
+    }
+
+
+class OllamaUnavailable(Exception):
+    """
+    Raised when Ollama fails, misses the caller's deadline, or the breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fail fast while Ollama is down or too slow to be useful.
+
+    The breaker opens after ``failure_threshold`` consecutive failures; a call
+    slower than ``slow_call_seconds`` counts as a failure too.  While open,
+    calls are rejected without touching the network.  After ``reset_seconds``
+    a single trial call is let through: success closes the breaker, failure
+    opens it again.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        slow_call_seconds: float,
+        reset_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+        name: str = "ollama",
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self, elapsed: float) -> None:
+        if elapsed > self.slow_call_seconds:
+            self.record_failure()
+            return
+        if self.opened_at is not None:
+            logger.info("Ollama circuit breaker %s closed", self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(
+                    "Ollama circuit breaker %s opened after %s failures", self.name, self.failures
+                )
+            self.opened_at = self._clock()
+        self._trial = False
+
+    def release(self) -> None:
+        """
+        Forget a trial call that ended without a verdict, e.g. when it was cancelled.
+        """
+        self._trial = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    Breaker for one Ollama endpoint and model, e.g. ``"embed:nomic-embed-text"``.
+
+    Separate breakers keep a failing embedding model or keep-warm ping from
+    rejecting chat generations.
+    """
+    if name not in _breakers:
+        settings = get_settings()
+        _breakers[name] = CircuitBreaker(
+            failure_threshold=settings.ollama_breaker_failure_threshold,
+            slow_call_seconds=settings.ollama_breaker_slow_call_ms / 1000,
+            reset_seconds=settings.ollama_breaker_reset_seconds,
+            name=name,
+        )
+    return _breakers[name]
+
+
 class OllamaClient:
     """
     Thin wrapper around the Ollama HTTP API with streaming support.
+
+    Calls go through a circuit breaker per endpoint and model and accept an optional
+    ``deadline`` (a ``time.monotonic()`` timestamp) so a route can bound how
+    long it waits in total; both surface as ``OllamaUnavailable``.
     """
 
     def __init__(self) -> None:
@@ -22,59 +162,320 @@ class OllamaClient:
         self.base_url = settings.ollama_base_url.rstrip("/")
         self.model = settings.ollama_model
         self.timeout = settings.ollama_timeout_seconds
+        self.keep_alive = settings.ollama_keep_alive
+        self.options = settings.ollama_model_options.get(self.model, {})
         self._client = httpx.AsyncClient(timeout=self.timeout)
 
-    async def generate(self, prompt: str, system_prompt: str = "") -> str:
-        """
-        Generate a single non-streaming response.
-        """
-        payload = {
+    def _payload(self, prompt: str, system_prompt: str, stream: bool) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
             "model": self.model,
             "prompt": prompt,
             "system": system_prompt,
-            "stream": False,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
         }
-        response = await self._client.post(f"{self.base_url}/api/generate", json=payload)
+        if self.options:
+            payload["options"] = self.options
+        return payload
+
+    async def _call(
+        self,
+        breaker: CircuitBreaker,
+        request: Callable[[], Awaitable[T]],
+        deadline: Optional[float],
+    ) -> T:
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise OllamaUnavailable("Request deadline exceeded before calling Ollama")
+        if not breaker.allow():
+            raise OllamaUnavailable(f"Ollama circuit breaker {breaker.name} is open")
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(request(), timeout)
+        except (httpx.HTTPError, asyncio.TimeoutError, ValueError) as exc:
+            # ValueError covers a 200 whose body is not the JSON we expect.
+            breaker.record_failure()
+            raise OllamaUnavailable(f"Ollama call failed: {exc!r}") from exc
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success(time.monotonic() - started)
+        return result
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        with profiling.span("ollama"):
+            response = await self._client.post(f"{self.base_url}{path}", json=payload)
         response.raise_for_status()
-        data = response.json()
-        return data.get("response", "")
+        return response.json()
 
-    async def stream(self, prompt: str, system_prompt: str = "") -> AsyncIterator[str]:
+    async def generate(
+        self, prompt: str, system_prompt: str = "", *, deadline: Optional[float] = None
+    ) -> str:
         """
-        Stream tokens from Ollama as they arrive.
+        Generate a single non-streaming response.
         """
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "system": system_prompt,
-            "stream": True,
-        }
-        async with self._client.stream(
+        generation = await self.generate_with_stats(prompt, system_prompt, deadline=deadline)
+        return generation.text
+
+    async def generate_with_stats(
+        self, prompt: str, system_prompt: str = "", *, deadline: Optional[float] = None
+    ) -> Generation:
+        """
+        Generate a response and report whether it hit a warm model.
+        """
+        payload = self._payload(prompt, system_prompt, stream=False)
+        data = await self._call(
+            get_breaker(f"generate:{self.model}"),
+            lambda: self._post("/api/generate", payload),
+            deadline,
+        )
+        return Generation(text=data.get("response", ""), **_generation_stats(data))
+
+    async def preload(self) -> float:
+        """
+        Load the model (or refresh its keep-alive) without generating; returns load time in ms.
+        """
+        payload: Dict[str, Any] = {"model": self.model, "keep_alive": self.keep_alive}
+        if self.options:
+            payload["options"] = self.options
+        # A cold load is slow by design; keep it off the generation breaker.
+        data = await self._call(
+            get_breaker(f"preload:{self.model}"), lambda: self._post("/api/generate", payload), None
+        )
+        return _generation_stats(data)["load_ms"]
+
+    async def _open_stream(self, payload: Dict[str, Any]) -> httpx.Response:
+        request = self._client.build_request(
             "POST", f"{self.base_url}/api/generate", json=payload
-        ) as response:
-            response.raise_for_status()
-            async for line in response.aiter_lines():
-                if not line:
-                    continue
-                chunk = httpx.Response(200, text=line).json()
+        )
+        with profiling.span("ollama"):
+            response = await self._client.send(request, stream=True)
+        if response.is_error:
+            await response.aclose()
+        response.raise_for_status()
+        return response
+
+    async def stream_chunks(
+        self, prompt: str, system_prompt: str = "", *, deadline: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream decoded NDJSON chunks from Ollama, including the final ``done`` chunk.
+
+        The deadline bounds the wait for the response to start, not its length.
+        """
+        payload = self._payload(prompt, system_prompt, stream=True)
+        breaker = get_breaker(f"generate:{self.model}")
+        response = await self._call(breaker, lambda: self._open_stream(payload), deadline)
+        try:
+            buffer = b""
+            chunks = response.aiter_bytes()
+            while True:
+                # Only the wait for Ollama counts, not the time our consumer holds a token.
+                with profiling.span("ollama"):
+                    data = await anext(chunks, None)
+                if data is None:
+                    break
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield orjson.loads(line)
+            if buffer.strip():
+                yield orjson.loads(buffer)
+        except httpx.HTTPError as exc:
+            breaker.record_failure()
+            raise OllamaUnavailable(f"Ollama stream failed: {exc!r}") from exc
+        finally:
+            await response.aclose()
+
+    async def stream(
+        self, prompt: str, system_prompt: str = "", *, deadline: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream tokens from Ollama as they arrive.
+        """
+        async with aclosing(self.stream_chunks(prompt, system_prompt, deadline=deadline)) as chunks:
+            async for chunk in chunks:
                 token = chunk.get("response")
                 if token:
                     yield token
 
+    async def embed(self, text: str, model: Optional[str] = None) -> List[float]:
+        """
+        Return the embedding vector for ``text``.
+        """
+        model = model or get_settings().ollama_embedding_model
+        payload = {"model": model, "prompt": text}
+
+        async def request() -> List[float]:
+            data = await self._post("/api/embeddings", payload)
+            if not data.get("embedding"):
+                raise ValueError(f"Ollama returned no embedding for model {model}")
+            return data["embedding"]
+
+        return await self._call(get_breaker(f"embed:{model}"), request, None)
+
     async def close(self) -> None:
         await self._client.aclose()
 
 
-async def stream_ollama_reply(prompt: str, system_prompt: str = "") -> AsyncGenerator[str, None]:
+async def coalesce_tokens(
+    tokens: AsyncIterator[str], *, max_delay: float, max_bytes: int
+) -> AsyncGenerator[str, None]:
+    """
+    Merge tokens into larger chunks so each write carries more than one token.
+
+    The first token is flushed immediately to keep time-to-first-token low.
+    After that, a chunk is flushed once it reaches ``max_bytes`` or once the
+    oldest buffered token has waited ``max_delay`` seconds, even if the model
+    stalls before the next token.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = tokens.__aiter__()
+    buffer: List[str] = []
+    size = 0
+    deadline = 0.0
+    first = True
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, deadline - loop.time()) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield "".join(buffer)
+                buffer, size = [], 0
+                continue
+            finished, pending = pending, None
+            try:
+                token = finished.result()
+            except StopAsyncIteration:
+                break
+            if first:
+                first = False
+                yield token
+                continue
+            if not buffer:
+                deadline = loop.time() + max_delay
+            buffer.append(token)
+            size += len(token.encode("utf-8"))
+            if size >= max_bytes:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        # On early exit (e.g. the client disconnected) stop the pending read and
+        # close the source, so the upstream HTTP stream is released now rather
+        # than whenever the generator is garbage collected.
+        if pending is not None:
+            pending.cancel()
+            await asyncio.wait({pending})
+            if not pending.cancelled():
+                pending.exception()  # retrieved, so asyncio does not log it
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def sse_frame(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+async def stream_ollama_reply(
+    prompt: str,
+    system_prompt: str = "",
+    *,
+    sse: bool = False,
+    deadline: Optional[float] = None,
+    fallback: Optional[str] = None,
+) -> AsyncGenerator[str, None]:
     """
     Convenience generator for FastAPI streaming responses.
+
+    Tokens are coalesced into time- and size-bounded flushes.  With ``sse`` each
+    flush is a Server-Sent Events ``token`` frame, followed by a ``done`` frame
+    carrying timing stats.  If Ollama is unavailable before the first token,
+    ``fallback`` is sent instead and ``done`` reports ``degraded``; a failure
+    mid-reply ends the stream (with an ``error`` frame under SSE).
+    """
+    settings = get_settings()
+    client = OllamaClient()
+    started = time.perf_counter()
+    stats: Dict[str, Any] = {"tokens": 0, "flushes": 0}
+
+    async def tokens() -> AsyncIterator[str]:
+        stream = client.stream_chunks(prompt, system_prompt, deadline=deadline)
+        async with aclosing(stream) as chunks:
+            async for chunk in chunks:
+                if chunk.get("done"):
+                    stats.update(_generation_stats(chunk))
+                    stats["eval_count"] = chunk.get("eval_count")
+                token = chunk.get("response")
+                if token:
+                    stats["tokens"] += 1
+                    yield token
+
+    try:
+        try:
+            async for text in coalesce_tokens(
+                tokens(),
+                max_delay=settings.stream_flush_interval_ms / 1000,
+                max_bytes=settings.stream_flush_max_bytes,
+            ):
+                if not stats["flushes"]:
+                    stats["ttft_ms"] = (time.perf_counter() - started) * 1000
+                stats["flushes"] += 1
+                yield sse_frame("token", {"text": text}) if sse else text
+        except OllamaUnavailable as exc:
+            if stats["flushes"] or fallback is None:
+                logger.warning("Chat stream ended early: %s", exc)
+                if sse:
+                    yield sse_frame("error", {"detail": "The reply was interrupted."})
+                return
+            logger.warning("Serving fallback chat stream: %s", exc)
+            stats["degraded"] = True
+            yield sse_frame("token", {"text": fallback}) if sse else fallback
+        if sse:
+            stats["elapsed_ms"] = (time.perf_counter() - started) * 1000
+            yield sse_frame("done", stats)
+    finally:
+        await client.close()
+
+
+def _within_keep_warm_hours(now: datetime) -> bool:
+    settings = get_settings()
+    start, end = settings.ollama_keep_warm_start_hour, settings.ollama_keep_warm_end_hour
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end  # window spans midnight
+
+
+async def warm_model() -> None:
+    """
+    Preload the configured model, logging rather than raising if Ollama is unreachable.
     """
     client = OllamaClient()
     try:
-        async for token in client.stream(prompt, system_prompt):
-            yield token
-            await asyncio.sleep(0)  # let event loop breathe
+        load_ms = await client.preload()
+        logger.info("Ollama model %s resident (load %.0f ms)", client.model, load_ms)
+    except OllamaUnavailable as exc:
+        logger.warning("Could not preload Ollama model %s: %s", client.model, exc)
     finally:
         await client.close()
 
 
+async def keep_model_warm(interval_seconds: float) -> None:
+    """
+    Ping the model periodically during configured hours so it stays loaded.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            if _within_keep_warm_hours(datetime.now()):
+                await warm_model()
+        except Exception:  # pragma: no cover - keep the loop alive
+            logger.exception("Keep-warm ping failed")
@@ -0,0 +1,183 @@
+"""
+Background re-scoring of historical journal entries and risk events.
+
+When the keyword list, threshold or weights change, stored scores drift from
+what ``assess_risk`` would produce today.  ``rescore_history`` streams journal
+entries and risk events (hot and archived) whose ``scoring_version`` differs
+from the current one in id order, scores each chunk across a process pool, and
+writes results back with bulk updates.  A checkpoint row per table is committed
+with every chunk so an interrupted run resumes where it stopped.  Archived
+events are included so a clinician searching the archive sees current levels.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlmodel import SQLModel
+
+from app.core import database
+from app.core.config import get_settings
+from app.models.content import ContentBlob
+from app.models.journal import JournalEntry
+from app.models.risk import RescoreCheckpoint, RiskEvent, RiskEventArchive
+from app.services.content import decode_content
+from app.services.risk import RiskAssessment, assess_risk_batch, scoring_version
+
+
+logger = logging.getLogger(__name__)
+
+_lock = asyncio.Lock()
+
+
+def is_running() -> bool:
+    return _lock.locked()
+
+
+def _journal_values(row_id: int, assessment: RiskAssessment) -> dict:
+    return {
+        "id": row_id,
+        "risk_score": assessment.score,
+        "scoring_version": assessment.version,
+        "updated_at": datetime.utcnow(),  # so synced clients pick up the new score
+    }
+
+
+def _event_values(row_id: int, assessment: RiskAssessment) -> dict:
+    return {
+        "id": row_id,
+        "risk_level": assessment.level,
+        "risk_score": assessment.score,
+        "sentiment": assessment.sentiment,
+        "keywords": ",".join(assessment.keyword_hits) if assessment.keyword_hits else None,
+        "scoring_version": assessment.version,
+    }
+
+
+ValuesBuilder = Callable[[int, RiskAssessment], dict]
+
+TARGETS: Tuple[Tuple[Type[SQLModel], ValuesBuilder], ...] = (
+    (JournalEntry, _journal_values),
+    (RiskEvent, _event_values),
+    (RiskEventArchive, _event_values),
+)
+
+
+async def _fetch_chunk(
+    session: AsyncSession, model: Type[SQLModel], version: str, after_id: int, limit: int
+) -> List[Tuple[int, str]]:
+    result = await session.execute(
+        select(model.id, ContentBlob.data, ContentBlob.compressed)
+        .join(ContentBlob, ContentBlob.hash == model.content_hash)
+        .where(
+            model.id > after_id,
+            or_(model.scoring_version.is_(None), model.scoring_version != version),
+        )
+        .order_by(model.id)
+        .limit(limit)
+    )
+    return [
+        (row_id, decode_content(data, compressed)) for row_id, data, compressed in result.all()
+    ]
+
+
+async def _score(
+    pool: Executor, texts: Sequence[str], workers: int
+) -> List[RiskAssessment]:
+    loop = asyncio.get_running_loop()
+    step = max(1, -(-len(texts) // workers))
+    batches = [texts[start : start + step] for start in range(0, len(texts), step)]
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, assess_risk_batch, batch) for batch in batches)
+    )
+    return [assessment for batch in results for assessment in batch]
+
+
+async def _rescore_table(
+    engine: AsyncEngine,
+    pool: Executor,
+    model: Type[SQLModel],
+    to_values: ValuesBuilder,
+    *,
+    version: str,
+    chunk_size: int,
+    workers: int,
+) -> int:
+    table = model.__tablename__
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        checkpoint = await session.get(RescoreCheckpoint, table)
+        if checkpoint is None or checkpoint.scoring_version != version:
+            checkpoint = RescoreCheckpoint(table_name=table, scoring_version=version)
+        elif checkpoint.last_id:
+            logger.info("Resuming %s re-score after id %s", table, checkpoint.last_id)
+
+        rescored = 0
+        chunk = await _fetch_chunk(session, model, version, checkpoint.last_id, chunk_size)
+        while chunk:
+            # Prefetch the next chunk while the pool scores the current one.
+            scoring = asyncio.ensure_future(
+                _score(pool, [content for _, content in chunk], workers)
+            )
+            next_chunk = await _fetch_chunk(session, model, version, chunk[-1][0], chunk_size)
+            assessments = await scoring
+
+            values = [
+                to_values(row_id, assessment)
+                for (row_id, _), assessment in zip(chunk, assessments)
+            ]
+            await session.execute(update(model), values)
+
+            checkpoint.last_id = chunk[-1][0]
+            checkpoint.rows_rescored += len(chunk)
+            checkpoint.updated_at = datetime.utcnow()
+            checkpoint = await session.merge(checkpoint)
+            await session.commit()
+
+            rescored += len(chunk)
+            chunk = next_chunk
+        return rescored
+
+
+async def rescore_history(
+    *,
+    engine: Optional[AsyncEngine] = None,
+    chunk_size: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Re-score every journal entry and risk event produced by an older scoring config.
+
+    Every shard is processed in turn unless ``engine`` is given.  Returns the
+    number of rows updated per table.
+    """
+    settings = get_settings()
+    shards = [engine] if engine is not None else database.engines
+    chunk_size = chunk_size or settings.rescore_chunk_size
+    workers = workers or settings.rescore_workers or os.cpu_count() or 1
+    version = scoring_version()
+
+    counts = {model.__tablename__: 0 for model, _ in TARGETS}
+    async with _lock:
+        # Spawned workers avoid forking a process that is running an event loop.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            for shard in shards:
+                for model, to_values in TARGETS:
+                    counts[model.__tablename__] += await _rescore_table(
+                        shard,
+                        pool,
+                        model,
+                        to_values,
+                        version=version,
+                        chunk_size=chunk_size,
+                        workers=workers,
+                    )
+    logger.info("Re-scored history to version %s: %s", version, counts)
+    return counts
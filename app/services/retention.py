@@ -0,0 +1,257 @@
+"""
+Retention, archival and purging of risk event history.
+
+Each configured ``RetentionRule`` moves matching events older than its archive
+age from ``RiskEvent`` into the ``RiskEventArchive`` table, and deletes events
+(hot or archived) older than its purge age, along with any stored content no
+longer referenced.  Work happens in small id-ordered batches, each in its own
+short transaction, so the job never holds a long write lock on the hot table.
+Runs in one process are serialized (see ``is_running``); runs in other
+workers may overlap, so archiving skips ids another run already copied.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence, Type
+
+from sqlalchemy import and_, delete, false, not_, or_, select, true, union
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import SQLModel
+
+from app.core import database
+from app.core.config import RetentionRule, get_settings
+from app.core.database import dialect_insert
+from app.models.content import ContentBlob, ContentEmbedding
+from app.models.journal import JournalEntry
+from app.models.risk import RiskEvent, RiskEventArchive
+
+
+logger = logging.getLogger(__name__)
+
+_lock = asyncio.Lock()
+
+
+def is_running() -> bool:
+    return _lock.locked()
+
+
+def _rule_matches(model: Type[SQLModel], rule: RetentionRule) -> ColumnElement[bool]:
+    clauses = []
+    if rule.source is not None:
+        clauses.append(model.source == rule.source)
+    if rule.level is not None:
+        clauses.append(model.risk_level == rule.level.lower())
+    return and_(true(), *clauses)
+
+
+def _rule_scope(
+    model: Type[SQLModel], rules: Sequence[RetentionRule], index: int
+) -> ColumnElement[bool]:
+    """
+    Rows governed by ``rules[index]``: it matches and no earlier rule does.
+    """
+    earlier = [_rule_matches(model, rule) for rule in rules[:index]]
+    shadowed = or_(false(), *earlier)
+    return and_(_rule_matches(model, rules[index]), not_(shadowed))
+
+
+async def _purge(
+    session: AsyncSession,
+    model: Type[SQLModel],
+    scope: ColumnElement[bool],
+    cutoff: datetime,
+    batch_size: int,
+    pause: float,
+) -> int:
+    purged = 0
+    while True:
+        result = await session.execute(
+            select(model.id)
+            .where(scope, model.created_at < cutoff)
+            .order_by(model.id)
+            .limit(batch_size)
+        )
+        ids = result.scalars().all()
+        if not ids:
+            return purged
+        await session.execute(delete(model).where(model.id.in_(ids)))
+        await session.commit()
+        purged += len(ids)
+        await asyncio.sleep(pause)
+
+
+async def _archive(
+    session: AsyncSession,
+    scope: ColumnElement[bool],
+    cutoff: datetime,
+    batch_size: int,
+    pause: float,
+) -> int:
+    archived = 0
+    while True:
+        result = await session.execute(
+            select(RiskEvent)
+            .where(scope, RiskEvent.created_at < cutoff)
+            .order_by(RiskEvent.id)
+            .limit(batch_size)
+        )
+        events = result.scalars().all()
+        if not events:
+            return archived
+        now = datetime.utcnow()
+        statement = dialect_insert(session, RiskEventArchive).on_conflict_do_nothing(
+            index_elements=[RiskEventArchive.id]
+        )
+        await session.execute(
+            statement,
+            [
+                {
+                    "id": event.id,
+                    "user_id": event.user_id,
+                    "source": event.source,
+                    "content_hash": event.content_hash,
+                    "risk_level": event.risk_level,
+                    "risk_score": event.risk_score,
+                    "sentiment": event.sentiment,
+                    "keywords": event.keywords,
+                    "scoring_version": event.scoring_version,
+                    "created_at": event.created_at,
+                    "archived_at": now,
+                }
+                for event in events
+            ],
+        )
+        ids = [event.id for event in events]
+        deleted = await session.execute(delete(RiskEvent).where(RiskEvent.id.in_(ids)))
+        await session.commit()
+        session.expunge_all()
+        archived += deleted.rowcount
+        await asyncio.sleep(pause)
+
+
+async def _collect_orphaned_content(
+    session: AsyncSession, batch_size: int, pause: float, grace_seconds: Optional[float] = None
+) -> int:
+    """
+    Delete blobs nothing references that were not stored or reused within the grace period.
+    """
+    if grace_seconds is None:
+        grace_seconds = get_settings().content_gc_grace_seconds
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    referenced = union(
+        select(JournalEntry.content_hash),
+        select(RiskEvent.content_hash),
+        select(RiskEventArchive.content_hash),
+    ).subquery()
+    removed = 0
+    while True:
+        result = await session.execute(
+            select(ContentBlob.hash)
+            .where(
+                ContentBlob.last_seen < cutoff,
+                ContentBlob.hash.not_in(select(referenced.c[0])),
+            )
+            .limit(batch_size)
+        )
+        hashes = result.scalars().all()
+        if not hashes:
+            return removed
+        # Re-check the cutoff: a writer may have reused a blob since the select.
+        stale = select(ContentBlob.hash).where(
+            ContentBlob.hash.in_(hashes), ContentBlob.last_seen < cutoff
+        )
+        await session.execute(
+            delete(ContentEmbedding).where(ContentEmbedding.content_hash.in_(stale))
+        )
+        deleted = await session.execute(delete(ContentBlob).where(ContentBlob.hash.in_(stale)))
+        await session.commit()
+        removed += deleted.rowcount
+        await asyncio.sleep(pause)
+
+
+async def _run_retention_on(
+    engine: AsyncEngine,
+    rules: Sequence[RetentionRule],
+    now: datetime,
+    batch_size: int,
+    pause: float,
+) -> Dict[str, int]:
+    counts = {"archived": 0, "purged": 0, "content_removed": 0}
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        for index, rule in enumerate(rules):
+            if rule.purge_after_days is not None:
+                cutoff = now - timedelta(days=rule.purge_after_days)
+                # Purge first so nothing is compressed only to be deleted.
+                for model in (RiskEvent, RiskEventArchive):
+                    scope = _rule_scope(model, rules, index)
+                    counts["purged"] += await _purge(
+                        session, model, scope, cutoff, batch_size, pause
+                    )
+            if rule.archive_after_days is not None:
+                cutoff = now - timedelta(days=rule.archive_after_days)
+                counts["archived"] += await _archive(
+                    session, _rule_scope(RiskEvent, rules, index), cutoff, batch_size, pause
+                )
+        if counts["purged"]:
+            counts["content_removed"] = await _collect_orphaned_content(
+                session, batch_size, pause
+            )
+    return counts
+
+
+async def run_retention(
+    *,
+    engine: Optional[AsyncEngine] = None,
+    rules: Optional[Sequence[RetentionRule]] = None,
+    now: Optional[datetime] = None,
+) -> Dict[str, int]:
+    """
+    Apply every retention rule once and return how many events were moved or removed.
+
+    Every shard is processed in turn unless ``engine`` is given.  A run started
+    while another is in progress in this process waits for it to finish.
+    """
+    async with _lock:
+        return await _run_retention(engine, rules, now)
+
+
+async def _run_retention(
+    engine: Optional[AsyncEngine],
+    rules: Optional[Sequence[RetentionRule]],
+    now: Optional[datetime],
+) -> Dict[str, int]:
+    settings = get_settings()
+    shards = [engine] if engine is not None else database.engines
+    rules = list(settings.risk_retention_rules if rules is None else rules)
+    now = now or datetime.utcnow()
+
+    counts = {"archived": 0, "purged": 0, "content_removed": 0}
+    for shard in shards:
+        shard_counts = await _run_retention_on(
+            shard,
+            rules,
+            now,
+            settings.retention_batch_size,
+            settings.retention_batch_pause_seconds,
+        )
+        for name, count in shard_counts.items():
+            counts[name] += count
+    if counts["archived"] or counts["purged"]:
+        logger.info("Risk event retention: %s", counts)
+    return counts
+
+
+async def retention_loop(interval_seconds: float) -> None:
+    """
+    Run retention forever at a fixed interval; started from the app lifespan.
+    """
+    while True:
+        try:
+            await run_retention()
+        except Exception:  # pragma: no cover - keep the loop alive
+            logger.exception("Risk event retention run failed")
+        await asyncio.sleep(interval_seconds)
+
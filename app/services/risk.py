@@ -3,12 +3,16 @@ Risk scoring utilities for mental health conversations.
 """
 from __future__ import annotations
 
+import hashlib
+import json
 from dataclasses import dataclass
-from typing import List
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
 
 from textblob import TextBlob
 
 from app.core.config import get_settings
+from app.core.profiling import timed
 
 
 @dataclass
@@ -17,12 +21,38 @@ class RiskAssessment:
     keyword_hits: List[str]
     score: float
     level: str
+    version: Optional[str] = None
 
 
 NEGATIVE_SENTIMENT_WEIGHT = 0.6
 KEYWORD_WEIGHT = 0.4
 
 
+def scoring_version() -> str:
+    """
+    Fingerprint of the configuration that produces risk scores.
+
+    Stored alongside every score so rows produced under an older keyword list,
+    threshold or weighting can be found and re-scored.
+    """
+    settings = get_settings()
+    return _fingerprint(tuple(settings.risk_keywords), settings.sentiment_threshold)
+
+
+@lru_cache(maxsize=8)
+def _fingerprint(keywords: Tuple[str, ...], sentiment_threshold: float) -> str:
+    # Cached: assess_risk stamps every score with the version.
+    config = {
+        "keywords": sorted(keyword.lower() for keyword in keywords),
+        "sentiment_threshold": sentiment_threshold,
+        "sentiment_weight": NEGATIVE_SENTIMENT_WEIGHT,
+        "keyword_weight": KEYWORD_WEIGHT,
+    }
+    digest = hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+@timed("assess_risk")
 def assess_risk(message: str) -> RiskAssessment:
     """
     Compute a simple risk score combining sentiment and keyword hits.
@@ -52,6 +82,14 @@ def assess_risk(message: str) -> RiskAssessment:
         keyword_hits=keywords,
         score=combined,
         level=level,
+        version=scoring_version(),
     )
 
 
+def assess_risk_batch(messages: Sequence[str]) -> List[RiskAssessment]:
+    """
+    Score several messages in one call; picklable entry point for worker processes.
+    """
+    return [assess_risk(message) for message in messages]
+
+
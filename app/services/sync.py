@@ -0,0 +1,283 @@
+"""
+Batch ingest and delta sync for offline-first mobile clients.
+
+Clients tag each journal entry and mood log written offline with a
+``client_key``.  ``ingest_batch`` scores all new journal entries in one call
+and writes the records, their tags and risk events in a single transaction;
+keys that were already stored are reported back instead of written twice.
+
+``changes_since`` pages through a user's rows in ``(updated_at, id)`` order
+from the cursors in a sync token, so a reconnecting client downloads only
+what changed.  Cursors never move past rows younger than
+``sync_settle_seconds``, because a transaction still in flight could yet
+commit an older ``updated_at``; such rows may therefore be sent twice and
+clients should upsert by ``id``.  Ids removed from the server since the last
+sync (see ``SyncTombstone``) arrive in ``deleted`` under their own cursor;
+clients should apply them before upserting the rows of the same delta.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import get_settings
+from app.models.journal import JournalEntry, JournalEntryTag, MoodLog, SyncTombstone
+from app.services.alerts import build_risk_event
+from app.services.content import store_contents, with_content
+from app.services.journal import (
+    ENTRY_COLUMNS,
+    MOOD_COLUMNS,
+    _get_or_create_tags,
+    normalize_tags,
+)
+from app.services.risk import assess_risk_batch
+from app.services.uow import UnitOfWork, persist
+
+
+Cursor = Tuple[datetime, int]
+SYNC_KINDS = (("entries", JournalEntry, ENTRY_COLUMNS), ("moods", MoodLog, MOOD_COLUMNS))
+DELETED = "deleted"
+_CURSOR_KINDS = tuple(kind for kind, _, _ in SYNC_KINDS) + (DELETED,)
+
+
+def _fresh(records: Sequence[Mapping[str, Any]], stored: Set[str]) -> List[Mapping[str, Any]]:
+    """
+    Records whose key is not stored yet; the first of repeated keys wins.
+    """
+    seen = set(stored)
+    fresh = []
+    for record in records:
+        if record["client_key"] not in seen:
+            seen.add(record["client_key"])
+            fresh.append(record)
+    return fresh
+
+
+async def _stored_keys(session: AsyncSession, model, user_id: str, keys: Set[str]) -> Set[str]:
+    if not keys:
+        return set()
+    result = await session.execute(
+        select(model.client_key).where(model.user_id == user_id, model.client_key.in_(keys))
+    )
+    return set(result.scalars().all())
+
+
+async def _write_batch(
+    session: AsyncSession,
+    user_id: str,
+    journals: Sequence[Mapping[str, Any]],
+    moods: Sequence[Mapping[str, Any]],
+) -> Set[str]:
+    journal_keys = {record["client_key"] for record in journals}
+    mood_keys = {record["client_key"] for record in moods}
+    async with UnitOfWork(session):
+        stored_journals = await _stored_keys(session, JournalEntry, user_id, journal_keys)
+        stored_moods = await _stored_keys(session, MoodLog, user_id, mood_keys)
+        new_journals = _fresh(journals, stored_journals)
+        new_moods = _fresh(moods, stored_moods)
+
+        texts = [record["content"] for record in new_journals]
+        # One scoring call for the whole upload, off the event loop.
+        assessments = await asyncio.to_thread(assess_risk_batch, texts) if texts else []
+        hashes = await store_contents(session, texts)
+        now = datetime.utcnow()
+
+        entries = [
+            JournalEntry(
+                user_id=user_id,
+                title=record["title"],
+                content_hash=digest,
+                tags=record.get("tags"),
+                risk_score=assessment.score,
+                scoring_version=assessment.version,
+                client_key=record["client_key"],
+                created_at=record.get("created_at") or now,
+                updated_at=now,
+            )
+            for record, digest, assessment in zip(new_journals, hashes, assessments)
+        ]
+        events = [
+            build_risk_event(
+                user_id=user_id, source="journal", content_hash=digest, assessment=assessment
+            )
+            for digest, assessment in zip(hashes, assessments)
+        ]
+        mood_logs = [
+            MoodLog(
+                user_id=user_id,
+                mood=record["mood"],
+                intensity=record["intensity"],
+                notes=record.get("notes"),
+                client_key=record["client_key"],
+                created_at=record.get("created_at") or now,
+                updated_at=now,
+            )
+            for record in new_moods
+        ]
+        await persist(session, *entries, *events, *mood_logs)
+
+        entry_tags = [(entry, normalize_tags(entry.tags)) for entry in entries]
+        names = list(dict.fromkeys(name for _, tags in entry_tags for name in tags))
+        if names:
+            tag_ids = dict(zip(names, await _get_or_create_tags(session, names)))
+            await persist(
+                session,
+                *(
+                    JournalEntryTag(entry_id=entry.id, tag_id=tag_ids[name], user_id=user_id)
+                    for entry, tags in entry_tags
+                    for name in tags
+                ),
+            )
+    return stored_journals | stored_moods
+
+
+async def ingest_batch(
+    session: AsyncSession,
+    *,
+    user_id: str,
+    journals: Sequence[Mapping[str, Any]],
+    moods: Sequence[Mapping[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Store offline records idempotently and return every row the keys refer to.
+
+    The result holds ``entries`` and ``moods`` (new and previously stored) and
+    the ``duplicates`` keys that were already present.
+    """
+    try:
+        duplicates = await _write_batch(session, user_id, journals, moods)
+    except IntegrityError:
+        # A concurrent upload of the same keys committed first; its rows are
+        # visible now and will be reported as duplicates.
+        duplicates = await _write_batch(session, user_id, journals, moods)
+
+    results: Dict[str, Any] = {"duplicates": sorted(duplicates)}
+    for kind, model, columns, records in (
+        ("entries", JournalEntry, ENTRY_COLUMNS, journals),
+        ("moods", MoodLog, MOOD_COLUMNS, moods),
+    ):
+        keys = {record["client_key"] for record in records}
+        rows = []
+        if keys:
+            result = await session.execute(
+                select(*columns)
+                .where(model.user_id == user_id, model.client_key.in_(keys))
+                .order_by(model.id)
+            )
+            rows = result.all()
+        results[kind] = rows
+    results["entries"] = await with_content(session, results["entries"], include_content=True)
+    return results
+
+
+def encode_sync_token(cursors: Mapping[str, Cursor]) -> str:
+    payload = {kind: [moment.isoformat(), row_id] for kind, (moment, row_id) in cursors.items()}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_sync_token(token: Optional[str]) -> Dict[str, Cursor]:
+    """
+    Parse a sync token; raises ``ValueError`` when it is malformed.
+    """
+    if not token:
+        return {}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        if not isinstance(payload, dict):
+            raise ValueError("Malformed sync token")
+        return {
+            kind: (datetime.fromisoformat(payload[kind][0]), int(payload[kind][1]))
+            for kind in _CURSOR_KINDS
+            if kind in payload
+        }
+    except (TypeError, KeyError, IndexError) as exc:
+        raise ValueError("Malformed sync token") from exc
+
+
+async def _deleted_since(
+    session: AsyncSession,
+    user_id: str,
+    cursors: Dict[str, Cursor],
+    settled_before: datetime,
+    limit: int,
+    delta: Dict[str, Any],
+) -> bool:
+    """
+    Fill ``delta["deleted"]`` from the tombstone cursor; returns whether more remain.
+    """
+    query = (
+        select(SyncTombstone.id, SyncTombstone.kind, SyncTombstone.row_id, SyncTombstone.deleted_at)
+        .where(SyncTombstone.user_id == user_id)
+        .order_by(SyncTombstone.deleted_at, SyncTombstone.id)
+        .limit(limit + 1)
+    )
+    if DELETED in cursors:
+        moment, row_id = cursors[DELETED]
+        query = query.where(
+            or_(
+                SyncTombstone.deleted_at > moment,
+                and_(SyncTombstone.deleted_at == moment, SyncTombstone.id > row_id),
+            )
+        )
+    rows = (await session.execute(query)).all()
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+
+    settled = [row for row in rows if row.deleted_at <= settled_before]
+    if settled:
+        cursors[DELETED] = (settled[-1].deleted_at, settled[-1].id)
+    delta["deleted"] = {kind: [] for kind, _, _ in SYNC_KINDS}
+    for row in rows:
+        delta["deleted"].setdefault(row.kind, []).append(row.row_id)
+    return truncated and len(settled) == len(rows)
+
+
+async def changes_since(
+    session: AsyncSession, user_id: str, token: Optional[str], *, limit: int = 200
+) -> Dict[str, Any]:
+    """
+    Return a user's journal entries and mood logs written after ``token``.
+
+    Each kind returns at most ``limit`` rows; ``has_more`` asks the client to
+    call again right away with the returned ``sync_token``.  ``deleted`` maps
+    each kind to ids the client should drop.
+    """
+    cursors = decode_sync_token(token)
+    settled_before = datetime.utcnow() - timedelta(seconds=get_settings().sync_settle_seconds)
+    delta: Dict[str, Any] = {"has_more": False}
+    if await _deleted_since(session, user_id, cursors, settled_before, limit, delta):
+        delta["has_more"] = True
+    for kind, model, columns in SYNC_KINDS:
+        query = (
+            select(*columns)
+            .where(model.user_id == user_id)
+            .order_by(model.updated_at, model.id)
+            .limit(limit + 1)
+        )
+        if kind in cursors:
+            moment, row_id = cursors[kind]
+            query = query.where(
+                or_(model.updated_at > moment, and_(model.updated_at == moment, model.id > row_id))
+            )
+        rows = (await session.execute(query)).all()
+        truncated = len(rows) > limit
+        rows = rows[:limit]
+
+        settled = [row for row in rows if row.updated_at <= settled_before]
+        if settled:
+            cursors[kind] = (settled[-1].updated_at, settled[-1].id)
+        if truncated and len(settled) == len(rows):
+            delta["has_more"] = True
+        delta[kind] = rows
+
+    delta["entries"] = await with_content(session, delta["entries"], include_content=True)
+    delta["sync_token"] = encode_sync_token(cursors)
+    return delta
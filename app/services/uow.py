@@ -0,0 +1,56 @@
+"""
+Unit of work for staging several writes into a single transaction.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+_DEPTH_KEY = "unit_of_work_depth"
+
+
+class UnitOfWork:
+    """
+    Group the writes made through service helpers into one commit.
+
+    Inside ``async with UnitOfWork(session):`` the helpers only flush, which
+    sends their INSERT/UPDATE statements and reads generated ids back via
+    ``RETURNING`` where the backend supports it.  The outermost unit commits on
+    success and rolls everything back if the block raises.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def __aenter__(self) -> "UnitOfWork":
+        self.session.info[_DEPTH_KEY] = self.session.info.get(_DEPTH_KEY, 0) + 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        depth = self.session.info[_DEPTH_KEY] - 1
+        self.session.info[_DEPTH_KEY] = depth
+        if depth:
+            return
+        if exc_type is None:
+            await self.session.commit()
+        else:
+            await self.session.rollback()
+
+
+def in_unit_of_work(session: AsyncSession) -> bool:
+    return session.info.get(_DEPTH_KEY, 0) > 0
+
+
+async def persist(session: AsyncSession, *objects: Any) -> None:
+    """
+    Stage ``objects`` and flush them, committing unless a unit of work is open.
+
+    Sessions are created with ``expire_on_commit=False`` and every default is
+    generated client-side, so no refresh round trip is needed afterwards.
+    """
+    session.add_all(objects)
+    await session.flush()
+    if not in_unit_of_work(session):
+        await session.commit()
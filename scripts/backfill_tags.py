@@ -0,0 +1,43 @@
+"""Link journal entries written before tags were normalized to their tags.
+
+Facets (``/journal/{user_id}/tags``) and ``?tag=`` filters read the ``Tag`` and
+``JournalEntryTag`` tables, which older entries never filled.  This script
+parses each such entry's ``tags`` text and adds the missing rows on every
+shard; entries already linked are skipped, so it is safe to run repeatedly.
+
+Usage: python scripts/backfill_tags.py
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlmodel.ext.asyncio.session import AsyncSession  # noqa: E402
+
+from app.core import database  # noqa: E402
+from app.core.database import init_db  # noqa: E402
+from app.services.journal import backfill_entry_tags  # noqa: E402
+
+
+async def backfill() -> None:
+    await init_db()
+    total = 0
+    for index, engine in enumerate(database.engines):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            count = await backfill_entry_tags(session)
+        print(f"shard {index}: {count} entries tagged")
+        total += count
+    print(f"{total} entries tagged")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    asyncio.run(backfill())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark per-row overhead of journal list serialization.
+
+Compares the original list path (entity fetch, ``model_dump`` + ``model_validate``
+per row, then FastAPI response validation and ``json.dumps``) with the column-select
+fast path used by the routes (one validation from attributes + pydantic JSON encoding).
+
+Usage: python scripts/bench_serialization.py [--rows 5000] [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlmodel import SQLModel, select  # noqa: E402
+
+from app.api.serialization import JSONSerializer  # noqa: E402
+from app.models.journal import JournalEntry  # noqa: E402
+from app.models.schemas import JournalEntryRead  # noqa: E402
+from app.services.content import store_content  # noqa: E402
+from app.services.journal import ENTRY_COLUMNS  # noqa: E402
+
+
+def best_of(repeat: int, func: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+async def load_rows(rows: int):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        digest = await store_content(
+            session, "Felt anxious before the meeting but the breathing exercise helped. " * 4
+        )
+        session.add_all(
+            JournalEntry(
+                user_id="bench-user",
+                title=f"Entry {index}",
+                content_hash=digest,
+                tags="anxiety,work",
+                risk_score=0.25,
+                created_at=datetime.utcnow(),
+            )
+            for index in range(rows)
+        )
+        await session.commit()
+
+    async def fetch(entities: bool):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            query = select(JournalEntry) if entities else select(*ENTRY_COLUMNS)
+            result = await session.execute(query)
+            return result.scalars().all() if entities else result.all()
+
+    timings = {}
+    for label, entities in (("entities", True), ("columns", False)):
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            fetched = await fetch(entities)
+            best = min(best, time.perf_counter() - start)
+        timings[label] = (best, fetched)
+    await engine.dispose()
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    timings = asyncio.run(load_rows(args.rows))
+    entity_fetch, entities = timings["entities"]
+    column_fetch, rows = timings["columns"]
+
+    response_adapter = TypeAdapter(List[JournalEntryRead])
+    fast_path = JSONSerializer(List[JournalEntryRead])
+
+    def legacy() -> bytes:
+        models = [JournalEntryRead.model_validate(entry.model_dump()) for entry in entities]
+        validated = response_adapter.validate_python(models, from_attributes=True)
+        content = response_adapter.dump_python(validated, mode="json")
+        return json.dumps(content).encode("utf-8")
+
+    def fast() -> bytes:
+        return fast_path(rows).body
+
+    assert json.loads(legacy()) == json.loads(fast())
+
+    legacy_serialize = best_of(args.repeat, legacy)
+    fast_serialize = best_of(args.repeat, fast)
+
+    def per_row(seconds: float) -> str:
+        return f"{seconds / args.rows * 1e6:8.2f} us/row"
+
+    print(f"rows: {args.rows}")
+    print(f"fetch     entities {per_row(entity_fetch)}   columns {per_row(column_fetch)}")
+    print(f"serialize legacy   {per_row(legacy_serialize)}   fast    {per_row(fast_serialize)}")
+    print(
+        f"total     legacy   {per_row(entity_fetch + legacy_serialize)}   "
+        f"fast    {per_row(column_fetch + fast_serialize)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,35 @@
-"""Command-line demo for interacting with the CalmMind API."""
+"""Command-line demo for interacting with the CalmMind API.
+
+Interactive chat by default.  ``--load`` instead simulates many concurrent
+virtual users replaying scripted conversations and journal/mood traffic, then
+reports latency percentiles, time-to-first-token, errors and throughput per
+endpoint.  Chat replies served as the canned fallback while Ollama is down
+(``degraded``) are counted separately and left out of the latency figures.
+Example:
+
+    python scripts/demo_cli.py --load --users 50 --arrival-rate 5 --duration 120
+
+Rate limiting applies per user and per client IP, so for load tests from one
+machine start the API with RATE_LIMIT_ENABLED=false or raised limits.
+"""
 from __future__ import annotations
 
+import argparse
+import asyncio
 import json
+import math
+import random
 import sys
-from typing import Optional
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
 
 import httpx
 
 API_URL = "http://localhost:8000"
+DEFAULT_SCENARIOS = Path(__file__).with_name("load_scenarios.json")
 
 
 def format_alerts(alerts: list[str]) -> str:
@@ -23,7 +45,7 @@ def chat_once(client: httpx.Client, user_id: str, message: str, context: Optiona
     return response.json()
 
 
-def main() -> None:
+def interactive() -> None:
     user_id = "demo-user"
     context: Optional[str] = None
 
@@ -61,6 +83,236 @@ def main() -> None:
             context = (context + "\n" if context else "") + json.dumps(transcript)
 
 
+@dataclass
+class EndpointStats:
+    latencies: List[float] = field(default_factory=list)
+    ttfts: List[float] = field(default_factory=list)
+    errors: int = 0
+    rate_limited: int = 0
+    degraded: int = 0
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies) + self.errors + self.rate_limited + self.degraded
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values`` (seconds)."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+class VirtualUser:
+    """Replays one scripted conversation after another until the test ends."""
+
+    def __init__(
+        self,
+        index: int,
+        client: httpx.AsyncClient,
+        conversations: List[dict],
+        stats: Dict[str, EndpointStats],
+        think_time: float,
+        stop_at: float,
+    ) -> None:
+        self.user_id = f"load-user-{index}"
+        self.client = client
+        self.conversations = conversations
+        self.stats = stats
+        self.think_time = think_time
+        self.stop_at = stop_at
+        self.offset = index
+
+    async def run(self) -> None:
+        while time.monotonic() < self.stop_at:
+            conversation = self.conversations[self.offset % len(self.conversations)]
+            self.offset += 1
+            context: Optional[str] = None
+            for turn in conversation["turns"]:
+                if time.monotonic() >= self.stop_at:
+                    return
+                reply = await self.send(turn, context)
+                if reply is not None and "message" in turn:
+                    transcript = {"user": turn["message"], "assistant": reply}
+                    context = (context + "\n" if context else "") + json.dumps(transcript)
+                if self.think_time > 0:
+                    await asyncio.sleep(random.expovariate(1 / self.think_time))
+
+    async def send(self, turn: dict, context: Optional[str]) -> Optional[str]:
+        endpoint = turn["endpoint"]
+        fields = {key: value for key, value in turn.items() if key != "endpoint"}
+        stats = self.stats[endpoint]
+        started = time.perf_counter()
+        degraded = False
+        try:
+            if endpoint in ("chat", "chat_stream"):
+                payload = {"user_id": self.user_id, "message": turn["message"]}
+                if context:
+                    payload["context"] = context
+                if endpoint == "chat":
+                    response = await self.client.post("/api/chat", json=payload)
+                    body = response.json() if response.is_success else {}
+                    reply = body.get("reply", "") if response.is_success else None
+                    degraded = bool(body.get("degraded"))
+                else:
+                    reply, response, degraded = await self.stream(payload, stats, started)
+            elif endpoint == "journal":
+                payload = {"user_id": self.user_id, **fields}
+                response = await self.client.post("/api/journal", json=payload)
+                reply = None
+            elif endpoint == "mood":
+                payload = {"user_id": self.user_id, **fields}
+                response = await self.client.post("/api/journal/mood", json=payload)
+                reply = None
+            else:
+                raise ValueError(f"Unknown endpoint in scenario: {endpoint}")
+        except httpx.HTTPError:
+            stats.errors += 1
+            return None
+
+        if response.status_code == 429:
+            stats.rate_limited += 1
+        elif response.is_error or (endpoint == "chat_stream" and reply is None):
+            stats.errors += 1  # including a stream that ended without its done frame
+        elif degraded:
+            stats.degraded += 1  # the canned fallback: fast, but not a real reply
+        else:
+            stats.latencies.append(time.perf_counter() - started)
+        return reply
+
+    async def stream(self, payload: dict, stats: EndpointStats, started: float):
+        """Read an SSE reply; returns its text (``None`` if cut off), response and degraded flag."""
+        chunks: List[str] = []
+        ttft: Optional[float] = None
+        done: Optional[dict] = None
+        headers = {"Accept": "text/event-stream"}
+        async with self.client.stream(
+            "POST", "/api/chat/stream", json=payload, headers=headers
+        ) as response:
+            if response.is_error:
+                await response.aread()
+                return None, response, False
+            buffer = ""
+            async for text in response.aiter_text():
+                buffer += text
+                *frames, buffer = buffer.split("\n\n")
+                for frame in frames:
+                    event, data = parse_sse_frame(frame)
+                    if event == "token":
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        chunks.append(data.get("text", ""))
+                    elif event == "done":
+                        done = data
+        if done is None:  # an error frame, or the stream was cut off
+            return None, response, False
+        degraded = bool(done.get("degraded"))
+        if ttft is not None and not degraded:
+            stats.ttfts.append(ttft)
+        return "".join(chunks), response, degraded
+
+
+def parse_sse_frame(frame: str) -> tuple:
+    """Return the ``(event, data)`` of one Server-Sent Events frame."""
+    event, data = "message", {}
+    for line in frame.splitlines():
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data = json.loads(line[len("data:"):])
+    return event, data
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, EndpointStats]:
+    conversations = json.loads(Path(args.scenarios).read_text())["conversations"]
+    stats: Dict[str, EndpointStats] = defaultdict(EndpointStats)
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    started = time.monotonic()
+    stop_at = started + args.duration
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url, timeout=args.timeout, limits=limits
+    ) as client:
+        tasks = []
+        for index in range(args.users):
+            if time.monotonic() >= stop_at:
+                break
+            user = VirtualUser(index, client, conversations, stats, args.think_time, stop_at)
+            tasks.append(asyncio.create_task(user.run()))
+            if args.arrival_rate > 0:
+                await asyncio.sleep(random.expovariate(args.arrival_rate))
+        print(f"{len(tasks)} virtual users started; running until the {args.duration:.0f}s mark...")
+        await asyncio.gather(*tasks)
+    args.elapsed = time.monotonic() - started
+    return stats
+
+
+def report(stats: Dict[str, EndpointStats], elapsed: float) -> None:
+    def ms(seconds: float) -> str:
+        return f"{'-':>8}" if math.isnan(seconds) else f"{seconds * 1000:8.1f}"
+
+    header = (
+        f"{'endpoint':<12} {'reqs':>6} {'ok':>6} {'err%':>6} {'429':>5} {'degr':>5} {'rps':>7} "
+        f"{'p50 ms':>8} {'p90 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttft p50':>8} {'ttft p95':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for endpoint in sorted(stats):
+        data = stats[endpoint]
+        error_rate = 100 * data.errors / data.requests if data.requests else 0.0
+        print(
+            f"{endpoint:<12} {data.requests:>6} {len(data.latencies):>6} {error_rate:>6.1f} "
+            f"{data.rate_limited:>5} {data.degraded:>5} {len(data.latencies) / elapsed:>7.2f} "
+            f"{ms(percentile(data.latencies, 50))} {ms(percentile(data.latencies, 90))} "
+            f"{ms(percentile(data.latencies, 95))} {ms(percentile(data.latencies, 99))} "
+            f"{ms(percentile(data.ttfts, 50))} {ms(percentile(data.ttfts, 95))}"
+        )
+    total = sum(len(data.latencies) for data in stats.values())
+    degraded = sum(data.degraded for data in stats.values())
+    print(
+        f"\nElapsed {elapsed:.1f}s, {total} successful requests, "
+        f"{total / elapsed:.2f} req/s overall"
+    )
+    if degraded:
+        print(
+            f"{degraded} chat replies were the degraded fallback (Ollama unavailable) "
+            "and are excluded from the latency figures"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="CalmMind API demo and load generator.")
+    parser.add_argument("--base-url", default=API_URL)
+    parser.add_argument("--load", action="store_true", help="Run the load generator.")
+    parser.add_argument("--users", type=int, default=10, help="Number of virtual users.")
+    parser.add_argument(
+        "--arrival-rate",
+        type=float,
+        default=2.0,
+        help="New virtual users per second (0 = all at once).",
+    )
+    parser.add_argument(
+        "--think-time", type=float, default=2.0, help="Mean pause between turns (s)."
+    )
+    parser.add_argument("--duration", type=float, default=60.0, help="Test length in seconds.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout (s).")
+    parser.add_argument("--scenarios", default=str(DEFAULT_SCENARIOS), help="Scenario JSON file.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.load:
+        global API_URL
+        API_URL = args.base_url.rstrip("/")
+        interactive()
+        return
+    stats = asyncio.run(run_load(args))
+    report(stats, args.elapsed)
+
+
 if __name__ == "__main__":
     try:
         main()
@@ -0,0 +1,40 @@
+"""Move journal and risk event text from databases created before the blob store.
+
+Journal entries and risk events used to keep their text in a ``content``
+column; they now reference a ``ContentBlob`` by ``content_hash``.  Starting the
+API on such a database fails, so run this once per database first.  Each
+legacy table is rebuilt with the current schema, its text hashed into the blob
+store, and its ids kept.  Databases that are already current are left alone,
+and an interrupted run can simply be started again.  SQLite only.
+
+Usage: python scripts/migrate_content_hashes.py
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core import database  # noqa: E402
+from app.services.content import migrate_legacy_content  # noqa: E402
+
+
+async def migrate() -> None:
+    for index, engine in enumerate(database.engines):
+        copied = await migrate_legacy_content(engine)
+        if not copied:
+            print(f"shard {index}: already current")
+        for table, count in copied.items():
+            print(f"shard {index}: {count} {table} rows moved to content hashes")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    asyncio.run(migrate())
+
+
+if __name__ == "__main__":
+    main()
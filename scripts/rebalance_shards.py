@@ -0,0 +1,265 @@
+"""Move users to the shard they hash to after DATABASE_SHARD_URLS changes.
+
+Append new URLs to DATABASE_SHARD_URLS, restart the API so new writes go to
+each user's new shard, then run this script.  Every user found on a shard it
+no longer hashes to is copied to its owner in one transaction and then
+deleted from the source.  Rows already on the target (same natural key) are
+skipped, so an interrupted run can simply be repeated.
+
+Journal entries and mood logs keep their ids, so sync clients, ``similar``
+lookups by ``entry_id`` and the similarity index still refer to the same rows.
+A row whose id is already taken on the target gets a fresh id and a new
+``updated_at``, so the next delta sync delivers it again under that id, and
+a tombstone for the old id, so the client drops its stale copy.  Rows the
+target already holds (same natural key) under another id are tombstoned the
+same way, and the user's existing tombstones move along.
+Risk events are only read by admin listings and get fresh ids; archived ones
+go back to the target's hot table and are archived again by the next
+retention run.  Each moved user's similarity index is rebuilt from the cached
+embeddings.
+
+Usage: python scripts/rebalance_shards.py [--dry-run] [--user USER_ID ...]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Sequence, Set
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import delete, func, select, text, union  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+from app.core import database  # noqa: E402
+from app.core.database import dialect_insert, init_db, shard_for  # noqa: E402
+from app.models.content import ContentBlob, ContentEmbedding  # noqa: E402
+from app.models.journal import (  # noqa: E402
+    Goal,
+    JournalEntry,
+    JournalEntryTag,
+    MoodLog,
+    SyncTombstone,
+)
+from app.models.risk import RiskEvent, RiskEventArchive  # noqa: E402
+from app.services.embeddings import reindex_user  # noqa: E402
+from app.services.journal import _get_or_create_tags, normalize_tags  # noqa: E402
+from app.services.retention import _collect_orphaned_content  # noqa: E402
+
+
+USER_TABLES = (JournalEntry, MoodLog, Goal, RiskEvent, RiskEventArchive, SyncTombstone)
+
+
+def journal_key(row) -> tuple:
+    return (row.created_at, row.content_hash, row.title)
+
+
+def mood_key(row) -> tuple:
+    return (row.created_at, row.mood, row.intensity)
+
+
+def event_key(row) -> tuple:
+    return (row.created_at, row.source, row.content_hash)
+
+
+async def misplaced_users(session: AsyncSession, shard: int) -> List[str]:
+    users = union(*(select(model.user_id) for model in USER_TABLES))
+    result = await session.execute(select(users.subquery().c[0]))
+    return sorted(user for user in result.scalars() if shard_for(user) != shard)
+
+
+async def fetch(session: AsyncSession, model, user_id: str) -> list:
+    result = await session.execute(select(model).where(model.user_id == user_id))
+    return list(result.scalars().all())
+
+
+async def copy_content(source: AsyncSession, target: AsyncSession, hashes: Set[str]) -> None:
+    if not hashes:
+        return
+    for model, key in (
+        (ContentBlob, ContentBlob.hash),
+        (ContentEmbedding, ContentEmbedding.content_hash),
+    ):
+        result = await source.execute(select(model).where(key.in_(hashes)))
+        rows = [row.model_dump() for row in result.scalars().all()]
+        if rows:
+            statement = dialect_insert(target, model).values(rows)
+            await target.execute(statement.on_conflict_do_nothing())
+
+
+async def taken_ids(target: AsyncSession, model, rows: list) -> Set[int]:
+    """
+    Ids of ``rows`` already used on ``target``, necessarily by other rows.
+    """
+    if not rows:
+        return set()
+    ids = [row.id for row in rows]
+    result = await target.execute(select(model.id).where(model.id.in_(ids)))
+    return set(result.scalars().all())
+
+
+def split_by_id(model, rows: list, taken: Set[int], now: datetime) -> tuple:
+    """
+    Copies of ``rows`` for the target: those keeping their id, then renumbered ones.
+    """
+    kept = [model(**row.model_dump()) for row in rows if row.id not in taken]
+    renumbered = [
+        model(**row.model_dump(exclude={"id", "updated_at"}), updated_at=now)
+        for row in rows
+        if row.id in taken
+    ]
+    return kept, renumbered
+
+
+def stale_ids(rows: list, have: Dict[tuple, int], key, taken: Set[int]) -> List[int]:
+    """
+    Source ids a client may hold that will not name the same row on the target.
+    """
+    return [row.id for row in rows if have.get(key(row), row.id) != row.id or row.id in taken]
+
+
+async def advance_sequences(target: AsyncSession, models: Sequence) -> None:
+    """
+    Move Postgres id sequences past explicitly inserted ids; SQLite needs nothing.
+    """
+    if target.bind.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__tablename__
+        highest = await target.scalar(select(func.max(model.id)))
+        if highest is not None:
+            await target.execute(
+                text("SELECT setval(pg_get_serial_sequence(:table, 'id'), :highest)"),
+                {"table": table, "highest": highest},
+            )
+
+
+async def move_user(source: AsyncSession, target: AsyncSession, user_id: str) -> Dict[str, int]:
+    source_entries = entries = await fetch(source, JournalEntry, user_id)
+    source_moods = moods = await fetch(source, MoodLog, user_id)
+    goals = await fetch(source, Goal, user_id)
+    events = await fetch(source, RiskEvent, user_id)
+    events += await fetch(source, RiskEventArchive, user_id)
+    tombstones = await fetch(source, SyncTombstone, user_id)
+
+    have_entries = {journal_key(row): row.id for row in await fetch(target, JournalEntry, user_id)}
+    have_moods = {mood_key(row): row.id for row in await fetch(target, MoodLog, user_id)}
+    have_events = {event_key(row) for row in await fetch(target, RiskEvent, user_id)}
+    have_events |= {event_key(row) for row in await fetch(target, RiskEventArchive, user_id)}
+
+    entries = [row for row in entries if journal_key(row) not in have_entries]
+    moods = [row for row in moods if mood_key(row) not in have_moods]
+    events = [row for row in events if event_key(row) not in have_events]
+
+    hashes = {row.content_hash for row in entries} | {row.content_hash for row in events}
+    await copy_content(source, target, hashes)
+    now = datetime.utcnow()
+    taken_entries = await taken_ids(target, JournalEntry, entries)
+    taken_moods = await taken_ids(target, MoodLog, moods)
+    kept_entries, new_entries = split_by_id(JournalEntry, entries, taken_entries, now)
+    kept_moods, new_moods = split_by_id(MoodLog, moods, taken_moods, now)
+    # Insert the kept ids first so no fresh id can claim one of them.
+    target.add_all(kept_entries + kept_moods)
+    await target.flush()
+    await advance_sequences(target, (JournalEntry, MoodLog))
+    target.add_all(new_entries + new_moods)
+    target.add_all(
+        RiskEvent(**row.model_dump(exclude={"id", "archived_at"})) for row in events
+    )
+    # Tell sync clients to drop ids that do not follow their rows to the target.
+    stale = {
+        "entries": stale_ids(source_entries, have_entries, journal_key, taken_entries),
+        "moods": stale_ids(source_moods, have_moods, mood_key, taken_moods),
+    }
+    tombstones += [
+        SyncTombstone(user_id=user_id, kind=kind, row_id=row_id, deleted_at=now)
+        for kind, row_ids in stale.items()
+        for row_id in row_ids
+    ]
+    have_tombstones = {
+        (row.kind, row.row_id) for row in await fetch(target, SyncTombstone, user_id)
+    }
+    target.add_all(
+        SyncTombstone(**row.model_dump(exclude={"id"}))
+        for row in tombstones
+        if (row.kind, row.row_id) not in have_tombstones
+    )
+    await target.flush()
+    copies = kept_entries + new_entries
+    for copy in copies:
+        names = normalize_tags(copy.tags)
+        if names:
+            tag_ids = await _get_or_create_tags(target, names)
+            target.add_all(
+                JournalEntryTag(entry_id=copy.id, tag_id=tag_id, user_id=user_id)
+                for tag_id in tag_ids
+            )
+    if goals:
+        # Goals edited on the new shard since the switch win over the old copies.
+        statement = dialect_insert(target, Goal).values(
+            [row.model_dump(exclude={"id"}) for row in goals]
+        )
+        await target.execute(
+            statement.on_conflict_do_nothing(index_elements=[Goal.user_id, Goal.description])
+        )
+    await target.commit()
+
+    await source.execute(delete(JournalEntryTag).where(JournalEntryTag.user_id == user_id))
+    for model in USER_TABLES:
+        await source.execute(delete(model).where(model.user_id == user_id))
+    await source.commit()
+    return {
+        "entries": len(entries),
+        "moods": len(moods),
+        "goals": len(goals),
+        "events": len(events),
+        "renumbered": len(new_entries) + len(new_moods),
+    }
+
+
+async def rebalance(dry_run: bool, only: Sequence[str]) -> None:
+    await init_db()
+    engines = database.engines
+    plan: Dict[int, List[str]] = defaultdict(list)
+    for index, engine in enumerate(engines):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            users = await misplaced_users(session, index)
+        plan[index] = [user for user in users if not only or user in only]
+
+    for index, users in plan.items():
+        for user_id in users:
+            owner = shard_for(user_id)
+            print(f"{user_id}: shard {index} -> {owner}")
+            if dry_run:
+                continue
+            source = AsyncSession(engines[index], expire_on_commit=False)
+            target = AsyncSession(engines[owner], expire_on_commit=False)
+            async with source, target:
+                moved = await move_user(source, target, user_id)
+                print(f"  moved {moved}")
+                await reindex_user(engines[owner], user_id, rebuild=True)
+        if users and not dry_run:
+            async with AsyncSession(engines[index], expire_on_commit=False) as session:
+                await _collect_orphaned_content(session, batch_size=500, pause=0)
+
+    total = sum(len(users) for users in plan.values())
+    print(f"{total} user(s) {'to move' if dry_run else 'moved'} across {len(engines)} shard(s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="Only print the moves.")
+    parser.add_argument("--user", action="append", default=[], help="Limit to these user ids.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    asyncio.run(rebalance(args.dry_run, args.user))
+
+
+if __name__ == "__main__":
+    main()
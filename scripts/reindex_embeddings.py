@@ -0,0 +1,63 @@
+"""Add journal entries missing from the similarity index.
+
+Entries written before the embedding index existed, or whose background
+embedding failed (e.g. while Ollama or the embedding model was unavailable),
+are never searchable.  This script embeds and indexes them; entries already in
+the index are skipped, so it is safe to run repeatedly.  ``--rebuild`` drops
+each user's index first, e.g. after changing OLLAMA_EMBEDDING_MODEL.
+
+Usage: python scripts/reindex_embeddings.py [--rebuild] [--user USER_ID ...]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Sequence
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+from app.core import database  # noqa: E402
+from app.core.database import init_db  # noqa: E402
+from app.models.journal import JournalEntry  # noqa: E402
+from app.services.embeddings import reindex_user  # noqa: E402
+
+
+async def reindex(rebuild: bool, only: Sequence[str]) -> None:
+    await init_db()
+    added = failed = 0
+    for index, engine in enumerate(database.engines):
+        async with AsyncSession(engine) as session:
+            result = await session.execute(select(JournalEntry.user_id).distinct())
+            users = sorted(user for user in result.scalars() if not only or user in only)
+        for user_id in users:
+            try:
+                count = await reindex_user(engine, user_id, rebuild=rebuild)
+            except Exception as exc:
+                # Keep going: a later run picks up whatever is still missing.
+                print(f"{user_id}: failed ({exc})")
+                failed += 1
+                continue
+            if count:
+                print(f"{user_id} (shard {index}): {count} entries indexed")
+            added += count
+    print(f"{added} entries indexed, {failed} user(s) failed")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rebuild", action="store_true", help="Drop each index first.")
+    parser.add_argument("--user", action="append", default=[], help="Limit to these user ids.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    asyncio.run(reindex(args.rebuild, args.user))
+
+
+if __name__ == "__main__":
+    main()
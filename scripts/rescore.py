@@ -0,0 +1,41 @@
+"""Re-score stored journal entries and risk events with the current risk config.
+
+Safe to interrupt: progress is checkpointed per chunk and the next run resumes.
+
+Usage: python scripts/rescore.py [--chunk-size 500] [--workers 8]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.database import init_db  # noqa: E402
+from app.services.rescoring import rescore_history  # noqa: E402
+from app.services.risk import scoring_version  # noqa: E402
+
+
+async def run(chunk_size: int | None, workers: int | None) -> None:
+    await init_db()
+    counts = await rescore_history(chunk_size=chunk_size, workers=workers)
+    for table, count in counts.items():
+        print(f"{table}: {count} rows re-scored")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    print(f"Target scoring version: {scoring_version()}")
+    asyncio.run(run(args.chunk_size, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Tests for columnar analytics snapshots and the cohort report.
+"""
+import asyncio
+from datetime import date, datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import SQLModel
+
+from app.api import routes_admin
+from app.core.database import shard_for
+from app.core.locks import file_lock
+from app.main import app
+from app.models.journal import JournalEntry, MoodLog
+from app.models.risk import RiskEvent, RiskEventArchive
+from app.services import analytics
+from app.services.analytics import (
+    cohort_report,
+    export_snapshot,
+    latest_cohort_report,
+    load_latest_snapshot,
+)
+from app.services.content import store_content
+
+
+def _event(model, user_id: str, level: str, source: str, created_at: datetime, **extra):
+    return model(
+        user_id=user_id,
+        source=source,
+        content_hash="0" * 64,
+        risk_level=level,
+        risk_score=0.9 if level == "high" else 0.1,
+        sentiment=0.0,
+        created_at=created_at,
+        **extra,
+    )
+
+
+async def _shard(rows) -> object:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        session.add_all(rows)
+        await session.commit()
+    return engine
+
+
+async def _scenario(root):
+    may, june = datetime(2024, 5, 10), datetime(2024, 6, 3)
+    first = await _shard(
+        [
+            _event(RiskEvent, "u1", "high", "chat", may),
+            _event(RiskEvent, "u1", "low", "chat", may),
+            _event(RiskEvent, "u1", "low", "journal", june),
+            _event(RiskEventArchive, "u1", "moderate", "journal", may, id=99),
+            MoodLog(user_id="u1", mood="anxious", intensity=8, created_at=may),
+            MoodLog(user_id="u1", mood="calm", intensity=4, created_at=may),
+        ]
+    )
+    second = await _shard(
+        [
+            _event(RiskEvent, "u2", "high", "journal", june),
+            MoodLog(user_id="u2", mood="calm", intensity=3, created_at=june),
+        ]
+    )
+    async with AsyncSession(second) as session:
+        digest = await store_content(session, "A long day.")
+        session.add(
+            JournalEntry(
+                user_id="u2", title="Day", content_hash=digest, risk_score=0.2, created_at=june
+            )
+        )
+        await session.commit()
+
+    await export_snapshot(engines=[first, second], root=root)
+    return await export_snapshot(engines=[first, second], root=root)
+
+
+def test_snapshot_report_aggregates_every_shard(tmp_path):
+    meta = asyncio.run(_scenario(tmp_path))
+    assert meta["tables"]["risk_events"]["rows"] == 5
+    snapshot = load_latest_snapshot(tmp_path)
+    assert snapshot.meta["id"] == meta["id"]
+
+    report = cohort_report(snapshot)
+    assert report["months"] == ["2024-05", "2024-06"]
+    assert report["risk_levels"]["2024-05"] == {"low": 1, "moderate": 1, "high": 1}
+    assert report["risk_levels"]["2024-06"] == {"low": 1, "moderate": 0, "high": 1}
+    assert report["active_users"] == {"2024-05": 1, "2024-06": 2}
+    assert report["high_risk_rate_by_source"]["journal"] == {"events": 3, "high": 1, "rate": 1 / 3}
+    assert report["mood_trends"]["2024-05"] == {"count": 2, "mean_intensity": 6.0}
+    assert report["journal_entries"] == {"2024-06": 1}
+
+    june_only = cohort_report(snapshot, since=date(2024, 6, 1))
+    assert list(june_only["risk_levels"]) == ["2024-06"]
+    assert "chat" not in june_only["high_risk_rate_by_source"]
+
+
+async def _moving_rows(root):
+    may = datetime(2024, 5, 10)
+    mover = next(f"user-{index}" for index in range(100) if shard_for(f"user-{index}", 2) == 1)
+    moved_mood = dict(user_id=mover, mood="calm", intensity=5, created_at=may)
+    old = await _shard(
+        [
+            # Retention archived event 1 between the hot and archive reads.
+            _event(RiskEvent, "resident", "low", "chat", may),
+            _event(RiskEventArchive, "resident", "low", "chat", may, id=1),
+            # A rebalance copied the mover to shard 1 but has not deleted these yet.
+            MoodLog(**moved_mood),
+            MoodLog(user_id=mover, mood="sad", intensity=2, created_at=may),
+        ]
+    )
+    new = await _shard([MoodLog(**moved_mood)])
+    return await export_snapshot(engines=[old, new], root=root)
+
+
+def test_snapshot_counts_rows_moved_during_an_export_once(tmp_path):
+    meta = asyncio.run(_moving_rows(tmp_path))
+    assert meta["tables"]["risk_events"]["rows"] == 1
+    assert meta["tables"]["moods"]["rows"] == 2
+
+
+def test_report_survives_pruning_and_snapshot_endpoint_refuses_overlap(monkeypatch, tmp_path):
+    asyncio.run(_scenario(tmp_path))
+    stale = load_latest_snapshot(tmp_path)
+    stale.path = tmp_path / "pruned"  # as if an export removed it mid-read
+    snapshots = iter([stale, load_latest_snapshot(tmp_path)])
+    monkeypatch.setattr(analytics, "load_latest_snapshot", lambda root: next(snapshots))
+    assert latest_cohort_report(tmp_path)["journal_entries"] == {"2024-06": 1}
+
+    exports = []
+
+    async def fake_export():
+        exports.append(1)
+
+    monkeypatch.setattr(routes_admin, "export_snapshot", fake_export)
+    client = TestClient(app)
+    assert client.post("/api/admin/analytics/snapshot").status_code == 202
+    assert exports == [1]
+    monkeypatch.setattr(routes_admin, "export_running", lambda: True)
+    assert client.post("/api/admin/analytics/snapshot").status_code == 409
+    assert exports == [1]
+
+
+def test_export_refuses_to_run_while_another_worker_holds_the_directory(tmp_path):
+    assert not analytics.is_running(tmp_path)
+    with file_lock(tmp_path / analytics.EXPORT_LOCK):  # another worker's export
+        assert analytics.is_running(tmp_path)
+        with pytest.raises(analytics.ExportInProgress):
+            asyncio.run(export_snapshot(engines=[], root=tmp_path))
+    assert not analytics.is_running(tmp_path)
@@ -0,0 +1,114 @@
+"""
+Tests for the on-disk embedding index.
+"""
+import asyncio
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import SQLModel
+
+from app.services import embeddings
+from app.services.embeddings import (
+    EmbeddingIndex,
+    index_entry,
+    reindex_user,
+    set_embedder,
+    similar_entries,
+)
+from app.main import app
+from app.services.journal import create_journal_entry
+from app.services.ollama import OllamaUnavailable
+
+
+def test_embedding_index_ranks_by_cosine_similarity(tmp_path):
+    index = EmbeddingIndex(tmp_path, model="stand-in")
+
+    async def populate():
+        await index.add("u1", 1, np.array([1.0, 0.0, 0.0]))
+        await index.add("u1", 2, np.array([0.7, 0.7, 0.0]))
+        await index.add("u1", 3, np.array([0.0, 0.0, 5.0]))
+        await index.add("u2", 4, np.array([1.0, 0.0, 0.0]))
+
+    asyncio.run(populate())
+
+    matches = index.search("u1", np.array([2.0, 0.1, 0.0]), k=2)
+    assert [entry_id for entry_id, _ in matches] == [1, 2]
+    assert matches[0][1] > 0.99
+
+    excluded = index.search("u1", np.array([1.0, 0.0, 0.0]), k=5, exclude=[1])
+    assert [entry_id for entry_id, _ in excluded] == [2, 3]
+    assert index.search("nobody", np.array([1.0, 0.0, 0.0]), k=3) == []
+
+
+VOCABULARY = ("sleep", "night", "work", "deadline", "family")
+
+
+async def bag_of_words(text: str):
+    words = text.lower().split()
+    return [float(sum(word.startswith(term) for word in words)) + 0.01 for term in VOCABULARY]
+
+
+async def _journal_with_index():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    texts = [
+        "Could not sleep again last night",
+        "Work deadline is crushing me",
+        "Another night without sleep",
+        "Dinner with family",
+    ]
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        entries = [
+            await create_journal_entry(
+                session, user_id="u1", title=str(i), content=text, tags=None, risk_score=0.1
+            )
+            for i, text in enumerate(texts)
+        ]
+    for entry, text in zip(entries[:3], texts):  # the last entry's embed "failed"
+        await index_entry(
+            entry_id=entry.id,
+            user_id="u1",
+            content_hash=entry.content_hash,
+            text=text,
+            engine=engine,
+        )
+
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        by_text = await similar_entries(session, "u1", text="sleep at night", k=2)
+        by_entry = await similar_entries(session, "u1", entry_id=entries[0].id, k=1)
+        backfilled = await reindex_user(engine, "u1")
+        again = await reindex_user(engine, "u1")
+        family = await similar_entries(session, "u1", text="family", k=1)
+    await engine.dispose()
+    return entries, by_text, by_entry, (backfilled, again), family
+
+
+def test_index_and_search_journal_entries_through_the_embedder(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "_index", EmbeddingIndex(tmp_path, model="stand-in"))
+    set_embedder(bag_of_words)
+    try:
+        entries, by_text, by_entry, reindexed, family = asyncio.run(_journal_with_index())
+    finally:
+        set_embedder(None)
+
+    sleepless = {entries[0].id, entries[2].id}
+    assert {entry["id"] for entry in by_text} == sleepless
+    assert by_text[0]["similarity"] >= by_text[1]["similarity"]
+    assert [entry["id"] for entry in by_entry] == [entries[2].id]
+    assert by_entry[0]["content"] == "Another night without sleep"
+    assert reindexed == (1, 0)
+    assert [entry["id"] for entry in family] == [entries[3].id]
+
+
+def test_similar_text_search_answers_503_while_ollama_is_down():
+    async def unavailable(text):
+        raise OllamaUnavailable("Ollama circuit breaker embed:stand-in is open")
+
+    set_embedder(unavailable)
+    try:
+        response = TestClient(app).get("/api/journal/u1/similar", params={"text": "can't sleep"})
+    finally:
+        set_embedder(None)
+    assert response.status_code == 503
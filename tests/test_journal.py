@@ -0,0 +1,210 @@
+"""
+Unit tests for journaling helpers.
+"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import SQLModel
+from starlette.routing import Match
+
+from app.api.routes_journal import router
+from app.models.journal import Goal, JournalEntry
+from app.services.content import load_contents, migrate_legacy_content, store_content
+from app.services.journal import (
+    backfill_entry_tags,
+    count_tags,
+    create_journal_entry,
+    list_journal_entries,
+    normalize_tags,
+    upsert_goal,
+    upsert_goals,
+)
+
+
+def test_normalize_tags_lowercases_and_deduplicates():
+    assert normalize_tags("Anxiety, work,, WORK ,sleep") == ["anxiety", "work", "sleep"]
+
+
+def test_normalize_tags_handles_missing_tags():
+    assert normalize_tags(None) == []
+    assert normalize_tags(" , ") == []
+
+
+async def _sync_plan():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        first = await upsert_goal(
+            session, user_id="u1", description="Walk daily", status="in_progress", target_date=None
+        )
+        rows = await upsert_goals(
+            session,
+            user_id="u1",
+            goals=[
+                {"description": "Walk daily", "status": "done"},
+                {"description": "Sleep by 11", "status": "in_progress"},
+                {"description": "Sleep by 11", "status": "paused"},
+            ],
+        )
+        count = await session.scalar(select(func.count()).select_from(Goal))
+    await engine.dispose()
+    return first, rows, count
+
+
+def test_upsert_goals_updates_by_description_in_one_statement():
+    first, rows, count = asyncio.run(_sync_plan())
+    assert count == 2
+    assert [(row.description, row.status) for row in rows] == [
+        ("Walk daily", "done"),
+        ("Sleep by 11", "paused"),
+    ]
+    assert rows[0].id == first.id
+    assert rows[0].created_at == first.created_at
+
+
+async def _tagged_journal():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        for title, tags in (("a", "Sleep, work"), ("b", "sleep"), ("c", "work,family")):
+            await create_journal_entry(
+                session, user_id="u1", title=title, content=title, tags=tags, risk_score=0.1
+            )
+        await create_journal_entry(
+            session, user_id="u2", title="d", content="d", tags="sleep", risk_score=0.1
+        )
+        facets = await count_tags(session, "u1")
+        both = await list_journal_entries(session, "u1", tags=["work", "SLEEP"])
+        sleep = await list_journal_entries(session, "u1", tags=["sleep"])
+
+        async def broken_tags(*args, **kwargs):
+            raise RuntimeError("tag table unavailable")
+
+        with patch("app.services.journal._get_or_create_tags", broken_tags):
+            with pytest.raises(RuntimeError):
+                await create_journal_entry(
+                    session, user_id="u1", title="e", content="e", tags="lost", risk_score=0.1
+                )
+        entries = await session.scalar(
+            select(func.count()).select_from(JournalEntry).where(JournalEntry.user_id == "u1")
+        )
+    await engine.dispose()
+    return facets, both, sleep, entries
+
+
+def test_tag_facets_filter_and_atomic_entry_write():
+    facets, both, sleep, entries = asyncio.run(_tagged_journal())
+    assert facets == [("sleep", 2), ("work", 2), ("family", 1)]
+    assert [entry["title"] for entry in both] == ["a"]
+    assert sorted(entry["title"] for entry in sleep) == ["a", "b"]
+    assert entries == 3  # the entry whose tags failed was rolled back with them
+
+
+def test_user_subresource_routes_do_not_shadow_literal_paths():
+    def endpoint(path):
+        scope = {"type": "http", "method": "GET", "path": path}
+        for route in router.routes:
+            match, _ = route.matches(scope)
+            if match is Match.FULL:
+                return route.endpoint.__name__
+
+    assert endpoint("/journal/mood/tags") == "list_mood_endpoint"
+    assert endpoint("/journal/goals/sync") == "list_goals_endpoint"
+    assert endpoint("/journal/mood/similar") == "list_mood_endpoint"
+    assert endpoint("/journal/mood/tags") == "list_mood_endpoint"
+    assert endpoint("/journal/u1/tags") == "list_tag_facets"
+    assert endpoint("/journal/tags/sync") == "sync_changes"
+    assert endpoint("/journal/u1/sync") == "sync_changes"
+
+
+async def _legacy_tags():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        digest = await store_content(session, "old")
+        # Written before tags were normalized: only the text column is set.
+        session.add(JournalEntry(user_id="u1", title="a", content_hash=digest, tags="Sleep, work"))
+        session.add(JournalEntry(user_id="u1", title="b", content_hash=digest, tags="sleep"))
+        session.add(JournalEntry(user_id="u1", title="c", content_hash=digest))
+        await session.commit()
+        first = await backfill_entry_tags(session, batch_size=1)
+        again = await backfill_entry_tags(session)
+        facets = await count_tags(session, "u1")
+    await engine.dispose()
+    return first, again, facets
+
+
+def test_backfill_links_entries_written_before_tag_tables():
+    first, again, facets = asyncio.run(_legacy_tags())
+    assert (first, again) == (2, 0)
+    assert facets == [("sleep", 2), ("work", 1)]
+
+
+async def _pre_blob_database(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        # The journal and risk tables as they were before the content store.
+        await conn.execute(
+            text(
+                "CREATE TABLE journalentry (id INTEGER PRIMARY KEY, user_id VARCHAR NOT NULL,"
+                " title VARCHAR NOT NULL, content VARCHAR NOT NULL, tags VARCHAR,"
+                " risk_score FLOAT NOT NULL, created_at DATETIME NOT NULL)"
+            )
+        )
+        await conn.execute(text("CREATE INDEX ix_journalentry_user_id ON journalentry (user_id)"))
+        await conn.execute(
+            text(
+                "CREATE TABLE riskevent (id INTEGER PRIMARY KEY, user_id VARCHAR NOT NULL,"
+                " source VARCHAR NOT NULL, content VARCHAR NOT NULL, risk_level VARCHAR NOT NULL,"
+                " risk_score FLOAT NOT NULL, sentiment FLOAT NOT NULL, keywords VARCHAR,"
+                " created_at DATETIME NOT NULL)"
+            )
+        )
+        for entry_id, body in [(3, "Slept badly."), (7, "A calmer day."), (9, "Slept badly.")]:
+            await conn.execute(
+                text(
+                    "INSERT INTO journalentry VALUES"
+                    " (:id, 'u1', 'Day', :body, 'sleep', 0.1, '2024-05-10 08:00:00.000000')"
+                ),
+                {"id": entry_id, "body": body},
+            )
+        await conn.execute(
+            text(
+                "INSERT INTO riskevent VALUES"
+                " (4, 'u1', 'journal', 'Slept badly.', 'low', 0.1, 0.0, NULL,"
+                " '2024-05-10 08:00:00.000000')"
+            )
+        )
+    copied = await migrate_legacy_content(engine, batch_size=2)
+    again = await migrate_legacy_content(engine)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        result = await session.execute(select(JournalEntry).order_by(JournalEntry.id))
+        entries = result.scalars().all()
+        bodies = await load_contents(session, (entry.content_hash for entry in entries))
+        created = await create_journal_entry(
+            session, user_id="u1", title="New", content="Fine.", tags=None, risk_score=0.0
+        )
+    await engine.dispose()
+    return copied, again, entries, bodies, created
+
+
+def test_migration_moves_pre_blob_text_into_the_content_store(tmp_path):
+    copied, again, entries, bodies, created = asyncio.run(
+        _pre_blob_database(tmp_path / "calmmind.db")
+    )
+    assert copied == {"journalentry": 3, "riskevent": 1}
+    assert again == {}
+    assert [entry.id for entry in entries] == [3, 7, 9]
+    assert [bodies[entry.content_hash] for entry in entries] == [
+        "Slept badly.",
+        "A calmer day.",
+        "Slept badly.",
+    ]
+    assert entries[0].updated_at == entries[0].created_at
+    assert created.id == 10
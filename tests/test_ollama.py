@@ -0,0 +1,171 @@
+"""
+Tests for Ollama client helpers.
+"""
+import asyncio
+from datetime import datetime
+
+import httpx
+
+from app.core.config import get_settings
+from app.services import ollama
+from app.services.ollama import (
+    CircuitBreaker,
+    OllamaClient,
+    OllamaUnavailable,
+    _generation_stats,
+    _within_keep_warm_hours,
+    coalesce_tokens,
+)
+
+
+def test_generation_stats_flags_cold_loads():
+    assert _generation_stats({"load_duration": 3_000_000_000})["warm"] is False
+    assert _generation_stats({"load_duration": 2_000_000, "total_duration": 9_000_000}) == {
+        "warm": True,
+        "load_ms": 2.0,
+        "total_ms": 9.0,
+    }
+
+
+def test_keep_warm_hours_can_span_midnight(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "ollama_keep_warm_start_hour", 22)
+    monkeypatch.setattr(settings, "ollama_keep_warm_end_hour", 6)
+    assert _within_keep_warm_hours(datetime(2024, 1, 1, 23))
+    assert _within_keep_warm_hours(datetime(2024, 1, 1, 5))
+    assert not _within_keep_warm_hours(datetime(2024, 1, 1, 12))
+
+
+async def _collect(tokens, delays, **limits):
+    async def source():
+        for token, delay in zip(tokens, delays):
+            await asyncio.sleep(delay)
+            yield token
+
+    return [chunk async for chunk in coalesce_tokens(source(), **limits)]
+
+
+def test_coalesce_tokens_flushes_first_token_then_batches_by_size():
+    tokens = ["Hi", " there", " how", " are", " you"]
+    chunks = asyncio.run(_collect(tokens, [0] * 5, max_delay=10, max_bytes=9))
+    assert chunks == ["Hi", " there how", " are you"]
+
+
+def test_coalesce_tokens_flushes_when_the_model_stalls():
+    tokens = ["a", "b", "c", "d"]
+    chunks = asyncio.run(_collect(tokens, [0, 0, 0, 0.2], max_delay=0.05, max_bytes=1024))
+    assert chunks == ["a", "bc", "d"]
+
+
+def test_circuit_breaker_opens_on_failures_and_probes_after_reset():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        failure_threshold=2, slow_call_seconds=1.0, reset_seconds=30, clock=lambda: now[0]
+    )
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success(elapsed=5.0)  # too slow: counts as a failure
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 31.0
+    assert breaker.allow()  # one trial call
+    assert not breaker.allow()
+    breaker.record_success(elapsed=0.2)
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_keep_warm_loop_survives_unexpected_errors(monkeypatch):
+    calls = []
+
+    async def broken_warm_model():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("unexpected payload")
+        raise asyncio.CancelledError  # stop the loop on the second ping
+
+    monkeypatch.setattr(ollama, "warm_model", broken_warm_model)
+    monkeypatch.setattr(ollama, "_within_keep_warm_hours", lambda now: True)
+    try:
+        asyncio.run(ollama.keep_model_warm(0))
+    except asyncio.CancelledError:
+        pass
+    assert len(calls) == 2
+
+
+def test_coalesce_tokens_closes_its_source_when_abandoned():
+    closed = []
+
+    async def source():
+        try:
+            yield "first"
+            await asyncio.sleep(10)  # the model is still generating
+            yield "never"
+        finally:
+            closed.append(True)
+
+    async def stop_after_first_chunk(cancel_read):
+        chunks = coalesce_tokens(source(), max_delay=0.01, max_bytes=1024)
+        assert await anext(chunks) == "first"
+        if cancel_read:
+            # Disconnect while a read is pending on the model.
+            reading = asyncio.ensure_future(anext(chunks))
+            await asyncio.sleep(0.05)
+            reading.cancel()
+            await asyncio.wait({reading})
+        else:
+            # Disconnect while the response is writing the first chunk.
+            await chunks.aclose()
+        return closed.copy()
+
+    assert asyncio.run(stop_after_first_chunk(cancel_read=False)) == [True]
+    closed.clear()
+    assert asyncio.run(stop_after_first_chunk(cancel_read=True)) == [True]
+
+
+def test_embedding_failures_do_not_open_the_chat_breaker(monkeypatch):
+    monkeypatch.setattr(ollama, "_breakers", {})
+
+    def handler(request):
+        if request.url.path == "/api/embeddings":
+            raise httpx.ConnectError("embedding model missing", request=request)
+        return httpx.Response(200, json={"response": "Still here."})
+
+    async def scenario():
+        client = OllamaClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        for _ in range(get_settings().ollama_breaker_failure_threshold):
+            try:
+                await client.embed("hello", model="stand-in")
+            except OllamaUnavailable:
+                pass
+        reply = await client.generate("hello")
+        await client.close()
+        return reply
+
+    assert asyncio.run(scenario()) == "Still here."
+    assert ollama.get_breaker("embed:stand-in").state == "open"
+
+
+def test_malformed_replies_count_as_breaker_failures(monkeypatch):
+    monkeypatch.setattr(ollama, "_breakers", {})
+
+    def handler(request):
+        if request.url.path == "/api/embeddings":
+            return httpx.Response(200, json={"error": "model is not an embedding model"})
+        return httpx.Response(200, text="<html>proxy error</html>")
+
+    async def scenario():
+        client = OllamaClient()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        failures = []
+        for call in (client.embed("hello", model="stand-in"), client.generate("hi")):
+            try:
+                await call
+            except OllamaUnavailable:
+                failures.append(True)
+        await client.close()
+        return failures
+
+    assert asyncio.run(scenario()) == [True, True]
+    assert ollama.get_breaker("embed:stand-in").failures == 1
+    assert ollama.get_breaker(f"generate:{get_settings().ollama_model}").failures == 1
@@ -0,0 +1,59 @@
+"""
+Tests for request profiling helpers.
+"""
+from fastapi.testclient import TestClient
+
+from app.api import routes_admin
+from app.core import profiling
+from app.core.config import get_settings
+from app.core.profiling import ProfileStore, RequestProfile, folded_stacks, span
+from app.main import app
+
+
+def test_spans_accumulate_only_inside_a_profiled_request():
+    with span("sql"):
+        pass  # no current profile: nothing to record
+
+    profile = RequestProfile("POST", "/api/chat", sampled=False, trigger="slow")
+    token = profiling._current.set(profile)
+    try:
+        with span("sql"):
+            pass
+        profiling.record("sql", 0.5)
+    finally:
+        profiling._current.reset(token)
+
+    assert profile.summary()["spans"]["sql"]["count"] == 2
+    assert profile.summary()["spans"]["sql"]["total_ms"] >= 500
+
+
+def test_profile_store_keeps_a_bounded_ring(tmp_path):
+    store = ProfileStore(tmp_path, max_profiles=2)
+    for index in range(3):
+        profile = RequestProfile("GET", f"/api/journal/u{index}", sampled=True, trigger="header")
+        profile.samples["main.py:handler;risk.py:assess_risk"] += 3
+        store.save(profile.to_dict(interval_ms=5.0))
+
+    summaries = store.list()
+    assert [summary["path"] for summary in summaries] == ["/api/journal/u2", "/api/journal/u1"]
+    assert "samples" not in summaries[0]
+    assert store.path(summaries[0]["id"]) is not None
+    assert store.path("../etc") is None
+    assert folded_stacks({"samples": {"a;b": 3}}) == "a;b 3\n"
+
+
+def test_profile_routes_require_the_admin_token(monkeypatch, tmp_path):
+    monkeypatch.setattr(routes_admin, "get_profile_store", lambda: ProfileStore(tmp_path, max_profiles=5))
+    client = TestClient(app)
+    settings = get_settings()
+
+    monkeypatch.setattr(settings, "admin_token", None)
+    assert client.get("/api/admin/profiles").status_code == 404
+
+    monkeypatch.setattr(settings, "admin_token", "s3cret")
+    assert client.get("/api/admin/profiles").status_code == 401
+    wrong = client.get("/api/admin/profiles/abc", headers={"Authorization": "Bearer nope"})
+    assert wrong.status_code == 401
+    assert client.get("/api/admin/profiles", headers={"Authorization": "Bearer s3cret"}).json() == []
+    missing = client.get("/api/admin/profiles/abc", headers={"X-CalmMind-Profile": "s3cret"})
+    assert missing.status_code == 404
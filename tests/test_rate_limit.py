@@ -0,0 +1,108 @@
+"""
+Tests for token-bucket rate limiting.
+"""
+import asyncio
+import json
+
+from starlette.datastructures import State
+
+from app.core.config import Settings
+from app.core.rate_limit import (
+    BucketPolicy,
+    MemoryBucketStore,
+    RateLimitMiddleware,
+    classify,
+    rate_limited,
+)
+
+
+def test_memory_bucket_refills_over_time():
+    now = [0.0]
+    store = MemoryBucketStore(clock=lambda: now[0])
+    policy = BucketPolicy(capacity=2, refill_per_second=1.0)
+
+    async def take():
+        return await store.take("llm:user:u1", policy)
+
+    assert asyncio.run(take()).allowed
+    assert asyncio.run(take()).remaining == 0
+    denied = asyncio.run(take())
+    assert not denied.allowed and denied.retry_after == 1
+
+    now[0] = 1.5
+    assert asyncio.run(take()).allowed
+
+
+def test_classify_routes_into_bucket_families():
+    assert classify("POST", "/api/chat", "/api") == "llm"
+    assert classify("POST", "/api/chat/stream", "/api") == "llm"
+    assert classify("POST", "/api/journal", "/api") == "write"
+    assert classify("GET", "/api/admin/risk-events", "/api") == "admin"
+    assert classify("GET", "/api/journal/u1/similar", "/api") == "llm"
+    assert classify("GET", "/api/journal/u1", "/api") is None
+    assert classify("GET", "/health", "/api") is None
+
+
+async def _call(middleware, path, user_id, client_ip):
+    seen, sent = [], []
+    body = json.dumps({"user_id": user_id, "message": "hi"}).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    async def app(scope, receive, send):
+        seen.append(rate_limited(State(scope.get("state", {}))))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    middleware.app = app
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "headers": [(b"content-type", b"application/json")],
+        "client": (client_ip, 1234),
+    }
+    await middleware(scope, receive, send)
+    return (seen[0] if seen else "rejected"), sent[0]["status"]
+
+
+def test_buckets_are_per_client_and_chat_defers_its_429():
+    settings = Settings(rate_limit_llm_per_minute=1, rate_limit_write_per_minute=1)
+    middleware = RateLimitMiddleware(None, settings=settings, store=MemoryBucketStore())
+
+    async def scenario():
+        return [
+            await _call(middleware, "/api/chat", "victim", "10.0.0.1"),
+            # Another address cannot spend the victim's budget by naming them.
+            await _call(middleware, "/api/chat", "victim", "10.0.0.2"),
+            # Over the limit, chat still reaches its route to log the risk.
+            await _call(middleware, "/api/chat", "victim", "10.0.0.1"),
+            await _call(middleware, "/api/journal", "victim", "10.0.0.1"),
+            await _call(middleware, "/api/journal", "victim", "10.0.0.1"),
+        ]
+
+    first, other_ip, deferred, write, rejected = asyncio.run(scenario())
+    assert first == (None, 200)
+    assert other_ip == (None, 200)
+    assert deferred[0] >= 1 and deferred[1] == 200
+    assert write == (None, 200)
+    assert rejected == ("rejected", 429)
+
+
+def test_global_llm_bucket_caps_traffic_from_many_addresses():
+    settings = Settings(rate_limit_llm_per_minute=5, rate_limit_llm_global_per_minute=2)
+    middleware = RateLimitMiddleware(None, settings=settings, store=MemoryBucketStore())
+
+    async def scenario():
+        return [
+            await _call(middleware, path, f"user-{index}", f"10.0.0.{index}")
+            for index, path in enumerate(["/api/chat", "/api/chat", "/api/chat", "/api/journal"])
+        ]
+
+    first, second, third, write = asyncio.run(scenario())
+    assert first == (None, 200) and second == (None, 200)
+    assert third[0] >= 1  # deferred 429: the shared budget is spent
+    assert write == (None, 200)  # other families have no global bucket
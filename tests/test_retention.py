@@ -0,0 +1,181 @@
+"""
+Tests for risk event retention and archival.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import SQLModel
+
+from app.api import routes_admin
+from app.core.config import RetentionRule, get_settings
+from app.main import app
+from app.models.content import ContentBlob
+from app.models.risk import RiskEvent, RiskEventArchive
+from app.services.alerts import list_risk_events
+from app.services.content import store_content
+from app.services import retention
+from app.services.retention import _collect_orphaned_content, run_retention
+
+
+NOW = datetime(2024, 6, 1)
+RULES = [
+    RetentionRule(source="journal", level="high"),
+    RetentionRule(level="high", archive_after_days=30),
+    RetentionRule(level="low", archive_after_days=7, purge_after_days=90),
+]
+
+
+async def _event(session, level: str, age_days: int, source: str = "chat") -> RiskEvent:
+    return RiskEvent(
+        user_id="u1",
+        source=source,
+        content_hash=await store_content(session, f"{level} message from {age_days} days ago"),
+        risk_level=level,
+        risk_score=0.5,
+        sentiment=-0.2,
+        created_at=NOW - timedelta(days=age_days),
+    )
+
+
+async def _scenario():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        session.add_all(
+            [
+                await _event(session, "high", 60, source="journal"),  # exempt by the first rule
+                await _event(session, "high", 60),  # archived
+                await _event(session, "high", 5),  # stays hot
+                await _event(session, "low", 30),  # archived
+                await _event(session, "low", 120),  # purged
+                await _event(session, "moderate", 400),  # no rule, kept hot
+            ]
+        )
+        await session.commit()
+
+    counts = await run_retention(engine=engine, rules=RULES, now=NOW)
+
+    async with AsyncSession(engine) as session:
+        hot = await session.scalar(select(func.count()).select_from(RiskEvent))
+        cold = await session.scalar(select(func.count()).select_from(RiskEventArchive))
+        recent = await list_risk_events(session, limit=10)
+        everything = await list_risk_events(
+            session, limit=10, include_archived=True, include_content=True
+        )
+    await engine.dispose()
+    return counts, hot, cold, recent, everything
+
+
+def test_retention_archives_purges_and_respects_rule_order(monkeypatch):
+    monkeypatch.setattr(get_settings(), "content_gc_grace_seconds", 0)
+    counts, hot, cold, recent, everything = asyncio.run(_scenario())
+    assert counts == {"archived": 2, "purged": 1, "content_removed": 1}
+    assert (hot, cold) == (3, 2)
+    assert [event["content"] for event in recent] == [None, None, None]
+    assert len(everything) == 5
+    assert "low message from 30 days ago" in [event["content"] for event in everything]
+
+
+async def _archive_newest_twice():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    rules = [RetentionRule(archive_after_days=1)]
+    ids = []
+    for _ in range(2):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            event = await _event(session, "low", 5)
+            session.add(event)
+            await session.commit()
+            ids.append(event.id)
+        # Archiving the newest row frees the top id; it must not be handed out again.
+        await run_retention(engine=engine, rules=rules, now=NOW)
+    async with AsyncSession(engine) as session:
+        cold = await session.scalar(select(func.count()).select_from(RiskEventArchive))
+    await engine.dispose()
+    return ids, cold
+
+
+def test_archived_ids_are_never_reused():
+    ids, cold = asyncio.run(_archive_newest_twice())
+    assert ids[1] > ids[0]
+    assert cold == 2
+
+
+async def _collect_around_reuse():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        await store_content(session, "orphaned long ago")
+        reused = await store_content(session, "orphaned, then written again")
+        await session.commit()
+        cache_after_commit = session.info.get("stored_content_hashes")
+        await session.execute(update(ContentBlob).values(last_seen=NOW))
+        await session.commit()
+        # A writer deduplicating against an old blob refreshes it before referencing it.
+        await store_content(session, "orphaned, then written again")
+        await session.commit()
+        removed = await _collect_orphaned_content(
+            session, batch_size=10, pause=0, grace_seconds=60
+        )
+        left = (await session.execute(select(ContentBlob.hash))).scalars().all()
+    await engine.dispose()
+    return cache_after_commit, removed, left, reused
+
+
+def test_content_gc_spares_recently_reused_blobs():
+    cache_after_commit, removed, left, reused = asyncio.run(_collect_around_reuse())
+    assert cache_after_commit is None
+    assert removed == 1
+    assert left == [reused]
+
+
+async def _overlapping_runs(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        session.add_all([await _event(session, "low", 30 + index) for index in range(50)])
+        await session.commit()
+
+    rules = [RetentionRule(level="low", archive_after_days=7)]
+    # Two workers' runs share no lock; archiving must still not collide.
+    runs = await asyncio.gather(
+        retention._run_retention(engine, rules, NOW), retention._run_retention(engine, rules, NOW)
+    )
+    async with AsyncSession(engine) as session:
+        cold = await session.scalar(select(func.count()).select_from(RiskEventArchive))
+    await engine.dispose()
+    return runs, cold
+
+
+def test_overlapping_retention_runs_archive_each_event_once(tmp_path):
+    runs, cold = asyncio.run(_overlapping_runs(tmp_path / "shard.db"))
+    assert sum(run["archived"] for run in runs) == 50
+    assert cold == 50
+
+
+def test_retention_route_needs_the_token_and_reports_a_running_job(monkeypatch):
+    scheduled = []
+
+    async def fake_run():
+        scheduled.append(1)
+
+    monkeypatch.setattr(routes_admin, "run_retention", fake_run)
+    monkeypatch.setattr(get_settings(), "admin_token", "s3cret")
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer s3cret"}
+    assert client.post("/api/admin/retention/run").status_code == 401
+    assert client.post("/api/admin/retention/run", headers=headers).json() == {
+        "status": "scheduled"
+    }
+    monkeypatch.setattr(routes_admin, "retention_running", lambda: True)
+    assert client.post("/api/admin/retention/run", headers=headers).json() == {
+        "status": "running"
+    }
+    assert scheduled == [1]
@@ -0,0 +1,137 @@
+"""
+Tests for user shard routing and scatter-gather merging.
+"""
+import asyncio
+import importlib.util
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel
+
+from app.core import database
+from app.core.config import get_settings
+from app.core.database import jump_hash, scatter_gather, shard_for
+from app.main import app
+from app.models.journal import JournalEntry, MoodLog
+from app.services.content import store_content
+from app.services.sync import changes_since
+
+_spec = importlib.util.spec_from_file_location(
+    "rebalance_shards", Path(__file__).resolve().parents[1] / "scripts" / "rebalance_shards.py"
+)
+rebalance_shards = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(rebalance_shards)
+
+
+def test_jump_hash_moves_only_keys_claimed_by_the_new_bucket():
+    users = [f"user-{index}" for index in range(2000)]
+    before = {user: shard_for(user, 4) for user in users}
+    after = {user: shard_for(user, 5) for user in users}
+
+    moved = [user for user in users if before[user] != after[user]]
+    assert all(after[user] == 4 for user in moved)
+    assert 300 < len(moved) < 500  # about 1/5 of users
+    assert jump_hash(12345, 1) == 0
+
+
+def test_scatter_gather_merges_sorted_shard_results():
+    shard_rows = {"a": [9, 6, 1], "b": [8, 7, 2]}
+
+    async def fetch(session):
+        return [{"created_at": value} for value in shard_rows[session]]
+
+    merged = asyncio.run(
+        scatter_gather(
+            ["a", "b"], fetch, key=lambda row: row["created_at"], reverse=True, limit=4
+        )
+    )
+    assert [row["created_at"] for row in merged] == [9, 8, 7, 6]
+
+
+def _users_per_shard(shards):
+    users = {}
+    index = 0
+    while len(users) < shards:
+        users.setdefault(shard_for(f"user-{index}", shards), f"user-{index}")
+        index += 1
+    return [users[shard] for shard in range(shards)]
+
+
+def _shard_engines(tmp_path, shards):
+    engines = [
+        create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/shard{index}.db", poolclass=NullPool)
+        for index in range(shards)
+    ]
+
+    async def create():
+        for engine in engines:
+            async with engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+
+    asyncio.run(create())
+    return engines
+
+
+async def _moods(engine):
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(MoodLog.user_id, MoodLog.mood))
+        return sorted(result.all())
+
+
+def test_body_and_path_keyed_routes_reach_the_users_shard(monkeypatch, tmp_path):
+    engines = _shard_engines(tmp_path, 2)
+    monkeypatch.setattr(database, "engines", engines)
+    first, second = _users_per_shard(2)
+    client = TestClient(app)
+
+    for user_id, mood in ((first, "calm"), (second, "tense")):
+        payload = {"user_id": user_id, "mood": mood, "intensity": 4}
+        assert client.post("/api/journal/mood", json=payload).status_code == 200
+
+    assert asyncio.run(_moods(engines[0])) == [(first, "calm")]
+    assert asyncio.run(_moods(engines[1])) == [(second, "tense")]
+    listed = client.get(f"/api/journal/mood/{second}").json()
+    assert [row["mood"] for row in listed] == ["tense"]
+
+
+async def _move(engines, user_id):
+    async with AsyncSession(engines[0], expire_on_commit=False) as session:
+        digest = await store_content(session, "Moved entry")
+        for title in ("a", "b"):
+            session.add(JournalEntry(user_id=user_id, title=title, content_hash=digest))
+        await session.commit()
+    async with AsyncSession(engines[1], expire_on_commit=False) as session:
+        digest = await store_content(session, "Resident entry")
+        # Holds id 2 on the target, so the second moved entry must be renumbered.
+        for title in ("x", "y"):
+            session.add(JournalEntry(user_id="resident", title=title, content_hash=digest))
+        await session.commit()
+        await session.delete(await session.get(JournalEntry, 1))
+        await session.commit()
+
+    source = AsyncSession(engines[0], expire_on_commit=False)
+    target = AsyncSession(engines[1], expire_on_commit=False)
+    async with source, target:
+        moved = await rebalance_shards.move_user(source, target, user_id)
+        result = await target.execute(
+            select(JournalEntry.id, JournalEntry.title, JournalEntry.updated_at)
+            .where(JournalEntry.user_id == user_id)
+            .order_by(JournalEntry.title)
+        )
+        rows = result.all()
+        delta = await changes_since(target, user_id, None)
+    return moved, rows, delta
+
+
+def test_rebalance_keeps_ids_unless_the_target_holds_them(monkeypatch, tmp_path):
+    monkeypatch.setattr(get_settings(), "sync_settle_seconds", 0)
+    engines = _shard_engines(tmp_path, 2)
+    moved, rows, delta = asyncio.run(_move(engines, "mover"))
+    assert moved["entries"] == 2 and moved["renumbered"] == 1
+    (kept_id, _, kept_updated), (new_id, _, new_updated) = rows
+    assert kept_id == 1  # free on the target, so clients keep referring to it
+    assert new_id == 3 and new_updated > kept_updated  # re-sent by the next delta sync
+    assert delta["deleted"] == {"entries": [2], "moods": []}  # the stale copy is dropped
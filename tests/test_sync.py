@@ -0,0 +1,51 @@
+"""
+Tests for offline batch ingest and delta sync.
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import SQLModel
+
+from app.services.sync import changes_since, decode_sync_token, encode_sync_token, ingest_batch
+
+
+def test_sync_token_round_trip_and_rejects_garbage():
+    cursors = {"entries": (datetime(2024, 5, 1, 12, 30), 42)}
+    assert decode_sync_token(encode_sync_token(cursors)) == cursors
+    assert decode_sync_token(None) == {}
+    for token in ("not base64!", "WyJ4Il0="):
+        with pytest.raises(ValueError):
+            decode_sync_token(token)
+
+
+async def _ingest_twice_then_sync(monkeypatch):
+    from app.core.config import get_settings
+
+    monkeypatch.setattr(get_settings(), "sync_settle_seconds", 0)
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    journals = [
+        {"client_key": "j1", "title": "Night", "content": "Could not sleep again.", "tags": "sleep"},
+        {"client_key": "j1", "title": "Repeat", "content": "Same key twice.", "tags": None},
+    ]
+    moods = [{"client_key": "m1", "mood": "tired", "intensity": 3}]
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        first = await ingest_batch(session, user_id="u1", journals=journals, moods=moods)
+        second = await ingest_batch(session, user_id="u1", journals=journals, moods=moods)
+        delta = await changes_since(session, "u1", None)
+        later = await changes_since(session, "u1", delta["sync_token"])
+    await engine.dispose()
+    return first, second, delta, later
+
+
+def test_batch_ingest_is_idempotent_and_sync_returns_only_changes(monkeypatch):
+    first, second, delta, later = asyncio.run(_ingest_twice_then_sync(monkeypatch))
+    assert first["duplicates"] == [] and second["duplicates"] == ["j1", "m1"]
+    assert [entry["title"] for entry in second["entries"]] == ["Night"]
+    assert second["entries"][0]["id"] == first["entries"][0]["id"]
+    assert len(delta["entries"]) == 1 and len(delta["moods"]) == 1
+    assert later["entries"] == [] and later["moods"] == []
+    assert later["deleted"] == {"entries": [], "moods": []}
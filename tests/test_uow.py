@@ -0,0 +1,51 @@
+"""
+Tests for the unit-of-work write batching.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import SQLModel
+
+from app.models.journal import JournalEntry
+from app.models.risk import RiskEvent
+from app.services.alerts import log_risk_event
+from app.services.journal import create_journal_entry
+from app.services.risk import RiskAssessment
+from app.services.uow import UnitOfWork
+
+
+ASSESSMENT = RiskAssessment(sentiment=-0.5, keyword_hits=[], score=0.3, level="low")
+
+
+async def _run(stage_writes):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        try:
+            await stage_writes(session)
+        except RuntimeError:
+            pass
+    async with AsyncSession(engine) as session:
+        entries = await session.scalar(select(func.count()).select_from(JournalEntry))
+        events = await session.scalar(select(func.count()).select_from(RiskEvent))
+    await engine.dispose()
+    return entries, events
+
+
+async def _stage(session, fail=False):
+    async with UnitOfWork(session):
+        entry = await create_journal_entry(
+            session, user_id="u1", title="t", content="c", tags="sleep", risk_score=0.3
+        )
+        assert entry.id is not None
+        await log_risk_event(session, user_id="u1", source="journal", content="c", assessment=ASSESSMENT)
+        if fail:
+            raise RuntimeError("crash between writes")
+
+
+@pytest.mark.parametrize("fail, expected", [(False, (1, 1)), (True, (0, 0))])
+def test_unit_of_work_commits_all_or_nothing(fail, expected):
+    assert asyncio.run(_run(lambda session: _stage(session, fail=fail))) == expected